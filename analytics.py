@@ -0,0 +1,225 @@
+# /analytics.py
+
+import json
+import os
+import time
+
+import numpy as np
+
+import history
+from logger import LOG_DIR
+
+# Aggregates of the history processed so far, so that an update only reads the records appended since
+ANALYTICS_CACHE_PATH = os.path.join(LOG_DIR, "analytics.json")
+# Gaps between two samples longer than this (seconds) are time the monitor wasn't running, they don't count towards times & rates
+MAX_SAMPLE_GAP = 5 * 60
+# Depth of discharge histogram bins (percentage points)
+DOD_BINS = tuple(range(0, 101, 10))
+# Records viewed & aggregated at a time, bounds the memory used on multi-year histories (~32 MB of records)
+ANALYTICS_CHUNK_RECORDS = 4 * 1024 * 1024
+# The history file's record (see history.RECORD) as a NumPy dtype, so the mapped file is viewed without decoding it in Python
+RECORD_DTYPE = np.dtype([("timestamp", "<u4"), ("level", "<u2"), ("rate", "<i2")])
+LEVEL_MASK = ~history.PLUGGED_FLAG & 0xFFFF
+
+def local_utc_offset(now=None):
+    """ Returns the current offset of local time from UTC in seconds, used to bucket samples by hour of day """
+    return time.localtime(now).tm_gmtoff
+
+class WearAnalytics:
+    """ Running aggregates of the battery history: equivalent full cycles, depth of discharge histogram, time spent at or above the
+        higher threshold & average charge/discharge rates by hour of day. update() takes the records appended since the last call """
+
+    def __init__(self, higher_threshold=80, utc_offset=None):
+        self.higher_threshold = higher_threshold
+        # Hours of day use one offset for the whole history, samples from the other side of a DST change land an hour off
+        self.utc_offset = local_utc_offset() if utc_offset is None else utc_offset
+        self.records = 0 # History records aggregated so far
+        self.last = None # (timestamp, tenths of a percent, plugged) of the last record, the next update's intervals start there
+        self.discharged = 0 # Tenths of a percent
+        self.charged = 0
+        self.dod_counts = np.zeros(len(DOD_BINS) - 1, dtype=np.int64)
+        self.open_discharge = None # [highest, lowest] level (tenths) of the discharge still going on
+        self.seconds_observed = 0
+        self.seconds_above = 0
+        self.seconds_above_plugged = 0
+        self.hour_change = np.zeros((2, 24)) # [unplugged, plugged] x hour of day: level change (tenths) & seconds of the intervals
+        self.hour_seconds = np.zeros((2, 24))
+
+    def update(self, records):
+        """ Aggregates a chunk of RECORD_DTYPE records, which must follow the previous chunk in the file """
+        if not len(records):
+            return self
+        timestamps = records["timestamp"]
+        levels = records["level"]
+        tenths = levels & LEVEL_MASK
+        plugged = levels >= history.PLUGGED_FLAG
+        first = (int(timestamps[0]), int(tenths[0]), bool(plugged[0]))
+        if self.last is not None:
+            self._add_interval(self.last, first) # The interval joining the chunk to the previous one
+        changes = np.abs(np.diff(tenths.view(np.int16))).sum()
+        net = int(tenths[-1]) - first[1]
+        # Rises & falls add up to the absolute changes & differ by the net change
+        self.charged += int(changes + net) // 2
+        self.discharged += int(changes - net) // 2
+        self._add_segments(timestamps, tenths, plugged)
+        self._add_discharges(tenths, plugged)
+        self.records += len(records)
+        self.last = (int(timestamps[-1]), int(tenths[-1]), bool(plugged[-1]))
+        return self
+
+    def _add_interval(self, start, end):
+        """ Adds the interval between two (timestamp, tenths, plugged) samples """
+        change = end[1] - start[1]
+        if change > 0:
+            self.charged += change
+        else:
+            self.discharged -= change
+        duration = end[0] - start[0]
+        if 0 < duration <= MAX_SAMPLE_GAP:
+            self.seconds_observed += duration
+            if start[1] >= self.higher_threshold * 10:
+                self.seconds_above += duration
+                self.seconds_above_plugged += duration if start[2] else 0
+            hour = (start[0] + self.utc_offset) // 3600 % 24
+            self.hour_change[int(start[2]), hour] += change
+            self.hour_seconds[int(start[2]), hour] += duration
+
+    def _add_segments(self, timestamps, tenths, plugged):
+        """ Times & hourly rates of the intervals between consecutive samples. The intervals are cut into segments at every hour,
+            plug change, threshold crossing & gap, so a segment's duration & level change are just its last minus its first sample """
+        count = len(timestamps)
+        if count < 2:
+            return
+        durations = np.diff(timestamps) # A clock set back wraps around & shows up as a gap
+        gaps = np.flatnonzero(durations > MAX_SAMPLE_GAP)
+        backwards = gaps[durations[gaps] >= 2 ** 31]
+        if len(backwards):
+            # Hours are found by binary search, which needs the timestamps in order
+            for piece in np.split(np.arange(count), backwards + 1):
+                self._add_segments(timestamps[piece[0]:piece[-1] + 1], tenths[piece[0]:piece[-1] + 1], plugged[piece[0]:piece[-1] + 1])
+            return
+        above = tenths >= self.higher_threshold * 10
+        first_hour = (int(timestamps[0]) + self.utc_offset) // 3600 + 1
+        last_hour = (int(timestamps[-1]) + self.utc_offset) // 3600
+        hour_starts = np.searchsorted(timestamps, (np.arange(first_hour, last_hour + 1) * 3600 - self.utc_offset).astype(timestamps.dtype))
+        bounds = np.unique(np.concatenate((
+            [0, count - 1], hour_starts, gaps, gaps + 1,
+            np.flatnonzero(plugged[1:] != plugged[:-1]) + 1, np.flatnonzero(above[1:] != above[:-1]) + 1,
+        )))
+        starts, ends = bounds[:-1], bounds[1:]
+        kept = ~np.isin(starts, gaps) # A gap is a segment of its own
+        starts, ends = starts[kept], ends[kept]
+        seconds = timestamps[ends].astype(np.int64) - timestamps[starts]
+        changes = tenths[ends].astype(np.int64) - tenths[starts]
+        segment_plugged, segment_above = plugged[starts], above[starts]
+        self.seconds_observed += int(seconds.sum())
+        self.seconds_above += int(seconds[segment_above].sum())
+        self.seconds_above_plugged += int(seconds[segment_above & segment_plugged].sum())
+        buckets = segment_plugged * 24 + (timestamps[starts].astype(np.int64) + self.utc_offset) // 3600 % 24
+        self.hour_change += np.bincount(buckets, weights=changes, minlength=48).reshape(2, 24)
+        self.hour_seconds += np.bincount(buckets, weights=seconds, minlength=48).reshape(2, 24)
+
+    def _add_discharges(self, tenths, plugged):
+        """ Depth (highest - lowest level) of every discharge, i.e. run of unplugged samples, that ended in the chunk """
+        starts = np.concatenate(([0], np.flatnonzero(plugged[1:] != plugged[:-1]) + 1))
+        highest = np.maximum.reduceat(tenths, starts).astype(np.int64)
+        lowest = np.minimum.reduceat(tenths, starts).astype(np.int64)
+        discharging = ~plugged[starts]
+        depths = []
+        if self.open_discharge is not None:
+            if discharging[0]:
+                # The discharge of the previous chunk goes on
+                highest[0] = max(highest[0], self.open_discharge[0])
+                lowest[0] = min(lowest[0], self.open_discharge[1])
+            else:
+                depths.append(self.open_discharge[0] - self.open_discharge[1])
+        # The last run may go on in the next chunk
+        self.open_discharge = [int(highest[-1]), int(lowest[-1])] if discharging[-1] else None
+        discharging[-1] = False
+        depths = np.concatenate((depths, (highest - lowest)[discharging]))
+        depths = depths[depths > 0] / 10 # Charger flapping without any level change isn't a discharge
+        self.dod_counts += np.histogram(depths, bins=DOD_BINS)[0]
+
+    def summary(self):
+        """ Returns the aggregates as plain numbers (rates in percent per hour, None for hours without samples) """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rates = self.hour_change / self.hour_seconds * 3600 / 10
+        discharge, charge = [[None if np.isnan(rate) else float(rate) for rate in row] for row in (-rates[0], rates[1])]
+        return {
+            "samples": self.records,
+            "equivalent_full_cycles": self.discharged / 1000,
+            "charge_throughput_cycles": self.charged / 1000,
+            "depth_of_discharge": {"bins": list(DOD_BINS), "counts": self.dod_counts.tolist()},
+            "current_discharge_depth": (self.open_discharge[0] - self.open_discharge[1]) / 10 if self.open_discharge else None,
+            "higher_threshold": self.higher_threshold,
+            "hours_observed": self.seconds_observed / 3600,
+            "hours_above_higher": self.seconds_above / 3600,
+            "hours_above_higher_plugged": self.seconds_above_plugged / 3600,
+            "share_above_higher": self.seconds_above / self.seconds_observed if self.seconds_observed else None,
+            "discharge_rate_by_hour": discharge,
+            "charge_rate_by_hour": charge,
+        }
+
+    def to_dict(self):
+        return {
+            "higher_threshold": self.higher_threshold, "utc_offset": self.utc_offset, "records": self.records, "last": self.last,
+            "discharged": self.discharged, "charged": self.charged, "dod_counts": self.dod_counts.tolist(),
+            "open_discharge": self.open_discharge, "seconds_observed": self.seconds_observed, "seconds_above": self.seconds_above,
+            "seconds_above_plugged": self.seconds_above_plugged, "hour_change": self.hour_change.tolist(),
+            "hour_seconds": self.hour_seconds.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        analytics = cls(state["higher_threshold"], state["utc_offset"])
+        analytics.records = state["records"]
+        analytics.last = tuple(state["last"]) if state["last"] else None
+        analytics.discharged, analytics.charged = state["discharged"], state["charged"]
+        analytics.dod_counts = np.array(state["dod_counts"], dtype=np.int64)
+        analytics.open_discharge = state["open_discharge"]
+        analytics.seconds_observed, analytics.seconds_above = state["seconds_observed"], state["seconds_above"]
+        analytics.seconds_above_plugged = state["seconds_above_plugged"]
+        analytics.hour_change, analytics.hour_seconds = np.array(state["hour_change"]), np.array(state["hour_seconds"])
+        return analytics
+
+def _load_cached(cache_path, mapped, higher_threshold, utc_offset):
+    """ Returns the cached aggregates if they were computed with the same settings from the start of this history file """
+    try:
+        with open(cache_path, 'r') as cache_file:
+            analytics = WearAnalytics.from_dict(json.load(cache_file))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if analytics.higher_threshold != higher_threshold or analytics.utc_offset != utc_offset:
+        return None
+    count = 0 if mapped is None else len(mapped) // history.RECORD_SIZE
+    if analytics.records > count:
+        return None # The history was truncated or replaced
+    if analytics.records and history.decode(mapped, (analytics.records - 1) * history.RECORD_SIZE).timestamp != analytics.last[0]:
+        return None
+    return analytics
+
+def update_analytics(history_path=history.HISTORY_PATH, higher_threshold=80, cache_path=ANALYTICS_CACHE_PATH, utc_offset=None):
+    """ Returns the wear analytics of the history file, only aggregating the records appended since the cached aggregates """
+    utc_offset = local_utc_offset() if utc_offset is None else utc_offset
+    mapped = history.HistoryLog(history_path)._map()
+    try:
+        analytics = _load_cached(cache_path, mapped, higher_threshold, utc_offset) if cache_path else None
+        if analytics is None:
+            analytics = WearAnalytics(higher_threshold, utc_offset)
+        count = 0 if mapped is None else len(mapped) // history.RECORD_SIZE
+        if count == analytics.records:
+            return analytics
+        for first in range(analytics.records, count, ANALYTICS_CHUNK_RECORDS):
+            chunk = np.frombuffer(mapped, RECORD_DTYPE, min(ANALYTICS_CHUNK_RECORDS, count - first), first * history.RECORD_SIZE)
+            analytics.update(chunk)
+            del chunk # The map can't be closed while a view of it exists
+    finally:
+        if mapped is not None:
+            mapped.close()
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as cache_file:
+            json.dump(analytics.to_dict(), cache_file)
+        os.replace(temporary_path, cache_path)
+    return analytics
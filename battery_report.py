@@ -0,0 +1,211 @@
+# /battery_report.py
+
+import hashlib
+import json
+import os
+import re
+import sys
+from html.parser import HTMLParser
+
+import sensors
+from logger import LOG_DIR
+
+# Parsed reports, one JSON file per report content hash
+REPORT_CACHE_DIR = os.path.join(LOG_DIR, "report_cache")
+# Parsed reports kept in the cache directory, the oldest are removed first
+REPORT_CACHE_ENTRIES = 8
+# Seconds a generated powercfg report is reused before a new one is generated
+REPORT_MAX_AGE = 10 * 60
+# Bytes read & fed to the parser at a time
+REPORT_CHUNK_SIZE = 64 * 1024
+# Labels of the installed batteries table -> battery fields
+BATTERY_LABELS = {
+    "NAME": "name",
+    "MANUFACTURER": "manufacturer",
+    "SERIAL NUMBER": "serial_number",
+    "CHEMISTRY": "chemistry",
+    "DESIGN CAPACITY": "design_capacity",
+    "FULL CHARGE CAPACITY": "full_charge_capacity",
+    "CYCLE COUNT": "cycle_count",
+}
+
+def _number(text):
+    """ Returns the integer in a report cell such as '41,998 mWh', or None for '-' & empty cells """
+    digits = re.sub(r"[^0-9]", "", text)
+    return int(digits) if digits else None
+
+class ReportParser(HTMLParser):
+    """ Collects the tables of a powercfg battery report row by row as the HTML is fed in, without building a document tree """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.section = None # Lower-case text of the last <h2>
+        self.tables = {} # section -> {"headers": [...], "rows": [[...], ...]}
+        self._heading = None
+        self._row = None
+        self._cell = None
+        self._in_head = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "h2":
+            self._heading = []
+        elif tag == "thead":
+            self._in_head = True
+        elif tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == "h2" and self._heading is not None:
+            self.section = " ".join("".join(self._heading).split()).lower()
+            self._heading = None
+        elif tag == "thead":
+            self._in_head = False
+        elif tag in ("td", "th") and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._row and self.section is not None:
+                table = self.tables.setdefault(self.section, {"headers": [], "rows": []})
+                if self._in_head:
+                    table["headers"] = self._row
+                else:
+                    table["rows"].append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        elif self._heading is not None:
+            self._heading.append(data)
+
+def _batteries(table):
+    """ Turns the label/value rows of the installed batteries table (one value column per battery) into battery dicts """
+    if table is None:
+        return []
+    count = max((len(row) - 1 for row in table["rows"]), default=0)
+    batteries = [{"unit": "mWh"} for _ in range(count)]
+    for row in table["rows"]:
+        field = BATTERY_LABELS.get(row[0].upper())
+        if field is None:
+            continue
+        for battery, value in zip(batteries, row[1:]):
+            battery[field] = _number(value) if field in ("design_capacity", "full_charge_capacity", "cycle_count") else value
+    return batteries
+
+def _capacity_history(table):
+    """ Returns the (period, full charge capacity, design capacity) rows of the capacity history table """
+    if table is None:
+        return []
+    return [{"period": row[0], "full_charge_capacity": _number(row[1]), "design_capacity": _number(row[2]), "unit": "mWh"}
+            for row in table["rows"] if len(row) >= 3]
+
+def parse_report(path, chunk_size=REPORT_CHUNK_SIZE):
+    """ Stream-parses a powercfg battery report into batteries, capacity history & the remaining tables """
+    parser = ReportParser()
+    with open(path, 'r', encoding='utf-8', errors='replace') as report_file:
+        while True:
+            chunk = report_file.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+    tables = parser.tables
+    return {
+        "source": "powercfg",
+        "batteries": _batteries(tables.pop("installed batteries", None)),
+        "capacity_history": _capacity_history(tables.pop("battery capacity history", None)),
+        "tables": tables,
+    }
+
+def _file_digest(path, chunk_size=REPORT_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as report_file:
+        for chunk in iter(lambda: report_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _prune_cache(cache_dir, keep):
+    entries = sorted((entry for entry in os.scandir(cache_dir) if entry.name.endswith(".json")), key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:max(0, len(entries) - keep)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+# Report path -> ((mtime_ns, size), parsed report), skips even the hashing while the file is unchanged
+_memory_cache = {}
+
+def load_report(path, cache_dir=REPORT_CACHE_DIR):
+    """ Returns the parsed report, from the cache when a report with the same content was parsed before (don't modify it) """
+    status = os.stat(path)
+    stamp = (status.st_mtime_ns, status.st_size)
+    cached = _memory_cache.get(os.path.abspath(path))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    cache_path = os.path.join(cache_dir, _file_digest(path) + ".json")
+    try:
+        with open(cache_path, 'r') as cache_file:
+            report = json.load(cache_file)
+    except (OSError, ValueError):
+        report = parse_report(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as cache_file:
+            json.dump(report, cache_file)
+        os.replace(temporary_path, cache_path)
+        _prune_cache(cache_dir, REPORT_CACHE_ENTRIES)
+    _memory_cache[os.path.abspath(path)] = (stamp, report)
+    return report
+
+def read_sysfs_health(root=sensors.SYSFS_POWER_SUPPLY):
+    """ Returns the batteries' design & full charge capacity and cycle count from /sys/class/power_supply (Linux) """
+    batteries = []
+    try:
+        supplies = sorted(os.listdir(root))
+    except OSError:
+        return {"source": "sysfs", "batteries": [], "capacity_history": [], "tables": {}}
+    for name in supplies:
+        supply_path = os.path.join(root, name)
+        if sensors._read_text(os.path.join(supply_path, "type")) != "Battery":
+            continue
+        # Energy in µWh, or charge in µAh on batteries that don't report energy
+        for prefix, unit in (("energy", "mWh"), ("charge", "mAh")):
+            design = sensors._read_text(os.path.join(supply_path, f"{prefix}_full_design"))
+            full = sensors._read_text(os.path.join(supply_path, f"{prefix}_full"))
+            if design is not None or full is not None:
+                break
+        cycle_count = sensors._read_text(os.path.join(supply_path, "cycle_count"))
+        batteries.append({
+            "name": sensors._read_text(os.path.join(supply_path, "model_name")) or name,
+            "manufacturer": sensors._read_text(os.path.join(supply_path, "manufacturer")),
+            "serial_number": sensors._read_text(os.path.join(supply_path, "serial_number")),
+            "chemistry": sensors._read_text(os.path.join(supply_path, "technology")),
+            "design_capacity": int(design) // 1000 if design and design.isdigit() else None,
+            "full_charge_capacity": int(full) // 1000 if full and full.isdigit() else None,
+            "cycle_count": int(cycle_count) if cycle_count and cycle_count.isdigit() and int(cycle_count) > 0 else None, # 0 means unknown
+            "unit": unit,
+        })
+    return {"source": "sysfs", "batteries": batteries, "capacity_history": [], "tables": {}}
+
+def health(battery):
+    """ Returns the full charge capacity as a percentage of the design capacity, or None if either is unknown """
+    if not battery.get("design_capacity") or battery.get("full_charge_capacity") is None:
+        return None
+    return battery["full_charge_capacity"] / battery["design_capacity"] * 100
+
+def get_health_report(report_path=None):
+    """ Returns the structured health report: a freshly generated powercfg report on Windows, sysfs elsewhere """
+    if sys.platform != "win32":
+        return read_sysfs_health()
+    import power_plan
+    import time
+    report_path = report_path or os.path.abspath(os.path.join(LOG_DIR, "battery_report.html"))
+    try:
+        fresh = time.time() - os.path.getmtime(report_path) < REPORT_MAX_AGE
+    except OSError:
+        fresh = False
+    if not fresh:
+        power_plan.get_manager().generate_report(report_path)
+    return load_report(report_path)
@@ -1,121 +1,291 @@
 # /battery_utility.py
 
-import psutil
+import dialogs
+import history as battery_history
+import journal
+import math
+import metrics
 import notification
-import settings
+import predictor
+import rules
+import sensors
+import config_store
 import threading
 import subprocess
-import wmi
-from tkinter import messagebox
+import time
 
 from logger import log_error
 
 # Brightness level at low battery or battery saving mode 
 LOWER_BRIGHTNESS_VALUE = 30
-# Power scheme GUIDs
-BALANCED_GUID = "a1841308-3541-4fab-bc81-f71556f20b4a"
-POWER_SAVER_GUID = "381b4222-f694-41f0-9685-ff5bb260df2e"
-
-def monitor_battery_events():
-    """ Monitors battery events such as plug in or plug out charging """
-    last_power_plugged = None
-    last_notification = None
-    while True:
+# Bounds on the delay between two battery checks (seconds), MAX_POLL_INTERVAL is also the worst-case plug detection latency
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 30
+# Fastest charge/discharge rate assumed when scheduling checks (% per second, i.e. 2% per minute)
+ASSUMED_RATE = 2 / 60
+# Minutes ahead of a predicted threshold crossing at which the user is warned
+PROACTIVE_ALERT_MINUTES = 15
+
+# Set to stop monitor_battery_events, also used to sleep between checks
+_stop_event = threading.Event()
+
+class BatteryMonitor:
+    """ Keeps the battery state between checks & notifies on plug changes or threshold crossings """
+
+    def __init__(self, sensor=None, clock=time.time, history=None):
+        self.sensor = sensor or sensors.get_sensor()
+        self.clock = clock
+        self.history = history or battery_history.BatteryHistory()
+        self.last_power_plugged = None
+        self.last_percentage = None
+        self.last_check = None
+        self.last_notification = None
+        self.rate_estimator = predictor.RateEstimator()
+        self.forecast_sent = False # Whether the upcoming threshold crossing was already announced
+        self.checks = 0
+        self.rule_set = None
+        self.last_config = None # Config of the last check, with the battery saver state it left behind
+        self._rules_source = None # (rules entry, lower, higher) of the config the rules were compiled from
+
+    def compile_rules(self, config):
+        """ Returns the rules of the config, only recompiled (keeping their fired state) when the rules or thresholds change """
+        source = (config.get("rules"), config['lower_threshold'], config['higher_threshold'])
+        previous = self._rules_source
+        # The cached config hands out the same rules list until the file changes, so the identity check is enough on most ticks
+        if previous is None or source[1:] != previous[1:] or (source[0] is not previous[0] and source[0] != previous[0]):
+            try:
+                self.rule_set = rules.compile_rules(config, self.rule_set)
+            except ValueError as e:
+                log_error(f"Invalid rules in the config, using the thresholds instead: {e}", "battery_utility.py")
+                self.rule_set = rules.RuleSet(rules.default_rules(source[1], source[2]), self.rule_set)
+            self._rules_source = source
+        return self.rule_set
+
+    def check_forecast(self, percentage, power_plugged, threshold):
+        """ Warns once per charge/discharge when the next rule's level is predicted within PROACTIVE_ALERT_MINUTES """
+        seconds = None if threshold is None else self.rate_estimator.seconds_until(threshold)
+        if self.forecast_sent or seconds is None:
+            return
+        minutes = round(seconds / 60)
+        if 0 < minutes <= PROACTIVE_ALERT_MINUTES:
+            if power_plugged:
+                self.notify(f"Battery will be charged to {threshold}% in ~{minutes} min.", "forecast")
+            else:
+                self.notify(f"Battery will hit {threshold}% in ~{minutes} min.", "forecast")
+            self.forecast_sent = True
+
+    def status(self):
+        """ Returns the state of the last check """
+        return {
+            "percent": self.last_percentage,
+            "power_plugged": self.last_power_plugged,
+            "last_notification": self.last_notification,
+            "last_check": self.last_check,
+            "rate": self.rate_estimator.rate,
+            "checks": self.checks,
+        }
+
+    # Side effects of a check, overridden to capture them when replaying traces
+    def load_config(self):
+        return config_store.load_config()
+
+    def notify(self, message, kind):
+        notification.notification_message(message, kind=kind)
+
+    def record_event(self, kind, **fields):
+        journal.record(kind, **fields)
+
+    def enter_saver(self):
+        """ Enters battery saver, reporting the outcome as a notification (a message box would block the check until dismissed) """
+        try:
+            message = enter_battery_saver()
+            self.last_config = dict(self.last_config or {}, battery_saver_on=True)
+        except Exception as e:
+            log_error(f"Failed to activate Battery Saver: {e}", "battery_utility.py")
+            message = "Failed to activate Battery Saver."
+        self.notify(message, "saver")
+
+    def dim(self, level):
+        current_brightness = get_brightness()
+        if current_brightness is None or current_brightness > level:
+            set_brightness(level)
+
+    def fire(self, rule, percentage):
+        """ Runs the actions of a rule the level just entered """
+        bound = rule.low if math.isinf(rule.high) else rule.high
+        self.record_event(journal.THRESHOLD_CROSSED, threshold=rule.name, value=bound, percent=percentage)
+        for action in rule.actions:
+            if action == "notify":
+                self.notify(rule.message.format(percent=percentage), "threshold")
+            elif action == "saver":
+                self.enter_saver()
+            elif action == "dim":
+                self.dim(LOWER_BRIGHTNESS_VALUE if rule.brightness is None else rule.brightness)
+        self.last_notification = rule.name
+
+    def check(self):
+        """ Runs a single battery check & returns the seconds to wait before the next one (None to stop) """
+        self.checks += 1
+        if (self.checks - 1) % metrics.METRICS_SAMPLE_EVERY:
+            return self._check()
+        start = time.perf_counter()
+        try:
+            return self._check(start)
+        finally:
+            metrics.TICK_SECONDS.observe(time.perf_counter() - start)
+
+    def _check(self, start=None):
+        """ The check itself, timing its phases when given the start of a sampled check """
         try:
-            config = settings.load_config()
-            lower_threshold, higher_threshold = config['lower_threshold'], config['higher_threshold']
-            battery = psutil.sensors_battery()
+            config = self.last_config = self.load_config()
+            if start is not None:
+                loaded = time.perf_counter()
+                metrics.CONFIG_LOAD_SECONDS.observe(loaded - start)
+            battery = self.sensor.read()
+            if start is not None:
+                metrics.SENSOR_READ_SECONDS.observe(time.perf_counter() - loaded)
+            rule_set = self.compile_rules(config)
             if battery is None:
-                log_error("Cannot access battery information.")
-                break
+                log_error("Cannot access battery information.", "battery_utility.py")
+                return None
+            now = self.clock()
             percentage, power_plugged = battery.percent, battery.power_plugged
+            self.last_percentage, self.last_check = percentage, now
             # Detect a change in power plugged state (plugged in or unplugged)
-            if last_power_plugged is None or power_plugged != last_power_plugged:
+            if self.last_power_plugged is None or power_plugged != self.last_power_plugged:
                 if power_plugged:
-                    notification.notification_message("Charging cable plugged in.")
+                    self.record_event(journal.PLUG, percent=percentage)
+                    self.notify("Charging cable plugged in.", "plug")
                 else:
-                    notification.notification_message("Charging cable unplugged.")
-                last_power_plugged = power_plugged
-            # Check thresholds
-            if power_plugged and percentage >= higher_threshold:
-                if last_notification != "unplug":
-                    notification.notification_message(f"Battery is charged to {percentage}%. Please unplug the charger.")
-                    last_notification = "unplug"
-            elif not power_plugged and percentage <= lower_threshold:
-                if last_notification != "plug_in":
-                    activate_battery_saver()
-                    notification.notification_message(f"Battery is at {percentage}%. Consider plugging in.")
-                    last_notification = "plug_in"
+                    self.record_event(journal.UNPLUG, percent=percentage)
+                    self.notify("Charging cable unplugged.", "unplug")
+                self.last_power_plugged = power_plugged
+                self.rate_estimator.reset()
+                self.forecast_sent = False
+            self.rate_estimator.update(now, percentage)
+            # Fire the rules whose band the level just entered, the others are re-armed once the level has left their band
+            matching, firing = rule_set.evaluate(percentage, power_plugged)
+            for rule in firing:
+                self.fire(rule, percentage)
+            if self.last_notification is not None and not rule_set.is_fired(self.last_notification):
+                self.last_notification = None
+            target = rule_set.next_level(percentage, power_plugged)
+            if not matching:
+                self.check_forecast(percentage, power_plugged, target)
+            rate = battery.rate or self.rate_estimator.rate
+            self.history.record(now, percentage, power_plugged, rate)
+            return next_poll_interval(percentage, target, rate)
         except Exception as e:
-            log_error(f"Error in monitor_battery_events: {e}")
-        threading.Event().wait(1) # Wait for a second before checking again
+            log_error(f"Error in monitor_battery_events: {e}", "battery_utility.py")
+        return MIN_POLL_INTERVAL
+
+def next_poll_interval(percentage, target, rate=None):
+    """ Returns the seconds until the next check based on the distance to the next rule level the battery can reach (None if there is none) """
+    if target is None:
+        # Every level ahead was already crossed, only a plug change can trigger a notification now
+        return MAX_POLL_INTERVAL
+    distance = abs(target - percentage)
+    # Never assume a slower rate than ASSUMED_RATE so an unknown or stale rate can't delay an alert
+    speed = max(abs(rate), ASSUMED_RATE) if rate else ASSUMED_RATE
+    # Wake up half way to the predicted crossing, so the wait shrinks as the threshold approaches
+    return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, distance / speed / 2))
+
+def monitor_battery_events(stop_event=_stop_event, monitor=None, status=None, telemetry=None):
+    """ Monitors battery events such as plug in or plug out charging, publishing each check to the status segment writer
+        & the telemetry agent if given """
+    monitor = monitor or BatteryMonitor()
+    while not stop_event.is_set():
+        delay = monitor.check()
+        if status is not None or telemetry is not None:
+            try:
+                config = monitor.last_config or {} # The check's own config, not a second load per tick
+                if status is not None:
+                    status.publish_monitor(monitor, delay, saver_on=config.get("battery_saver_on"))
+                if telemetry is not None:
+                    telemetry.record_monitor(monitor, config)
+            except Exception as e:
+                log_error(f"Failed to publish the monitor status: {e}", "battery_utility.py")
+        if delay is None:
+            break
+        stop_event.wait(delay) # Sleep until the next check is due
+
+def stop_monitor():
+    """ Makes monitor_battery_events return after its current check """
+    _stop_event.set()
 
 def get_brightness():
     """ Returns the current screen brightness level (0-100) """
+    import brightness
     try:
-        wmi_service = wmi.WMI(namespace='wmi')
-        brightness_methods = wmi_service.WmiMonitorBrightness()[0]
-        return brightness_methods.CurrentBrightness
+        return brightness.get_controller().get()
     except Exception as e:
-        messagebox.showerror("Error", f"Failed to get brightness: {e}")
+        log_error(f"Failed to get brightness: {e}", "battery_utility.py")
     return None
 
 def set_brightness(level):
     """ Adjusts screen brightness to the given level (0-100) """
+    import brightness
     try:
-        wmi_service = wmi.WMI(namespace='wmi')
-        brightness_methods = wmi_service.WmiMonitorBrightnessMethods()[0]
-        brightness_methods.WmiSetBrightness(level, 0)
+        brightness.get_controller().set(level)
     except Exception as e:
-        messagebox.showerror("Error", f"Failed to adjust brightness: {e}")
+        log_error(f"Failed to adjust brightness: {e}", "battery_utility.py")
 
 def get_active_power_scheme():
     """ Returns the GUID of the currently Active power scheme """
+    import power_plan
     try:
-        result = subprocess.run("powercfg /getactivescheme", shell=True, capture_output=True, text=True, check=True)
-        active_scheme = result.stdout.split(":")[1].strip().split()[0]
-        return active_scheme
+        return power_plan.get_manager().active_scheme()
     except subprocess.CalledProcessError as e:
-        messagebox.showerror("Error", f"Failed to retrieve active power scheme: {e}\n{e.stderr}")
+        dialogs.show_error("Error", f"Failed to retrieve active power scheme: {e}\n{e.stderr}")
     return None
 
+def enter_battery_saver():
+    """ Switches to the Power Saver plan & dims the screen, persisting the new state in one config write """
+    import power_plan
+    plans = power_plan.get_manager()
+    if plans.is_saver_active():
+        return "Battery Saver is already active."
+    current_brightness = get_brightness()
+    plans.set_active(power_plan.POWER_SAVER_GUID)
+    updates = {"battery_saver_on": True}
+    if current_brightness is not None and current_brightness > LOWER_BRIGHTNESS_VALUE:
+        updates["current_brightness"] = current_brightness
+        set_brightness(LOWER_BRIGHTNESS_VALUE)
+    config_store.update_config(updates)
+    journal.record(journal.SAVER_TOGGLED, on=True)
+    return "Battery Saver mode activated successfully."
+
+def leave_battery_saver():
+    """ Switches back to the Balanced plan & restores the saved brightness, persisting the new state in one config write """
+    import power_plan
+    plans = power_plan.get_manager()
+    if plans.active_scheme() == power_plan.BALANCED_GUID:
+        return "Balanced plan is already active."
+    plans.set_active(power_plan.BALANCED_GUID)
+    current_brightness = config_store.load_config().get('current_brightness')
+    if current_brightness is not None:
+        set_brightness(current_brightness)
+    config_store.update_config({"battery_saver_on": False})
+    journal.record(journal.SAVER_TOGGLED, on=False)
+    return "Battery Saver mode deactivated, Balanced plan activated."
+
 def activate_battery_saver():
-    """ Activates battery saver mode by switching to Power Saver plan """
+    """ Activates battery saver mode by switching to Power Saver plan, showing the outcome in a message box (GUI only) """
     try:
-        active_scheme = get_active_power_scheme()
-        if active_scheme == POWER_SAVER_GUID:
-            messagebox.showinfo("Battery Saver", "Battery Saver is already active.")
-            return
-        current_brightness = get_brightness()
-        if current_brightness > LOWER_BRIGHTNESS_VALUE:
-            config = settings.load_config()
-            config['current_brightness'] = current_brightness
-            settings.save_config(config)
-            set_brightness(LOWER_BRIGHTNESS_VALUE)
-
-        subprocess.run(f"powercfg.exe /setactive {POWER_SAVER_GUID}", shell=True, check=True, capture_output=True, text=True)
-        messagebox.showinfo("Battery Saver", "Battery Saver mode activated successfully.")
+        dialogs.show_info("Battery Saver", enter_battery_saver())
     except subprocess.CalledProcessError as e:
-        messagebox.showerror("Error", f"Failed to activate Battery Saver: {e}\n{e.stderr}")
+        dialogs.show_error("Error", f"Failed to activate Battery Saver: {e}\n{e.stderr}")
     except Exception as e:
-        messagebox.showerror("Error", f"Failed to save brightness level: {e}")
+        dialogs.show_error("Error", f"Failed to activate Battery Saver: {e}")
 
 def deactivate_battery_saver():
-    """ Deactivates battery saver mode by switching to Balanced plan """
+    """ Deactivates battery saver mode by switching to Balanced plan, showing the outcome in a message box (GUI only) """
     try:
-        active_scheme = get_active_power_scheme()
-        if active_scheme == BALANCED_GUID:
-            messagebox.showinfo("Battery Saver", "Balanced plan is already active.")
-            return
-        subprocess.run(f"powercfg.exe /setactive {BALANCED_GUID}", shell=True, check=True, capture_output=True, text=True)
-        config = settings.load_config()
-        current_brightness = config.get('current_brightness')
-        set_brightness(current_brightness)
-        messagebox.showinfo("Battery Saver", "Battery Saver mode deactivated, Balanced plan activated.")
+        dialogs.show_info("Battery Saver", leave_battery_saver())
     except subprocess.CalledProcessError as e:
-        messagebox.showerror("Error", f"Failed to deactivate Battery Saver: {e}\n{e.stderr}")
+        dialogs.show_error("Error", f"Failed to deactivate Battery Saver: {e}\n{e.stderr}")
     except Exception as e:
-        messagebox.showerror("Error", f"Failed to restore brightness level: {e}")
+        dialogs.show_error("Error", f"Failed to deactivate Battery Saver: {e}")
 
 def toggle_battery_saver():
     """ Toggles the battery saver mode based on the current state """
@@ -123,8 +293,9 @@ def toggle_battery_saver():
 
 def is_battery_saver_on():
     """ Checks whether the battery saver mode is currently on """
+    import power_plan
     try:
-        return get_active_power_scheme() == POWER_SAVER_GUID
-    except subprocess.CalledProcessError as e:
-        log_error(f"Failed to check battery saver status: {e}")
+        return power_plan.get_manager().is_saver_active()
+    except (subprocess.CalledProcessError, OSError) as e:
+        log_error(f"Failed to check battery saver status: {e}", "battery_utility.py")
         return False
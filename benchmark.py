@@ -0,0 +1,921 @@
+# /benchmark.py
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Registered benchmarks: name -> function(iterations) returning a dict of results
+BENCHMARKS = {}
+# Cumulative import time budgets (ms) of the entry points, best of several cold imports
+# (measured on a single vCPU container: daemon 71-102 ms, settings 79-103 ms, CLI 34-51 ms, the budgets allow ~20% on top)
+DAEMON_IMPORT_BUDGET_MS = 120
+GUI_IMPORT_BUDGET_MS = 120
+CLI_IMPORT_BUDGET_MS = 70
+# Packages an entry point must never load on import, the import graph guard that doesn't depend on the machine's speed
+DAEMON_IMPORT_FORBIDDEN = ("tkinter", "numpy", "asyncio", "sqlite3", "ctypes", "http.server", "urllib.request")
+GUI_IMPORT_FORBIDDEN = ("numpy", "asyncio", "sqlite3", "http.server", "urllib.request")
+CLI_IMPORT_FORBIDDEN = DAEMON_IMPORT_FORBIDDEN
+
+def benchmark(name):
+    """ Registers a benchmark function under the given name """
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+class FakePowercfg:
+    """ subprocess.run stand-in for powercfg that keeps the active scheme & counts spawns (each taking delay seconds) """
+
+    def __init__(self, scheme, delay=0):
+        self.scheme = scheme
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, args, **kwargs):
+        self.calls.append(list(args))
+        if self.delay:
+            time.sleep(self.delay)
+        if "/getactivescheme" in args:
+            return subprocess.CompletedProcess(args, 0, f"Power Scheme GUID: {self.scheme}  (Plan)\n", "")
+        if "/setactive" in args:
+            self.scheme = args[-1]
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+class FakeSensor:
+    """ Sensor backend returning whatever percent & plug state it is set to """
+
+    def __init__(self, percent=50, power_plugged=False):
+        self.percent = percent
+        self.power_plugged = power_plugged
+
+    def read(self):
+        import sensors
+        return sensors.BatteryReading(self.percent, self.power_plugged, None, None, None)
+
+    def close(self):
+        pass
+
+class TimedBackend:
+    """ Notification backend that records when each notification was delivered """
+
+    def __init__(self):
+        self.sent = []
+
+    def notify(self, title, message, timeout):
+        self.sent.append((time.perf_counter(), message))
+
+_SILENT_MESSAGEBOX = types.SimpleNamespace(**{name: lambda *args, **kwargs: None for name in ("showinfo", "showerror", "showwarning")})
+
+def _install_fakes():
+    """ Replaces the platform & GUI dependencies with headless fakes so every benchmark runs on Linux """
+    fake_psutil = types.ModuleType("psutil")
+    fake_psutil.sensors_battery = lambda: types.SimpleNamespace(percent=50, power_plugged=False, secsleft=None)
+    fake_psutil.NoSuchProcess = type("NoSuchProcess", (Exception,), {})
+    fake_psutil.Process = lambda pid: (_ for _ in ()).throw(fake_psutil.NoSuchProcess(pid))
+    fake_psutil.process_iter = lambda attrs=None: iter(())
+    sys.modules["psutil"] = fake_psutil
+    for name in ("wmi", "plyer", "win32com", "win32com.client"):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules["win32com.client"].Dispatch = lambda name: None
+    sys.modules["plyer"].notification = types.SimpleNamespace(notify=lambda **kwargs: None)
+    # Silences dialogs without importing tkinter, which would skew the daemon's footprint
+    import dialogs
+    dialogs._messagebox = lambda: _SILENT_MESSAGEBOX
+    if not hasattr(subprocess, "CREATE_NO_WINDOW"):
+        subprocess.CREATE_NO_WINDOW = 0
+
+def _setup(workdir):
+    """ Runs the benchmarks from a scratch copy of the config so logs & state never touch the checkout """
+    shutil.copy(os.path.join(REPO_DIR, "config.json"), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    _install_fakes()
+    import brightness
+    import notification
+    import power_plan
+    import sensors
+    power_plan._default_manager = power_plan.PowerPlanManager(FakePowercfg(power_plan.BALANCED_GUID))
+    brightness._default_controller = brightness.BrightnessController(brightness.FakeBrightnessBackend(80))
+    sensors._default_sensor = FakeSensor()
+    notification._default_dispatcher = notification.NotificationDispatcher(notification.MemoryBackend())
+
+def _timings(samples):
+    """ Summarises a list of durations (seconds) in microseconds """
+    samples = sorted(samples)
+    return {
+        "mean_us": sum(samples) / len(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+        "max_us": samples[-1] * 1e6,
+    }
+
+@benchmark("monitor_tick")
+def bench_monitor_tick(iterations):
+    """ Cost of one BatteryMonitor.check() between thresholds (wall, CPU & allocations) """
+    import battery_utility
+    import history
+    monitor = battery_utility.BatteryMonitor(sensor=FakeSensor(50, False), history=history.BatteryHistory(path="bench_history.bin"))
+    monitor.check()
+    durations = []
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        monitor.check()
+        durations.append(time.perf_counter() - start)
+    cpu = (time.process_time() - cpu_start) / iterations
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    allocated_start, _ = tracemalloc.get_traced_memory()
+    for _ in range(1000):
+        monitor.check()
+    allocated_end, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename") if stat.count_diff > 0)
+    tracemalloc.stop()
+    return dict(_timings(durations), cpu_us=cpu * 1e6, retained_bytes_per_tick=(allocated_end - allocated_start) / 1000,
+                peak_traced_bytes=peak, retained_blocks_per_tick=blocks / 1000)
+
+class NullMetric:
+    """ Metric stand-in that records nothing, to measure the monitor without instrumentation """
+
+    def inc(self, *label_values, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+@benchmark("metrics_overhead")
+def bench_metrics_overhead(iterations, rounds=21):
+    """ Cost of the metrics on a monitor tick: ticks with the real metrics vs no-op stand-ins (median of paired rounds),
+        and the cost of a timed check's perf_counter() calls & observations spread over the sampling interval """
+    import battery_utility
+    import history
+    import metrics
+    import sensors
+    # The sysfs sensor over scratch files, so the tick includes the reads a Linux daemon makes
+    monitor = battery_utility.BatteryMonitor(sensor=sensors.FakeSysfsSensor(os.path.abspath("power_supply"), capacity=50),
+                                             history=history.BatteryHistory(path="bench_history.bin"))
+    monitor.check()
+    names = [name for name, value in vars(metrics).items() if isinstance(value, (metrics.Counter, metrics.Histogram))]
+    instrumented = {name: getattr(metrics, name) for name in names}
+    stand_ins = {name: NullMetric() for name in names}
+    def tick_cost(replacements):
+        for name in names:
+            setattr(metrics, name, replacements[name])
+        start = time.perf_counter()
+        for _ in range(iterations):
+            monitor.check()
+        return (time.perf_counter() - start) / iterations
+    with_metrics, without_metrics = [], []
+    try:
+        for _ in range(rounds):
+            with_metrics.append(tick_cost(instrumented))
+            without_metrics.append(tick_cost(stand_ins))
+    finally:
+        for name in names:
+            setattr(metrics, name, instrumented[name])
+    ratios = sorted(timed / untimed - 1 for timed, untimed in zip(with_metrics, without_metrics))
+    # What a timed check adds: four perf_counter() calls & three observations
+    scratch = [metrics.Histogram(f"bench_{index}_seconds", "scratch") for index in range(3)]
+    metrics.REGISTRY[-3:] = []
+    costs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            loaded = time.perf_counter()
+            scratch[0].observe(loaded - started)
+            scratch[1].observe(time.perf_counter() - loaded)
+            scratch[2].observe(time.perf_counter() - started)
+        costs.append((time.perf_counter() - start) / iterations)
+    per_tick = min(costs) / metrics.METRICS_SAMPLE_EVERY
+    start = time.perf_counter()
+    rendered = metrics.render()
+    render_time = time.perf_counter() - start
+    return {
+        "tick_with_metrics_us": min(with_metrics) * 1e6, "tick_without_metrics_us": min(without_metrics) * 1e6,
+        "measured_overhead": ratios[len(ratios) // 2], "timed_check_instrumentation_us": min(costs) * 1e6,
+        "sample_every": metrics.METRICS_SAMPLE_EVERY, "estimated_overhead": per_tick / min(without_metrics),
+        "render_us": render_time * 1e6, "exposition_bytes": len(rendered),
+    }
+
+@benchmark("threshold_to_dispatch")
+def bench_threshold_to_dispatch(iterations):
+    """ Latency from the check that sees a threshold crossing to the notification reaching the backend """
+    import battery_utility
+    import history
+    import notification
+    backend = TimedBackend()
+    dispatcher = notification.NotificationDispatcher(backend, coalesce_windows={}, rate_limits={})
+    notification._default_dispatcher = dispatcher
+    latencies, check_durations = [], []
+    for _ in range(min(iterations, 200)):
+        sensor = FakeSensor(50, True)
+        monitor = battery_utility.BatteryMonitor(sensor=sensor, history=history.BatteryHistory(path=None))
+        monitor.check()
+        dispatcher.flush()
+        backend.sent.clear()
+        start = time.perf_counter()
+        sensor.percent = 100 # Crosses higher_threshold
+        monitor.check()
+        check_durations.append(time.perf_counter() - start)
+        dispatcher.flush()
+        while not backend.sent:
+            time.sleep(0)
+        latencies.append(backend.sent[-1][0] - start)
+    dispatcher.stop()
+    notification._default_dispatcher = notification.NotificationDispatcher(notification.MemoryBackend())
+    return {"dispatch": _timings(latencies), "check": _timings(check_durations)}
+
+@benchmark("battery_saver")
+def bench_battery_saver(iterations):
+    """ Time, powercfg spawns & brightness round trips of saver activation & toggling """
+    import battery_utility
+    import brightness
+    import power_plan
+    runner = FakePowercfg(power_plan.BALANCED_GUID)
+    backend = brightness.FakeBrightnessBackend(80)
+    power_plan._default_manager = power_plan.PowerPlanManager(runner)
+    brightness._default_controller = brightness.BrightnessController(backend)
+    results = {}
+    for name, action in (("activate_cold", battery_utility.activate_battery_saver), ("deactivate", battery_utility.deactivate_battery_saver)):
+        runner.calls.clear()
+        backend.calls = dict.fromkeys(backend.calls, 0)
+        start = time.perf_counter()
+        action()
+        results[name] = {"us": (time.perf_counter() - start) * 1e6, "spawns": len(runner.calls), "brightness_calls": dict(backend.calls)}
+    runner.calls.clear()
+    durations = []
+    for _ in range(min(iterations, 500)):
+        start = time.perf_counter()
+        battery_utility.toggle_battery_saver()
+        durations.append(time.perf_counter() - start)
+    results["toggle"] = dict(_timings(durations), spawns_per_toggle=len(runner.calls) / len(durations))
+    return results
+
+@benchmark("start_stop_monitoring")
+def bench_start_stop_monitoring(iterations):
+    """ Latency of settings.start_monitoring / stop_monitoring without the spawned interpreter itself """
+    import settings
+    from unittest import mock
+    next_pid = iter(range(10 ** 6, 2 * 10 ** 6))
+    starts, stops = [], []
+    # settings.subprocess is the subprocess module itself, the later benchmarks spawn real processes once it is put back
+    with mock.patch.object(settings.subprocess, "Popen", lambda *args, **kwargs: types.SimpleNamespace(pid=next(next_pid))):
+        for _ in range(min(iterations, 500)):
+            start = time.perf_counter()
+            settings.start_monitoring()
+            starts.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            settings.stop_monitoring()
+            stops.append(time.perf_counter() - start)
+    return {"start": _timings(starts), "stop": _timings(stops)}
+
+@benchmark("config_load")
+def bench_config_load(iterations):
+    """ Cached config load against a full read & parse of config.json """
+    import config_store
+    config_store.load_config()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        config_store.load_config()
+    cached = (time.perf_counter() - start) / iterations
+    start = time.perf_counter()
+    for _ in range(iterations):
+        config_store.invalidate()
+        config_store.load_config()
+    uncached = (time.perf_counter() - start) / iterations
+    return {"cached_us": cached * 1e6, "reparse_us": uncached * 1e6}
+
+# Writer process for the config_writers benchmark: threads merging their own counter field, the legacy mode writes in place unlocked
+_CONFIG_WRITER_SCRIPT = """
+import json, sys, threading
+import config_store
+path, name, threads, updates, legacy = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5] == "legacy"
+def write(field):
+    for count in range(1, updates + 1):
+        if legacy:
+            config = config_store._read_config_file(path)
+            config[field] = count
+            with open(path, 'w') as config_file:
+                json.dump(config, config_file, indent=4)
+        else:
+            config_store.update_config({field: count}, path, delay=0 if count % 2 else 0.001) # Alternates direct & debounced writes
+workers = [threading.Thread(target=write, args=(f"{name}_{index}",)) for index in range(threads)]
+for worker in workers:
+    worker.start()
+for worker in workers:
+    worker.join()
+config_store.flush_config()
+"""
+
+def _stress_config(path, legacy, processes, threads, updates):
+    """ Runs concurrent writer processes against the config while reading it raw, returns (reads, failed reads, lost updates, seconds) """
+    import config_store
+    with open(path, 'w') as config_file:
+        json.dump({"lower_threshold": 20, "higher_threshold": 80}, config_file, indent=4)
+    start = time.perf_counter()
+    writers = [subprocess.Popen([sys.executable, "-c", _CONFIG_WRITER_SCRIPT, path, f"writer_{index}", str(threads), str(updates),
+                                 "legacy" if legacy else "atomic"], env=dict(os.environ, PYTHONPATH=REPO_DIR), stderr=subprocess.DEVNULL)
+               for index in range(processes)]
+    reads = failed = 0
+    while any(writer.poll() is None for writer in writers):
+        reads += 1
+        try:
+            config_store._read_config_file(path)
+        except (OSError, ValueError):
+            failed += 1 # What sends load_config into its reset to defaults
+    seconds = time.perf_counter() - start
+    try:
+        final = config_store._read_config_file(path)
+    except (OSError, ValueError):
+        final = {}
+    expected = {f"writer_{index}_{thread}" for index in range(processes) for thread in range(threads)}
+    lost = sum(final.get(field) != updates for field in expected) + (final.get("lower_threshold") != 20)
+    return reads, failed, lost, seconds
+
+@benchmark("config_writers")
+def bench_config_writers(iterations, processes=4, threads=2, updates=100):
+    """ Stress test of concurrent config writers (processes x threads), the atomic locked writer against the old in-place rewrite """
+    path = os.path.abspath("bench_config.json")
+    results = {"processes": processes, "threads": threads, "updates_per_thread": updates}
+    for mode in ("legacy", "atomic"):
+        reads, failed, lost, seconds = _stress_config(path, mode == "legacy", processes, threads, updates)
+        results[mode] = {"reads": reads, "failed_reads": failed, "fields_lost": lost, "seconds": seconds,
+                         "writes_per_second": processes * threads * updates / seconds}
+    # One burst of debounced updates in this process, written to disk in one go
+    import config_store
+    stamp = config_store._file_stamp(path)
+    for count in range(iterations):
+        config_store.update_config({"burst": count}, path)
+    untouched = config_store._file_stamp(path) == stamp
+    visible = config_store.load_config(path)["burst"] == iterations - 1
+    config_store.flush_config(path)
+    results["debounced_burst"] = {"updates": iterations, "file_untouched_before_flush": untouched, "visible_in_process": visible,
+                                  "written_by_flush": config_store._read_config_file(path).get("burst") == iterations - 1}
+    return results
+
+@benchmark("log_lookup")
+def bench_log_lookup(iterations, log_size=300 * 1024 * 1024):
+    """ Last record & PID lookups against a large synthetic log """
+    import logger
+    line = b"2024-01-01 00:00:00,000 - Error (caller = battery_utility.py)): synthetic log line for benchmarking\n"
+    path = os.path.join("logs", "bench_large.log")
+    with open(path, 'wb') as log_file:
+        log_file.write(b"2024-01-01 00:00:00,000 - Start monitoring process initiated (caller = bench) with PID: 4242\n")
+        chunk = line * (1024 * 1024 // len(line))
+        for _ in range(log_size // len(chunk)):
+            log_file.write(chunk)
+    results = {"log_bytes": os.path.getsize(path)}
+    start = time.perf_counter()
+    for _ in range(iterations):
+        next(logger.iter_log_lines_reversed(path))
+    results["last_record_us"] = (time.perf_counter() - start) / iterations * 1e6
+    logger.register_pid(4242, "bench")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        logger.get_registered_pids()
+    results["registry_lookup_us"] = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for line in logger.iter_log_lines_reversed(path):
+        if "Start monitoring process initiated" in line:
+            break
+    results["worst_case_scan_ms"] = (time.perf_counter() - start) * 1e3
+    os.remove(path)
+    return results
+
+@benchmark("rate_predictor")
+def bench_rate_predictor(iterations):
+    """ Per-update cost & accuracy of the time-to-threshold predictor on a noisy synthetic discharge trace """
+    import random
+    import predictor
+    random.seed(0)
+    rate = -0.5 / 60 # % per second
+    trace = [(t, int(95 + rate * t + random.uniform(-0.5, 0.5))) for t in range(0, 3 * 60 * 60, 30)]
+    estimator = predictor.RateEstimator()
+    errors = []
+    start = time.perf_counter()
+    for timestamp, percent in trace:
+        estimator.update(timestamp, percent)
+    update = (time.perf_counter() - start) / len(trace)
+    estimator.reset()
+    for timestamp, percent in trace:
+        estimator.update(timestamp, percent)
+        predicted = estimator.seconds_until(20)
+        actual = (20 - 95) / rate - timestamp
+        if predicted is not None and 0 < actual <= 30 * 60:
+            errors.append(abs(predicted - actual))
+    return {"update_us": update * 1e6, "mean_abs_error_s_last_30min": sum(errors) / len(errors), "max_abs_error_s_last_30min": max(errors)}
+
+def _synthetic_rules(count):
+    """ The two threshold rules plus count - 2 narrow warning bands spread over the levels, with mixed plug conditions & hysteresis """
+    entries = [{"name": "higher", "above": 80, "plugged": True}, {"name": "lower", "below": 20, "plugged": False, "actions": ["saver", "notify"]}]
+    width = 100 / max(count - 2, 1)
+    for index in range(count - 2):
+        entries.append({"name": f"band_{index}", "above": round(index * width, 3), "below": round(index * width + width / 2, 3),
+                        "plugged": (None, True, False)[index % 3], "hysteresis": 1, "actions": ["notify", "dim"][:1 + index % 2]})
+    return entries
+
+@benchmark("rules")
+def bench_rules(iterations, counts=(2, 10, 50, 100, 500)):
+    """ Rule evaluation & full check cost from 2 to 500 rules over a synthetic trace, against scanning every rule on each check """
+    import rules
+    import simulate
+    trace = simulate.synthetic_trace(1, interval=60)
+    levels = [(sample.percent + (index % 7) / 7, sample.power_plugged) for index, sample in enumerate(trace)] # Fractional levels too
+    results = {}
+    for count in counts:
+        config = {"lower_threshold": 20, "higher_threshold": 80, "rules": _synthetic_rules(count)}
+        start = time.perf_counter()
+        rule_set = rules.compile_rules(config)
+        compile_ms = (time.perf_counter() - start) * 1e3
+        durations = []
+        for index in range(iterations):
+            percent, plugged = levels[index % len(levels)]
+            start = time.perf_counter()
+            rule_set.evaluate(percent, plugged)
+            durations.append(time.perf_counter() - start)
+        # What the if/elif chain becomes when extended rule by rule
+        linear = []
+        for index in range(min(iterations, 2000)):
+            percent, plugged = levels[index % len(levels)]
+            start = time.perf_counter()
+            [rule for rule in rule_set.rules if (rule.plugged is None or rule.plugged == plugged) and rule.low <= percent <= rule.high]
+            linear.append(time.perf_counter() - start)
+        clock = simulate.VirtualClock(trace[0].timestamp)
+        monitor = simulate.SimulatedMonitor(simulate.TraceSensor(trace, clock), clock, config)
+        checks = []
+        for index in range(min(iterations, len(trace))):
+            start = time.perf_counter()
+            monitor.check()
+            checks.append(time.perf_counter() - start)
+            clock.advance(60)
+        results[str(count)] = {"compile_ms": compile_ms, "evaluate_p50_us": _timings(durations)["p50_us"],
+                               "linear_scan_p50_us": _timings(linear)["p50_us"], "check_p50_us": _timings(checks)["p50_us"],
+                               "fired": sum(action["action"] == "journal" and action["kind"] == "threshold_crossed" for action in monitor.actions)}
+    first, last = results[str(counts[0])], results[str(counts[-1])]
+    results["evaluate_growth"] = last["evaluate_p50_us"] / first["evaluate_p50_us"]
+    results["check_growth"] = last["check_p50_us"] / first["check_p50_us"]
+    return results
+
+def _write_history(path, days, first_day=0):
+    """ Appends days of 1 Hz history records: 3 h discharges from 100% to 10% then 1 h charges, with the rate left unknown """
+    import numpy as np
+    import analytics
+    import history
+    seconds = np.arange(first_day * 24 * 60 * 60, (first_day + days) * 24 * 60 * 60, dtype=np.int64)
+    phase = seconds % (4 * 60 * 60)
+    discharging = phase < 3 * 60 * 60
+    tenths = np.where(discharging, 1000 - phase // 12, 100 + (phase - 3 * 60 * 60) // 4)
+    records = np.empty(len(seconds), analytics.RECORD_DTYPE)
+    records["timestamp"] = 1_700_000_000 + seconds
+    records["level"] = tenths | np.where(discharging, 0, history.PLUGGED_FLAG)
+    records["rate"] = history.NO_RATE
+    with open(path, 'ab') as history_file:
+        records.tofile(history_file)
+    return len(records)
+
+@benchmark("analytics")
+def bench_analytics(iterations, days=365):
+    """ Wear analytics over a year of 1 Hz history: a full pass, then the incremental update after another day was recorded """
+    import analytics
+    path, cache_path = os.path.abspath("bench_history_year.bin"), os.path.abspath("bench_analytics.json")
+    records = _write_history(path, days)
+    full = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = analytics.update_analytics(path, cache_path=None)
+        full.append(time.perf_counter() - start)
+    analytics.update_analytics(path, cache_path=cache_path)
+    _write_history(path, 1, first_day=days)
+    start = time.perf_counter()
+    updated = analytics.update_analytics(path, cache_path=cache_path)
+    incremental = time.perf_counter() - start
+    summary = result.summary()
+    os.remove(path)
+    return {"records": records, "full_pass_s": min(full), "records_per_second": records / min(full), "incremental_day_s": incremental,
+            "incremental_records": updated.records - records, "equivalent_full_cycles": summary["equivalent_full_cycles"],
+            "depth_of_discharge_counts": summary["depth_of_discharge"]["counts"], "share_above_higher": summary["share_above_higher"]}
+
+def _fleet_batch(device, sequence, start, samples, rng):
+    """ A telemetry batch of one simulated agent: a minute of samples, the device's state & now & then a threshold event """
+    percent, plugged = rng.uniform(5, 100), rng.random() < 0.3
+    rows = [[start + i * 60 / samples, round(percent, 1), plugged, -0.2] for i in range(samples)]
+    events = [{"ts": start, "kind": "threshold_crossed", "threshold": "lower", "percent": percent}] if rng.random() < 0.1 else []
+    state = {"ts": rows[-1][0], "percent": rows[-1][1], "power_plugged": plugged, "rate": -0.2, "saver_on": False,
+             "lower_threshold": 20, "higher_threshold": 80}
+    return {"id": f"{device}/bench/{sequence}", "device": device, "sent": start, "state": state, "samples": rows, "events": events}
+
+async def _http_request(reader, writer, method, target, body=b"", headers=""):
+    """ Sends one HTTP/1.1 request over a kept-alive connection & returns (status, body) """
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+async def _run_agents(port, bodies, concurrency):
+    """ Uploads every simulated agent's batches over its own connection, at most concurrency agents at a time
+        Returns the latency of every upload & the statuses seen """
+    import asyncio
+    limit = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def agent(agent_bodies):
+        async with limit:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for body in agent_bodies:
+                start = time.perf_counter()
+                status, _ = await _http_request(reader, writer, "POST", "/ingest", body, "Content-Encoding: gzip\r\n")
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+            writer.close()
+
+    await asyncio.gather(*(agent(agent_bodies) for agent_bodies in bodies))
+    return latencies, statuses
+
+async def _query(port, target, times):
+    import asyncio
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    durations = []
+    for _ in range(times):
+        start = time.perf_counter()
+        status, body = await _http_request(reader, writer, "GET", target)
+        durations.append(time.perf_counter() - start)
+    writer.close()
+    return durations, json.loads(body)
+
+@benchmark("fleet")
+def bench_fleet(iterations, agents=2000, batches=3, samples=60, concurrency=256):
+    """ Load test of a local fleet collector: thousands of simulated agents uploading gzip'd batches concurrently, retried batches,
+        the "below threshold now" query under the resulting data, & a real TelemetryAgent delivering after an outage """
+    import asyncio
+    import random
+    import socket
+    import threading
+    import collector
+    import telemetry
+    rng = random.Random(7)
+    store = collector.FleetStore(os.path.abspath("bench_fleet.db"))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(collector.Collector(store, port=0).start(), loop).result()
+    now = time.time()
+    uploads = [[telemetry.encode_batch(_fleet_batch(f"device-{agent:05d}", sequence, now - (batches - sequence) * 60, samples, rng))
+                for sequence in range(batches)] for agent in range(agents)]
+    start = time.perf_counter()
+    latencies, statuses = asyncio.run(_run_agents(server.port, uploads, concurrency))
+    elapsed = time.perf_counter() - start
+    counts = store.counts()
+    # Retries of batches the collector already stored (lost acknowledgements) must not add rows
+    retried = [agent_bodies[-1:] for agent_bodies in uploads[::10]]
+    _, retry_statuses = asyncio.run(_run_agents(server.port, retried, concurrency))
+    latest = [telemetry.decode_batch(agent_bodies[-1])["state"] for agent_bodies in uploads]
+    expected = sum(1 for state in latest if state["percent"] <= state["lower_threshold"] and not state["power_plugged"])
+    query_durations, below = asyncio.run(_query(server.port, "/devices/below-threshold", max(10, min(iterations, 200))))
+    # End to end: an agent spools while the collector is unreachable, then delivers with backoff once it is back
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+    agent = telemetry.TelemetryAgent(f"http://127.0.0.1:{closed_port}/ingest", device="bench-agent", spool_dir=os.path.abspath("bench_spool"))
+    agent.record_sample(now, 12.5, False, -0.3, False, 20, 80)
+    agent.flush()
+    failures, backoff = agent.failures, agent.next_attempt - time.monotonic()
+    agent.url = f"http://127.0.0.1:{server.port}/ingest"
+    agent.record_event("threshold_crossed", {"threshold": "lower", "percent": 12.5}, now)
+    agent.next_attempt = 0
+    agent.flush()
+    delivered = [device for device in store.devices() if device["device"] == "bench-agent"]
+    stats = dict(server.stats)
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    after_retries = store.counts()
+    store.close()
+    return {
+        "agents": agents, "batches": agents * batches, "samples_per_batch": samples, "concurrency": concurrency, "elapsed_s": elapsed,
+        "batches_per_second": agents * batches / elapsed, "samples_per_second": agents * batches * samples / elapsed,
+        "ingest": _timings(latencies), "statuses": statuses, "commits": stats["commits"],
+        "batches_per_commit": stats["batches"] / stats["commits"] if stats["commits"] else None, "stored": counts,
+        "retried_batches": len(retried), "retry_statuses": retry_statuses,
+        "rows_added_by_retries": after_retries["samples"] - counts["samples"] - 1, # The end to end agent's sample
+        "below_threshold_devices": len(below), "below_threshold_expected": expected, "below_threshold_query": _timings(query_durations),
+        "agent_failures_while_down": failures, "agent_backoff_s": backoff, "agent_delivered_after_recovery": len(delivered) == 1,
+        "agent_spool_left": len(agent._spooled()),
+    }
+
+def _proc_status(pid, field):
+    """ Returns an integer field (e.g. VmRSS in KiB, Threads) from /proc/<pid>/status """
+    with open(f"/proc/{pid}/status", 'r') as status_file:
+        for line in status_file:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def _process_tree(pid):
+    """ Returns the pid & every descendant pid, read from /proc """
+    pids = [pid]
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children", 'r') as children_file:
+                for child in children_file.read().split():
+                    pids.extend(_process_tree(int(child)))
+        except OSError:
+            pass
+    return pids
+
+@benchmark("daemon_footprint")
+def bench_daemon_footprint(iterations, settle_seconds=3):
+    """ RSS & thread count of the single-process daemon against the legacy two-process layout (needs Linux /proc) """
+    if not os.path.isdir("/proc/self/task"):
+        return {"skipped": "needs /proc"}
+    # The daemons are separate interpreters, so the fakes are installed there through sitecustomize
+    fakes_dir = os.path.abspath("fakes")
+    os.makedirs(fakes_dir, exist_ok=True)
+    with open(os.path.join(fakes_dir, "sitecustomize.py"), 'w') as sitecustomize:
+        sitecustomize.write("import benchmark\nbenchmark._install_fakes()\n")
+    # A private temp dir keeps the daemons' control channel away from a real running daemon
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([fakes_dir, REPO_DIR]), TMPDIR=os.path.abspath("."))
+    results = {}
+    for layout, args in (("single_process", []), ("two_process", ["--spawn"])):
+        daemon = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "process.py"), *args], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        time.sleep(settle_seconds)
+        pids = _process_tree(daemon.pid)
+        results[layout] = {
+            "processes": len(pids),
+            "rss_kib": sum(_proc_status(pid, "VmRSS") for pid in pids),
+            "threads": sum(_proc_status(pid, "Threads") for pid in pids),
+        }
+        os.killpg(daemon.pid, 15)
+        daemon.wait()
+    results["rss_reduction"] = 1 - results["single_process"]["rss_kib"] / results["two_process"]["rss_kib"]
+    return results
+
+def _ensure_display():
+    """ Returns whether Tk can open a window, starting a private Xvfb server when there is no display on Linux """
+    if sys.platform != "linux" or os.environ.get("DISPLAY"):
+        return True
+    if shutil.which("Xvfb") is None:
+        return False
+    display = f":{90 + os.getpid() % 1000}"
+    server = subprocess.Popen(["Xvfb", display, "-nolisten", "tcp"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import atexit
+    atexit.register(server.terminate)
+    os.environ["DISPLAY"] = display
+    for _ in range(50):
+        if os.path.exists(f"/tmp/.X11-unix/X{display[1:]}"):
+            return True
+        time.sleep(0.1)
+    return False
+
+def _event_loop_lag(root, run_action, actions, tick_seconds):
+    """ Runs the actions one after another from the Tk loop & returns how late a periodic after() tick fired meanwhile """
+    import worker
+    action_worker = worker.ActionWorker(root)
+    lags, remaining, expected = [], [actions], [time.perf_counter() + tick_seconds]
+    def tick():
+        now = time.perf_counter()
+        lags.append(max(0.0, now - expected[0]))
+        expected[0] = now + tick_seconds
+        if remaining[0] or action_worker.busy:
+            root.after(int(tick_seconds * 1000), tick)
+        else:
+            root.quit()
+    def next_action():
+        if remaining[0]:
+            remaining[0] -= 1
+            run_action(action_worker, next_action)
+    root.after(int(tick_seconds * 1000), tick)
+    root.after(0, next_action)
+    root.mainloop()
+    action_worker.shutdown(wait=True)
+    return lags
+
+@benchmark("gui_latency")
+def bench_gui_latency(iterations, actions=6, action_seconds=0.3, tick_seconds=0.01):
+    """ Tk event loop lag while battery saver toggles (slowed fake powercfg) run inline vs on the worker pool (needs a display or Xvfb) """
+    if not _ensure_display():
+        return {"skipped": "needs a display or Xvfb"}
+    import tkinter as tk
+    import power_plan
+    import settings
+    power_plan._default_manager = power_plan.PowerPlanManager(FakePowercfg(power_plan.BALANCED_GUID, delay=action_seconds))
+    root = tk.Tk()
+    button = tk.Button(root, text="Toggle Battery Saver")
+    def inline(action_worker, done):
+        settings.toggle_battery_saver()
+        root.after(0, done)
+    disabled = []
+    def pooled(action_worker, done):
+        action_worker.submit(settings.toggle_battery_saver, on_done=lambda message: done(), buttons=(button,), busy_text="Switching...")
+        disabled.append(button.cget("state") == "disabled")
+    results = {}
+    for mode, run_action in (("inline", inline), ("worker", pooled)):
+        lags = _event_loop_lag(root, run_action, actions, tick_seconds)
+        results[mode] = {"ticks": len(lags), "lag": _timings(lags)}
+    root.destroy()
+    results["buttons_disabled_while_busy"] = all(disabled)
+    return results
+
+@benchmark("status_segment")
+def bench_status_segment(iterations, seconds=2):
+    """ Snapshot read latency of the status segment while another process rewrites it as fast as it can, checking for torn reads """
+    import status_segment
+    path = os.path.abspath("bench.status")
+    writer = status_segment.StatusWriter(path)
+    writer.publish(percent=0, checks=0)
+    # Every state the writer publishes satisfies percent == checks % 100 & rate == checks, a torn read breaks that
+    script = ("import status_segment, time\n"
+              f"writer = status_segment.StatusWriter({path!r})\n"
+              f"end, checks = time.time() + {seconds}, 0\n"
+              "while time.time() < end:\n"
+              "    checks += 1\n"
+              "    writer.publish(percent=checks % 100, rate=checks, checks=checks)\n"
+              "print(checks)\n")
+    child = subprocess.Popen([sys.executable, "-c", script], env=dict(os.environ, PYTHONPATH=REPO_DIR), stdout=subprocess.PIPE, text=True)
+    reader = status_segment.StatusReader(path)
+    durations, torn, missing, sequences = [], 0, 0, set()
+    while child.poll() is None:
+        start = time.perf_counter()
+        snapshot = reader.read()
+        durations.append(time.perf_counter() - start)
+        if snapshot is None:
+            missing += 1
+        elif snapshot.percent != snapshot.checks % 100 or (snapshot.checks and snapshot.rate != snapshot.checks):
+            torn += 1
+        else:
+            sequences.add(snapshot.sequence)
+    writes = int(child.stdout.read())
+    writer.close()
+    snapshot = reader.read()
+    reader.close()
+    return {
+        "writes": writes, "reads": len(durations), "distinct_states_seen": len(sequences), "torn_reads": torn, "failed_reads": missing,
+        "read": _timings(durations), "stopped_state_after_close": snapshot.state == "stopped" and not status_segment.is_alive(snapshot),
+    }
+
+def _write_battery_report(path, weeks):
+    """ Writes a powercfg-style battery report with the given number of weekly capacity history rows & usage rows """
+    rows = []
+    for week in range(weeks):
+        rows.append(f'<tr class="even 1"><td class="dateTime">2020-01-{week % 28 + 1:02d} - 2020-01-{week % 28 + 1:02d}</td>'
+                    f'<td class="mw">{42000 - week * 5:,} mWh</td><td class="mw">41,998 mWh</td></tr>')
+    usage = [f'<tr class="odd 1"><td class="dateTime"><span class="date">2020-01-01 </span><span class="time">10:{minute % 60:02d}:00</span></td>'
+             f'<td class="state">Active</td><td class="acdc">Battery</td><td class="percent">{90 - minute % 80} %</td><td class="mw">30,000 mWh</td></tr>'
+             for minute in range(weeks * 5)]
+    with open(path, 'w', encoding='utf-8') as report_file:
+        report_file.write("<!DOCTYPE html><html><head><title>Battery report</title></head><body><h1>Battery report</h1>"
+                          "<h2>Installed batteries</h2><table><thead><tr><td> </td><td>BATTERY 1</td></tr></thead>"
+                          '<tr><td><span class="label">NAME</span></td><td>DELL 1VX1H</td></tr>'
+                          '<tr><td><span class="label">DESIGN CAPACITY</span></td><td>41,998 mWh</td></tr><tr style="height:0.4em;"></tr>'
+                          '<tr><td><span class="label">FULL CHARGE CAPACITY</span></td><td>37,564 mWh</td></tr>'
+                          '<tr><td><span class="label">CYCLE COUNT</span></td><td>212</td></tr></table>'
+                          "<h2>Recent usage</h2><table><thead><tr><td>START TIME</td><td>STATE</td><td>SOURCE</td><td colspan=\"2\">CAPACITY REMAINING</td></tr></thead>"
+                          + "".join(usage) + "</table>"
+                          "<h2>Battery capacity history</h2><table><thead><tr><td><span>PERIOD</span></td><td><span>FULL CHARGE CAPACITY</span></td>"
+                          "<td><span>DESIGN CAPACITY</span></td></tr></thead>" + "".join(rows) + "</table></body></html>")
+
+@benchmark("report_parse")
+def bench_report_parse(iterations, weeks=156):
+    """ Streaming parse of a large battery report vs repeat views served from the content-hash & in-memory caches """
+    import battery_report
+    path = os.path.abspath("battery_report.html")
+    _write_battery_report(path, weeks)
+    cache_dir = os.path.abspath("report_cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    battery_report._memory_cache.clear()
+    start = time.perf_counter()
+    report = battery_report.load_report(path, cache_dir)
+    cold = time.perf_counter() - start
+    tracemalloc.start()
+    battery_report.parse_report(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    battery_report._memory_cache.clear()
+    start = time.perf_counter()
+    battery_report.load_report(path, cache_dir)
+    hashed = time.perf_counter() - start
+    repeat = []
+    for _ in range(min(iterations, 1000)):
+        start = time.perf_counter()
+        battery_report.load_report(path, cache_dir)
+        repeat.append(time.perf_counter() - start)
+    return {
+        "report_bytes": os.path.getsize(path), "capacity_rows": len(report["capacity_history"]),
+        "usage_rows": len(report["tables"]["recent usage"]["rows"]), "cold_parse_ms": cold * 1000, "cold_parse_peak_kib": peak / 1024,
+        "content_hash_hit_ms": hashed * 1000, "repeat_view": _timings(repeat),
+    }
+
+def _write_import_stubs(directory):
+    """ Writes empty stand-ins for the platform packages that aren't installed, so entry points import as on Windows """
+    from importlib.machinery import PathFinder
+    for name in ("psutil", "wmi", "plyer", "win32com"):
+        if PathFinder.find_spec(name) is not None: # Looks on sys.path, past the fakes installed in sys.modules
+            continue
+        if name == "win32com":
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+            for module in ("__init__", "client"):
+                open(os.path.join(directory, name, module + ".py"), 'w').close()
+        else:
+            open(os.path.join(directory, name + ".py"), 'w').close()
+
+def _import_time_ms(module, env):
+    """ Returns the cumulative import time (ms) of a module in a fresh interpreter & every module it loaded """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env,
+                            capture_output=True, text=True, check=True).stderr
+    cumulative, loaded = None, set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if not cumulative_us.strip().isdigit():
+            continue # Header line
+        loaded.add(name.strip())
+        if name.strip() == module:
+            cumulative = int(cumulative_us) / 1000
+    return cumulative, loaded
+
+def forbidden_imports(loaded, forbidden):
+    """ Returns the forbidden packages (or their submodules) among the loaded module names """
+    return sorted(name for name in forbidden if any(module == name or module.startswith(name + ".") for module in loaded))
+
+@benchmark("import_time")
+def bench_import_time(iterations, runs=15):
+    """ Cold import time of the daemon, GUI & CLI entry points against their budgets (best of several fresh interpreters) """
+    stubs_dir = os.path.abspath("import_stubs")
+    os.makedirs(stubs_dir, exist_ok=True)
+    _write_import_stubs(stubs_dir)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([stubs_dir, REPO_DIR]))
+    results = {}
+    for entry, module, budget, forbidden in (("daemon", "process", DAEMON_IMPORT_BUDGET_MS, DAEMON_IMPORT_FORBIDDEN),
+                                             ("gui", "settings", GUI_IMPORT_BUDGET_MS, GUI_IMPORT_FORBIDDEN),
+                                             ("cli", "cli", CLI_IMPORT_BUDGET_MS, CLI_IMPORT_FORBIDDEN)):
+        times, loaded = [], set()
+        for _ in range(min(iterations, runs)):
+            cumulative, loaded = _import_time_ms(module, env)
+            times.append(cumulative)
+        results[entry] = {
+            "module": module, "best_ms": min(times), "median_ms": sorted(times)[len(times) // 2], "budget_ms": budget,
+            "modules_loaded": len(loaded), "forbidden_loaded": forbidden_imports(loaded, forbidden),
+        }
+        results[entry]["within_budget"] = min(times) <= budget and not results[entry]["forbidden_loaded"]
+    return results
+
+def over_budget(results, path=()):
+    """ Returns the paths of the results that report within_budget: false """
+    failures = []
+    if isinstance(results, dict):
+        if results.get("within_budget") is False:
+            failures.append("/".join(path))
+        for key, value in results.items():
+            failures.extend(over_budget(value, path + (key,)))
+    return failures
+
+def run(names, iterations):
+    """ Runs the named benchmarks & returns the machine-readable report """
+    report = {"python": platform.python_version(), "platform": platform.platform(), "iterations": iterations, "results": {}}
+    for name in names:
+        report["results"][name] = BENCHMARKS[name](iterations)
+    return report
+
+if __name__ == "__main__":
+    """ Entry point for running the benchmarks & printing (or saving) the JSON report """
+    parser = argparse.ArgumentParser(description="Battery Notifier benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory(prefix="battery_notifier_bench_") as workdir:
+        _setup(workdir)
+        report = run(args.names or list(BENCHMARKS), args.iterations)
+        os.chdir(REPO_DIR)
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    failures = over_budget(report["results"])
+    if failures:
+        sys.exit(f"Over budget: {', '.join(failures)}")
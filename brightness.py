@@ -0,0 +1,164 @@
+# /brightness.py
+
+import os
+import sys
+import threading
+import time
+
+import com
+
+# Kernel backlight class directory on Linux
+SYSFS_BACKLIGHT = "/sys/class/backlight"
+# Seconds a read brightness level is trusted before asking the backend again
+BRIGHTNESS_CACHE_SECONDS = 2
+
+class WmiBrightnessBackend:
+    """ Reads & sets the display brightness through the Windows WMI monitor classes
+        COM objects belong to the apartment of the thread that created them, so every thread connects & uses its own """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connect(self):
+        import wmi
+        service = wmi.WMI(namespace='wmi')
+        self._local.service, self._local.methods = service, service.WmiMonitorBrightnessMethods()[0]
+
+    def reset(self):
+        self._local.service = self._local.methods = None
+
+    def get(self):
+        return self._local.service.WmiMonitorBrightness()[0].CurrentBrightness
+
+    def set(self, level):
+        self._local.methods.WmiSetBrightness(level, 0)
+
+class SysfsBacklightBackend:
+    """ Reads & sets the display brightness through /sys/class/backlight (needs write access to set) """
+
+    def __init__(self, root=SYSFS_BACKLIGHT):
+        self.root = root
+        self._path = None
+        self._max_brightness = None
+
+    def connect(self):
+        devices = sorted(os.listdir(self.root))
+        if not devices:
+            raise OSError(f"No backlight device found in {self.root}")
+        self._path = os.path.join(self.root, devices[0])
+        with open(os.path.join(self._path, "max_brightness"), 'r') as file:
+            self._max_brightness = int(file.read())
+
+    def reset(self):
+        self._path = self._max_brightness = None
+
+    def get(self):
+        with open(os.path.join(self._path, "brightness"), 'r') as file:
+            return round(int(file.read()) * 100 / self._max_brightness)
+
+    def set(self, level):
+        with open(os.path.join(self._path, "brightness"), 'w') as file:
+            file.write(str(round(level * self._max_brightness / 100)))
+
+class FakeBrightnessBackend:
+    """ In-memory backend that counts calls & can be told to fail, for tests """
+
+    def __init__(self, level=50):
+        self.level = level
+        self.connected = False
+        self.calls = {"connect": 0, "get": 0, "set": 0}
+        self.failures = 0 # Number of upcoming get/set calls that raise
+
+    def connect(self):
+        self.calls["connect"] += 1
+        self.connected = True
+
+    def reset(self):
+        self.connected = False
+
+    def _check(self):
+        if not self.connected:
+            raise RuntimeError("Not connected")
+        if self.failures:
+            self.failures -= 1
+            self.connected = False
+            raise RuntimeError("Connection lost")
+
+    def get(self):
+        self.calls["get"] += 1
+        self._check()
+        return self.level
+
+    def set(self, level):
+        self.calls["set"] += 1
+        self._check()
+        self.level = level
+
+class BrightnessController:
+    """ Keeps a backend connection per calling thread & the last known level, reconnecting on failure & skipping redundant sets """
+
+    def __init__(self, backend, clock=time.monotonic):
+        self.backend = backend
+        self.clock = clock
+        self.level = None # Last known brightness level (0-100)
+        self._level_time = None
+        self._local = threading.local() # .connected: whether the backend was connected on this thread
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args):
+        """ Calls a backend method, connecting on first use from this thread & reconnecting & retrying once if it fails """
+        if not getattr(self._local, "connected", False):
+            self.backend.connect()
+            self._local.connected = True
+        try:
+            return method(*args)
+        except Exception:
+            self.backend.reset()
+            self._local.connected = False
+            self.backend.connect()
+            self._local.connected = True
+            return method(*args)
+
+    def get(self, refresh=False):
+        """ Returns the brightness level, from cache unless it is older than BRIGHTNESS_CACHE_SECONDS """
+        with self._lock:
+            now = self.clock()
+            if refresh or self.level is None or now - self._level_time > BRIGHTNESS_CACHE_SECONDS:
+                self.level = self._call(self.backend.get)
+                self._level_time = now
+            return self.level
+
+    def set(self, level):
+        """ Sets the brightness level unless it is already at that level """
+        with self._lock:
+            if level == self.level and self.clock() - self._level_time <= BRIGHTNESS_CACHE_SECONDS:
+                return
+            self._call(self.backend.set, level)
+            self.level, self._level_time = level, self.clock()
+
+    def invalidate(self):
+        """ Forgets the cached level so the next get asks the backend """
+        with self._lock:
+            self.level = None
+
+    def release(self):
+        """ Drops the calling thread's backend connection, before the thread uninitialises COM """
+        if getattr(self._local, "connected", False):
+            self.backend.reset()
+            self._local.connected = False
+
+_default_controller = None
+
+def release_thread():
+    if _default_controller is not None:
+        _default_controller.release()
+
+com.register_releaser(release_thread)
+
+def get_controller():
+    """ Returns the shared brightness controller for this platform """
+    global _default_controller
+    if _default_controller is None:
+        backend = WmiBrightnessBackend() if sys.platform == "win32" else SysfsBacklightBackend()
+        _default_controller = BrightnessController(backend)
+    return _default_controller
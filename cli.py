@@ -0,0 +1,135 @@
+# /cli.py
+
+import argparse
+import os
+import sys
+import time
+
+import control
+
+# Seconds `start` waits for the new daemon to answer
+START_TIMEOUT = 10
+
+def start():
+    """ Starts the monitoring daemon in the background unless it is already running """
+    if control.is_running():
+        return "Monitoring is already running."
+    import subprocess
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process.py")
+    if sys.platform == "win32":
+        subprocess.Popen([sys.executable, script_path], cwd=os.path.dirname(script_path), creationflags=subprocess.CREATE_NO_WINDOW)
+    else:
+        subprocess.Popen([sys.executable, script_path], cwd=os.path.dirname(script_path), start_new_session=True,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if control.is_running():
+            return "Monitoring started successfully."
+        time.sleep(0.1)
+    raise TimeoutError("Monitoring did not start in time, see logs/battery_monitoring.log")
+
+def status():
+    """ Returns a readable summary of the daemon's state """
+    try:
+        state = control.send_command("status")
+    except ConnectionError:
+        return not_running()
+    lines = [f"Monitoring is running (PID {state['pid']})."]
+    if state["percent"] is not None:
+        lines.append(f"Battery: {state['percent']}% ({'plugged in' if state['power_plugged'] else 'on battery'})")
+    if state["rate"]:
+        lines.append(f"Rate: {state['rate'] * 3600:+.1f}% per hour")
+    lines.append(f"Thresholds: {state['lower_threshold']}% - {state['higher_threshold']}%")
+    lines.append(f"Battery saver: {'on' if state['battery_saver_on'] else 'off'}")
+    if state["last_check"]:
+        lines.append(f"Last check: {time.time() - state['last_check']:.0f} seconds ago")
+    return "\n".join(lines)
+
+def not_running():
+    """ Explains why the daemon doesn't answer, using the heartbeat it last published """
+    import status_segment
+    snapshot = status_segment.StatusReader().read()
+    if snapshot is None or snapshot.state == "stopped":
+        return "Monitoring is not running."
+    if status_segment.is_alive(snapshot):
+        return f"Monitoring is running (PID {snapshot.pid}) but its control channel doesn't answer."
+    return f"Monitoring is not running, PID {snapshot.pid} stopped responding {time.time() - snapshot.heartbeat:.0f} seconds ago."
+
+def report(path):
+    """ Generates the battery health report (works without the daemon) """
+    import power_plan
+    path = os.path.abspath(path)
+    power_plan.get_manager().generate_report(path)
+    return f"Battery report has been saved to {path}"
+
+def health():
+    """ Returns a readable summary of the battery health (design vs full charge capacity & cycle count) """
+    import battery_report
+    report = battery_report.get_health_report()
+    if not report["batteries"]:
+        return "No battery found."
+    lines = []
+    for battery in report["batteries"]:
+        lines.append(f"{battery.get('name') or 'Battery'}:")
+        unit = battery["unit"]
+        if battery.get("design_capacity"):
+            lines.append(f"  Design capacity: {battery['design_capacity']:,} {unit}")
+        if battery.get("full_charge_capacity") is not None:
+            lines.append(f"  Full charge capacity: {battery['full_charge_capacity']:,} {unit}")
+        wear = battery_report.health(battery)
+        if wear is not None:
+            lines.append(f"  Health: {wear:.1f}%")
+        lines.append(f"  Cycle count: {battery['cycle_count'] if battery.get('cycle_count') is not None else 'unknown'}")
+    history = report["capacity_history"]
+    if len(history) > 1:
+        lines.append(f"Full charge capacity went from {history[0]['full_charge_capacity']:,} to {history[-1]['full_charge_capacity']:,} mWh "
+                     f"between {history[0]['period'].split(' - ')[0]} & {history[-1]['period'].split(' - ')[-1]}.")
+    return "\n".join(lines)
+
+def saver(state):
+    """ Switches battery saver on or off, through the daemon when it runs """
+    try:
+        return control.send_command("saver", state)
+    except ConnectionError:
+        import battery_utility
+        return battery_utility.enter_battery_saver() if state == "on" else battery_utility.leave_battery_saver()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Control the Battery Notifier monitoring daemon")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("start", help="start the monitoring process")
+    commands.add_parser("stop", help="stop the monitoring process")
+    commands.add_parser("status", help="show the monitoring & battery saver status")
+    commands.add_parser("reload", help="make the monitor re-read config.json")
+    report_parser = commands.add_parser("report", help="generate a battery health report")
+    report_parser.add_argument("path", nargs="?", default="battery_report.html")
+    commands.add_parser("metrics", help="print the daemon's metrics in the Prometheus text format")
+    commands.add_parser("health", help="show the battery's design vs full charge capacity & cycle count")
+    saver_parser = commands.add_parser("saver", help="turn battery saver mode on or off")
+    saver_parser.add_argument("state", choices=("on", "off"))
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "start":
+            print(start())
+        elif args.command == "stop":
+            print(control.send_command("stop"))
+        elif args.command == "status":
+            print(status())
+        elif args.command == "reload":
+            print(control.send_command("reload"))
+        elif args.command == "report":
+            print(report(args.path))
+        elif args.command == "metrics":
+            print(control.send_command("metrics"), end="")
+        elif args.command == "health":
+            print(health())
+        elif args.command == "saver":
+            print(saver(args.state))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    """ Entry point for the command line interface """
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# /collector.py
+
+import argparse
+import asyncio
+import concurrent.futures
+import gzip
+import hmac
+import http
+import io
+import json
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlsplit
+
+# Address the collector listens on
+COLLECTOR_HOST = "127.0.0.1"
+COLLECTOR_PORT = 8787
+# SQLite database of the fleet
+COLLECTOR_DB_PATH = "fleet.db"
+# Largest accepted request body, compressed & decompressed (bytes)
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_BATCH_BYTES = 32 * 1024 * 1024
+# Seconds a connection may stay idle between two requests
+KEEP_ALIVE_TIMEOUT = 30
+# Batches committed in one transaction at most, concurrent uploads are written together
+WRITE_BATCH_LIMIT = 1000
+# A device whose last report is older than this (seconds) isn't counted in queries about "now"
+DEVICE_STALE_SECONDS = 10 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device TEXT PRIMARY KEY, last_seen REAL, percent REAL, power_plugged INTEGER, rate REAL, saver_on INTEGER,
+    lower_threshold REAL, higher_threshold REAL
+);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices (last_seen);
+CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, device TEXT, received REAL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS samples (device TEXT, ts REAL, percent REAL, power_plugged INTEGER, rate REAL);
+CREATE INDEX IF NOT EXISTS samples_device_ts ON samples (device, ts);
+CREATE TABLE IF NOT EXISTS events (device TEXT, ts REAL, kind TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts);
+CREATE INDEX IF NOT EXISTS events_device_ts ON events (device, ts);
+"""
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_scalar(value):
+    """ Whether SQLite can store the value as it is (None, a bool, a number or a string) """
+    return value is None or isinstance(value, (bool, int, float, str))
+
+def validate_batch(batch):
+    """ Raises ValueError unless the batch has the shape & value types telemetry.TelemetryAgent sends """
+    if not isinstance(batch, dict) or not isinstance(batch.get("id"), str) or not isinstance(batch.get("device"), str):
+        raise ValueError("A batch needs an id & a device")
+    if not isinstance(batch.get("samples", []), list) or not isinstance(batch.get("events", []), list):
+        raise ValueError("samples & events must be lists")
+    for sample in batch.get("samples", []):
+        if not isinstance(sample, list) or len(sample) != 4:
+            raise ValueError("A sample is [timestamp, percent, power_plugged, rate]")
+        timestamp, percent, power_plugged, rate = sample
+        if not _is_number(timestamp) or not _is_number(percent) or not isinstance(power_plugged, (bool, type(None))) \
+                or not (rate is None or _is_number(rate)):
+            raise ValueError(f"Invalid sample values: {sample!r}")
+    for event in batch.get("events", []):
+        if not isinstance(event, dict) or "ts" not in event or "kind" not in event:
+            raise ValueError("An event needs ts & kind")
+        if not _is_number(event["ts"]) or not isinstance(event["kind"], str):
+            raise ValueError(f"An event's ts must be a number & its kind a string: {event!r}")
+    state = batch.get("state")
+    if state is not None:
+        if not isinstance(state, dict):
+            raise ValueError("state must be an object")
+        if not all(_is_scalar(value) for value in state.values()) or ("ts" in state and not _is_number(state["ts"])):
+            raise ValueError(f"Invalid state values: {state!r}")
+
+class FleetStore:
+    """ SQLite store of the devices' latest state, their samples & events, used from one thread at a time """
+
+    def __init__(self, path=COLLECTOR_DB_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # WAL keeps the database consistent, a power cut may lose the last commits
+        self.connection.executescript(SCHEMA)
+
+    def write(self, batches):
+        """ Stores the batches in one transaction, each under its own savepoint so a batch that fails only undoes itself
+            Returns an outcome per batch: True if stored, False if already stored (a retried upload), or the error it failed with """
+        outcomes = []
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN") # Explicit, a savepoint outside a transaction would commit on release
+            for batch in batches:
+                self.connection.execute("SAVEPOINT batch")
+                try:
+                    outcomes.append(self._write_batch(batch, now))
+                except (sqlite3.Error, OverflowError) as e: # OverflowError: an integer beyond SQLite's 64 bits
+                    self.connection.execute("ROLLBACK TO batch")
+                    outcomes.append(e)
+                self.connection.execute("RELEASE batch")
+        return outcomes
+
+    def _write_batch(self, batch, now):
+        if self.connection.execute("INSERT OR IGNORE INTO batches VALUES (?, ?, ?)", (batch["id"], batch["device"], now)).rowcount == 0:
+            return False
+        device = batch["device"]
+        self.connection.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?)",
+                                    [(device, ts, percent, plugged, rate) for ts, percent, plugged, rate in batch.get("samples", [])])
+        self.connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?)",
+                                    [(device, event["ts"], event["kind"], json.dumps({key: value for key, value in event.items() if key not in ("ts", "kind")}))
+                                     for event in batch.get("events", [])])
+        state = batch.get("state")
+        if state:
+            # Batches of a device can arrive out of order after retries, only a newer state replaces the stored one
+            self.connection.execute(
+                "INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (device) DO UPDATE SET "
+                "last_seen = excluded.last_seen, percent = excluded.percent, power_plugged = excluded.power_plugged, rate = excluded.rate, "
+                "saver_on = excluded.saver_on, lower_threshold = excluded.lower_threshold, higher_threshold = excluded.higher_threshold "
+                "WHERE excluded.last_seen >= devices.last_seen",
+                (device, state.get("ts"), state.get("percent"), state.get("power_plugged"), state.get("rate"), state.get("saver_on"),
+                 state.get("lower_threshold"), state.get("higher_threshold")))
+        return True
+
+    def _rows(self, query, parameters=()):
+        cursor = self.connection.execute(query, parameters)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def devices(self):
+        return self._rows("SELECT * FROM devices ORDER BY device")
+
+    def below_threshold(self, now=None, stale_seconds=DEVICE_STALE_SECONDS):
+        """ Devices on battery at or below their lower threshold, going by their last report if it is recent """
+        now = time.time() if now is None else now
+        return self._rows("SELECT * FROM devices WHERE last_seen >= ? AND NOT power_plugged AND percent <= lower_threshold ORDER BY percent",
+                          (now - stale_seconds,))
+
+    def events(self, kind=None, since=None, device=None, limit=100):
+        """ Latest events, optionally of one kind, since a time or of one device """
+        conditions, parameters = [], []
+        for column, operator, value in (("kind", "=", kind), ("ts", ">=", since), ("device", "=", device)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._rows(f"SELECT * FROM events {where} ORDER BY ts DESC LIMIT ?", (*parameters, limit))
+        for row in rows:
+            row.update(json.loads(row.pop("data")))
+        return rows
+
+    def counts(self):
+        return {table: self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("devices", "batches", "samples", "events")}
+
+    def close(self):
+        self.connection.close()
+
+class Collector:
+    """ Receives telemetry batches over HTTP from many agents at once & answers fleet queries, on one asyncio event loop
+        Uploads are acknowledged once committed, the store is used from a single thread that commits concurrent uploads together """
+
+    def __init__(self, store, host=COLLECTOR_HOST, port=COLLECTOR_PORT, token=None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.token = token
+        self.stats = {"requests": 0, "batches": 0, "duplicates": 0, "rejected": 0, "commits": 0}
+        self._server = None
+        self._queue = None
+        self._writer = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="FleetStore")
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.get_running_loop().create_task(self._write_batches())
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1] # The actual port when 0 was given
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._writer.cancel()
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _store(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _write_batches(self):
+        """ Commits the queued batches, everything that queued up during a commit goes into the next one """
+        while True:
+            pending = [await self._queue.get()]
+            while len(pending) < WRITE_BATCH_LIMIT and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            try:
+                outcomes = await self._store(self.store.write, [batch for batch, _ in pending])
+            except Exception as e:
+                for _, done in pending:
+                    if not done.done():
+                        done.set_exception(e)
+                continue
+            self.stats["commits"] += 1
+            for (_, done), outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    # Only this batch's values could be at fault, the batches committed with it were stored
+                    self.stats["rejected"] += 1
+                    if not done.done():
+                        done.set_exception(ValueError(f"Invalid batch: {outcome}"))
+                    continue
+                self.stats["batches" if outcome else "duplicates"] += 1
+                if not done.done():
+                    done.set_result(True)
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "Body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                self.stats["requests"] += 1
+                status, payload = await self._route(method, target, headers, body)
+                keep_alive = version.strip().upper() == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass # Client went away or sent garbage
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, close=False):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _route(self, method, target, headers, body):
+        # Constant time comparison, so the response time doesn't reveal how much of a guessed token was right
+        if self.token and not hmac.compare_digest(headers.get("authorization", "").encode("latin-1"), f"Bearer {self.token}".encode()):
+            return 401, {"error": "Missing or wrong token"}
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if method == "POST" and url.path == "/ingest":
+                return await self._ingest(headers, body)
+            if method == "GET" and url.path == "/devices":
+                return 200, await self._store(self.store.devices)
+            if method == "GET" and url.path == "/devices/below-threshold":
+                return 200, await self._store(self.store.below_threshold)
+            if method == "GET" and url.path == "/events":
+                since = float(query["since"]) if "since" in query else None
+                return 200, await self._store(self.store.events, query.get("kind"), since, query.get("device"), int(query.get("limit", 100)))
+            if method == "GET" and url.path == "/health":
+                return 200, dict(self.stats, queued=self._queue.qsize())
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        return 404, {"error": f"No route for {method} {url.path}"}
+
+    async def _ingest(self, headers, body):
+        try:
+            if headers.get("content-encoding", "").lower() == "gzip":
+                body = gzip.GzipFile(fileobj=io.BytesIO(body)).read(MAX_BATCH_BYTES + 1) # Bounded, a small body can inflate to gigabytes
+                if len(body) > MAX_BATCH_BYTES:
+                    raise ValueError("Batch too large")
+            batch = json.loads(body)
+            validate_batch(batch)
+        except (OSError, EOFError, ValueError) as e:
+            self.stats["rejected"] += 1
+            return 400, {"error": f"Invalid batch: {e}"}
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((batch, done))
+        await done
+        return 200, {"stored": batch["id"]}
+
+def _print_rows(rows):
+    for row in rows:
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    """ Entry point for running the fleet collector or querying its database """
+    parser = argparse.ArgumentParser(description="Battery Notifier fleet telemetry collector")
+    parser.add_argument("--db", default=COLLECTOR_DB_PATH, help="SQLite database (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="receive batches from the agents")
+    serve_parser.add_argument("--host", default=COLLECTOR_HOST)
+    serve_parser.add_argument("--port", type=int, default=COLLECTOR_PORT)
+    serve_parser.add_argument("--token", help="shared token the agents must send")
+    commands.add_parser("below", help="devices on battery at or below their lower threshold now")
+    commands.add_parser("devices", help="latest state of every device")
+    events_parser = commands.add_parser("events", help="latest events")
+    events_parser.add_argument("--kind")
+    events_parser.add_argument("--device")
+    events_parser.add_argument("--since", type=float, help="unix time")
+    events_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    store = FleetStore(args.db)
+    if args.command == "serve":
+        try:
+            asyncio.run(Collector(store, args.host, args.port, args.token).serve_forever())
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "below":
+        _print_rows(store.below_threshold())
+    elif args.command == "devices":
+        _print_rows(store.devices())
+    else:
+        _print_rows(store.events(args.kind, args.since, args.device, args.limit))
+    store.close()
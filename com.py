@@ -0,0 +1,31 @@
+# /com.py
+
+import sys
+
+# Functions called on a thread before it uninitialises COM, releasing the COM objects the thread still holds
+_releasers = []
+
+def initialize():
+    """ Initialises COM on the calling thread, WMI & WScript.Shell fail on threads without it (no-op off Windows) """
+    if sys.platform == "win32":
+        import pythoncom
+        pythoncom.CoInitialize()
+
+def uninitialize():
+    """ Releases the thread's COM objects & uninitialises COM on it, objects released afterwards would crash the thread """
+    for release in _releasers:
+        release()
+    if sys.platform == "win32":
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+def register_releaser(release):
+    _releasers.append(release)
+
+def run_initialized(target, *args, **kwargs):
+    """ Runs a thread's target with COM initialised on the thread for the whole run """
+    initialize()
+    try:
+        return target(*args, **kwargs)
+    finally:
+        uninitialize()
@@ -0,0 +1,191 @@
+# /config_store.py
+
+import atexit
+import contextlib
+import os
+import json
+import sys
+import threading
+import time
+
+from logger import log_error
+
+# File path for the config file
+CONFIG_FILE_PATH = "./config.json"
+# Seconds update_config collects a burst of updates before writing them in one go
+CONFIG_WRITE_DELAY = 0.5
+# Attempts at renaming the new config over the old one, Windows refuses while another process has the file open
+CONFIG_REPLACE_RETRIES = 50
+CONFIG_REPLACE_WAIT = 0.01
+
+# Parsed config & the (mtime, size, inode) stamp of the file it was parsed from
+_cache = {"stamp": None, "config": None}
+# Config path -> fields waiting for the debounced write, & the timers that will write them
+_pending = {}
+_timers = {}
+# Serialises the writers of this process, the file lock only excludes other processes reliably
+_write_lock = threading.RLock()
+
+def _file_stamp(path):
+    """ Returns a cheap change stamp for the file, or None if it doesn't exist
+        The inode tells apart two writes of the same size within the file system's mtime resolution, each write is a new file """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def default_config():
+    """ Builds the default configuration (queries the live power plan & brightness) """
+    import battery_utility
+    return {
+        "lower_threshold": 20,
+        "higher_threshold": 80,
+        "startup": False,
+        "dark_mode": False,
+        "battery_saver_on": battery_utility.is_battery_saver_on(),
+        "current_brightness": battery_utility.get_brightness()
+    }
+
+def _read_config_file(path):
+    """ Reads & parses the config file, raising if it is missing, empty or invalid """
+    with open(path, 'r') as config_file:
+        content = config_file.read().strip()
+    if not content:
+        raise ValueError("Config file is empty")
+    return json.loads(content)
+
+def load_config(path=CONFIG_FILE_PATH):
+    """ Returns the user configuration, re-parsing the file only when it has changed
+        Updates of this process that are still waiting for their debounced write are included """
+    stamp = _file_stamp(path)
+    config = None
+    if stamp is None or stamp != _cache["stamp"]:
+        try:
+            if stamp is None:
+                raise FileNotFoundError(f"Config file not found: {path}")
+            config = _read_config_file(path)
+        except Exception as e:
+            # Defaults are only computed here as they spawn powercfg & query WMI
+            import dialogs
+            dialogs.show_error("Error", f"Failed to load configuration file. Resetting to defaults...\nError: {e}")
+            config = default_config()
+            try:
+                save_config(config, path)
+            except Exception as save_error:
+                # The defaults are used as they are, the cache may hold nothing (yet) & the next call tries again
+                log_error(f"Failed to save default configuration: {save_error}", "config_store.py")
+        else:
+            _cache["stamp"], _cache["config"] = stamp, config
+    config = dict(config if config is not None else _cache["config"])
+    pending = _pending.get(path)
+    if pending:
+        config.update(pending)
+    return config
+
+@contextlib.contextmanager
+def config_lock(path=CONFIG_FILE_PATH):
+    """ Holds the config's cross-process lock, a sidecar .lock file as the config itself is replaced on every write """
+    with _write_lock, open(path + ".lock", 'a+b') as lock_file:
+        if sys.platform == "win32":
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass # LK_LOCK gives up after 10 seconds, keep waiting for the other writer
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _write_atomic(config, path):
+    """ Writes the config to a temporary file & renames it over the old one, so readers see either file but never a partial one """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, 'w') as config_file:
+            json.dump(config, config_file, indent=4)
+            config_file.flush()
+            os.fsync(config_file.fileno())
+        for attempt in range(CONFIG_REPLACE_RETRIES):
+            try:
+                os.replace(temporary_path, path)
+                break
+            except PermissionError:
+                if attempt == CONFIG_REPLACE_RETRIES - 1:
+                    raise
+                time.sleep(CONFIG_REPLACE_WAIT)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary_path)
+        raise
+    _cache["stamp"], _cache["config"] = _file_stamp(path), dict(config)
+
+def save_config(config, path=CONFIG_FILE_PATH):
+    """ Replaces the whole saved configuration (use update_config to change some fields) """
+    with config_lock(path):
+        _write_atomic(config, path)
+
+def update_config(updates, path=CONFIG_FILE_PATH, delay=CONFIG_WRITE_DELAY):
+    """ Merges the given fields into the saved configuration, updates within delay seconds of each other are written together
+        With delay=0 the fields (& any waiting ones) are written before returning """
+    with _write_lock:
+        _pending.setdefault(path, {}).update(updates)
+        if delay > 0:
+            if path not in _timers:
+                timer = threading.Timer(delay, _flush_later, (path,))
+                timer.daemon = True
+                _timers[path] = timer
+                timer.start()
+            return
+    flush_config(path)
+
+def _flush_later(path):
+    try:
+        flush_config(path)
+    except Exception as e:
+        log_error(f"Failed to save configuration: {e}", "config_store.py")
+
+def flush_config(path=None):
+    """ Writes the waiting updates of the given config (all of them by default) now, merged into the file's latest content """
+    with _write_lock:
+        for config_path in ([path] if path is not None else list(_pending)):
+            timer = _timers.pop(config_path, None)
+            if timer is not None:
+                timer.cancel()
+            updates = _pending.get(config_path)
+            if not updates:
+                continue
+            defaults = None
+            while True:
+                with config_lock(config_path):
+                    # Re-read under the lock, another process may have written since this one last loaded the config
+                    try:
+                        config = _read_config_file(config_path)
+                    except (OSError, ValueError):
+                        config = dict(defaults) if defaults is not None else None
+                    if config is not None:
+                        config.update(updates)
+                        _write_atomic(config, config_path)
+                        break
+                # Defaults spawn powercfg & query WMI, so they are built without holding up the other processes' writers
+                defaults = default_config()
+            # Only dropped once written, so a failed write is retried by the next flush
+            del _pending[config_path]
+
+def invalidate():
+    """ Forces the next load_config call to re-read the config file """
+    _cache["stamp"] = None
+
+# Waiting updates are written before the interpreter exits
+atexit.register(_flush_later, None)
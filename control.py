@@ -0,0 +1,161 @@
+# /control.py
+
+import os
+import sys
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import com
+import runtime
+
+# Local control channel of the monitoring daemon: a named pipe on Windows, a Unix domain socket in the user's runtime directory elsewhere
+if sys.platform == "win32":
+    CONTROL_ADDRESS = r"\\.\pipe\battery-notifier-" + os.environ.get("USERNAME", "user")
+else:
+    CONTROL_ADDRESS = os.path.join(runtime.RUNTIME_DIR, "control.sock")
+# Per-user secret both ends authenticate with, created by the daemon
+CONTROL_KEY_PATH = os.path.join(runtime.RUNTIME_DIR, "control.key")
+# Held by the serving daemon for as long as it runs, so a second one can't bind & a socket left behind is known to be stale
+CONTROL_LOCK_PATH = os.path.join(runtime.RUNTIME_DIR, "control.lock")
+# Seconds a client waits for the daemon to answer
+CONTROL_TIMEOUT = 5
+
+def _read_key():
+    descriptor = os.open(CONTROL_KEY_PATH, os.O_RDONLY | runtime.O_NOFOLLOW | getattr(os, "O_BINARY", 0))
+    with os.fdopen(descriptor, 'rb') as key_file:
+        return key_file.read()
+
+def _create_key():
+    """ Writes a fresh secret readable only by the current user into the private runtime directory """
+    runtime.ensure_runtime_dir(os.path.dirname(CONTROL_KEY_PATH))
+    key = os.urandom(32) # What secrets.token_bytes returns, without loading hmac & hashlib at import
+    with os.fdopen(runtime.create_private_file(CONTROL_KEY_PATH), 'wb') as key_file:
+        key_file.write(key)
+    return key
+
+def _try_lock(path):
+    """ Opens & exclusively locks the lock file without waiting, returns its descriptor or None if another process holds it
+        The OS drops the lock when its holder dies, unlike a PID file """
+    runtime.ensure_runtime_dir(os.path.dirname(path))
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT | runtime.O_NOFOLLOW | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            msvcrt.locking(descriptor, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        os.close(descriptor)
+        if isinstance(e, (BlockingIOError, PermissionError)): # Held by another process
+            return None
+        raise
+    return descriptor
+
+def _unlock(descriptor):
+    if sys.platform == "win32":
+        import msvcrt
+        os.lseek(descriptor, 0, os.SEEK_SET)
+        msvcrt.locking(descriptor, msvcrt.LK_UNLCK, 1)
+    os.close(descriptor) # Releases the flock
+
+class ControlServer:
+    """ Serves {"command", "args"} requests from local clients on a background thread """
+
+    def __init__(self, handlers, address=CONTROL_ADDRESS, lock_path=CONTROL_LOCK_PATH):
+        self.handlers = dict(handlers, ping=lambda: "pong") # command name -> function(*args) returning a picklable result
+        self.address = address
+        self.lock_path = lock_path
+        self._lock = None
+        self._listener = None
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """ Starts listening, taking over a socket left behind by a daemon that died """
+        self._lock = _try_lock(self.lock_path)
+        if self._lock is None:
+            raise RuntimeError("Monitoring is already running.")
+        try:
+            key = _create_key()
+            if sys.platform != "win32":
+                # Whoever bound the socket held the lock, so nothing serves on it any more
+                try:
+                    os.unlink(self.address)
+                except FileNotFoundError:
+                    pass
+            self._listener = Listener(self.address, authkey=key)
+        except BaseException:
+            _unlock(self._lock)
+            self._lock = None
+            raise
+        # Commands such as saver switch plans & dim the screen through WMI, which needs COM on the serving thread
+        self._thread = threading.Thread(target=com.run_initialized, args=(self._serve,), name="ControlServer", daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except Exception:
+                if self._stopping:
+                    return
+                continue # Failed authentication or a client that went away
+            if self._stopping:
+                connection.close()
+                return
+            with connection:
+                try:
+                    request = connection.recv()
+                    handler = self.handlers.get(request.get("command"))
+                    if handler is None:
+                        response = {"ok": False, "error": f"Unknown command: {request.get('command')}"}
+                    else:
+                        response = {"ok": True, "result": handler(*request.get("args", ()))}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                try:
+                    connection.send(response)
+                except OSError:
+                    pass
+
+    def stop(self):
+        """ Stops accepting requests & removes the socket """
+        if self._listener is None:
+            return
+        self._stopping = True
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # Wake up the blocking accept() with a last connection
+            try:
+                Client(self.address, authkey=_read_key()).close()
+            except Exception:
+                pass
+            self._thread.join(CONTROL_TIMEOUT)
+        self._listener.close()
+        self._listener = None
+        _unlock(self._lock) # Only once the socket is gone, the next daemon takes over a clean address
+        self._lock = None
+
+def send_command(command, *args, address=CONTROL_ADDRESS, timeout=CONTROL_TIMEOUT):
+    """ Sends a command to the daemon & returns its result, raises ConnectionError if no daemon is listening """
+    try:
+        connection = Client(address, authkey=_read_key())
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ConnectionError("Monitoring is not running.") from e
+    with connection:
+        connection.send({"command": command, "args": args})
+        if not connection.poll(timeout):
+            raise TimeoutError(f"No answer to '{command}' within {timeout} seconds.")
+        response = connection.recv()
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+def is_running(address=CONTROL_ADDRESS):
+    """ Whether a daemon answers on the control channel (a listener that doesn't know our key is not our daemon) """
+    try:
+        send_command("ping", address=address)
+        return True
+    except (ConnectionError, OSError, EOFError, AuthenticationError):
+        return False
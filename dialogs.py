@@ -0,0 +1,18 @@
+# /dialogs.py
+
+def _messagebox():
+    """ Imports tkinter's message boxes on first use, so modules that may show one don't load Tk up front """
+    from tkinter import messagebox
+    return messagebox
+
+def show_info(title, message):
+    """ Shows an information message box """
+    _messagebox().showinfo(title, message)
+
+def show_warning(title, message):
+    """ Shows a warning message box """
+    _messagebox().showwarning(title, message)
+
+def show_error(title, message):
+    """ Shows an error message box """
+    _messagebox().showerror(title, message)
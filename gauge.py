@@ -0,0 +1,153 @@
+# /gauge.py
+
+import collections
+import threading
+import time
+
+import history
+import sensors
+import status_segment
+from logger import log_error
+
+# Seconds between battery reads on the reader thread
+GAUGE_READ_INTERVAL = 2
+# Milliseconds between checks for a new reading on the Tk thread
+GAUGE_REFRESH_MS = 500
+# Number of recent samples drawn in the sparkline
+SPARKLINE_SAMPLES = 120
+# The daemon's recorded history is only used for the sparkline while its last sample is this recent (seconds)
+SPARKLINE_STALE_SECONDS = 90
+
+class BatteryReader:
+    """ Reads the battery & recent history on a background thread, so the Tk thread never blocks on the sensor or the disk
+        While the daemon is alive its published status is used instead of reading the sensor """
+
+    def __init__(self, sensor=None, history_log=None, status=None, interval=GAUGE_READ_INTERVAL, samples=SPARKLINE_SAMPLES, clock=time.time):
+        self.sensor = sensor
+        self.history_log = history_log or history.HistoryLog()
+        self.status = status or status_segment.StatusReader()
+        self.interval = interval
+        self.clock = clock
+        self._readings = collections.deque(maxlen=samples) # Own readings, used while the daemon isn't recording
+        self._lock = threading.Lock()
+        self._latest = (0, None, (), False) # (version, reading, sparkline percents, whether the daemon is alive)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="BatteryReader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.interval)
+
+    def poll(self):
+        """ Takes one reading & publishes it together with the sparkline samples """
+        snapshot = self.status.read()
+        monitoring = status_segment.is_alive(snapshot, self.clock())
+        if monitoring and snapshot.percent is not None:
+            reading = sensors.BatteryReading(snapshot.percent, snapshot.power_plugged, None, None, None)
+        else:
+            try:
+                if self.sensor is None:
+                    self.sensor = sensors.get_sensor()
+                reading = self.sensor.read()
+            except Exception as e:
+                log_error(f"Failed to read the battery for the gauge: {e}", "gauge.py")
+                reading = None
+        if reading is not None:
+            self._readings.append(reading.percent)
+        recorded = self.history_log.latest(self._readings.maxlen)
+        if recorded and self.clock() - recorded[-1].timestamp <= SPARKLINE_STALE_SECONDS:
+            trend = tuple(sample.percent for sample in recorded)
+        else:
+            trend = tuple(self._readings)
+        with self._lock:
+            self._latest = (self._latest[0] + 1, reading, trend, monitoring)
+
+    def latest(self):
+        """ Returns (version, reading, sparkline percents, daemon alive), the version changes with every poll """
+        with self._lock:
+            return self._latest
+
+class BatteryGauge:
+    """ Battery level bar & sparkline on a canvas, items are created once & only moved or recoloured when the reading changes """
+
+    def __init__(self, canvas, reader, status_label=None, width=210, height=30, sparkline_height=20, refresh_ms=GAUGE_REFRESH_MS):
+        self.canvas = canvas
+        self.reader = reader
+        self.status_label = status_label # Optional label showing whether monitoring is running
+        self.width = width
+        self.height = height
+        self.sparkline_top = height + 10
+        self.sparkline_height = sparkline_height
+        self.refresh_ms = refresh_ms
+        self._version = None
+        self._shown = None # (percent, power_plugged, sparkline percents) currently drawn
+        self._monitoring = None
+        self._after_id = None
+        self._outline = canvas.create_rectangle(5, 5, width, height + 5)
+        self._fill = canvas.create_rectangle(5, 5, 5, height + 5, fill="green", width=0)
+        self._text = canvas.create_text(width / 2 + 5, height / 2 + 5, text="...")
+        self._sparkline = canvas.create_line(0, 0, 0, 0, fill="green", state="hidden")
+        self.apply_theme()
+
+    def start(self):
+        """ Starts the reader & the refresh loop on the Tk thread """
+        self.reader.start()
+        self._refresh()
+
+    def stop(self):
+        if self._after_id is not None:
+            self.canvas.after_cancel(self._after_id)
+            self._after_id = None
+        self.reader.stop()
+
+    def _refresh(self):
+        version, reading, trend, monitoring = self.reader.latest()
+        if version != self._version:
+            self._version = version
+            if reading is not None:
+                self.show(reading.percent, reading.power_plugged, trend)
+            if self.status_label is not None and monitoring != self._monitoring:
+                self._monitoring = monitoring
+                self.status_label.config(text="Monitoring: on" if monitoring else "Monitoring: off")
+        self._after_id = self.canvas.after(self.refresh_ms, self._refresh)
+
+    def show(self, percent, power_plugged, trend=()):
+        """ Draws the reading, leaving the canvas untouched when nothing visible changed """
+        percent = round(percent)
+        shown = (percent, power_plugged, trend)
+        if shown == self._shown:
+            return
+        previous = self._shown or (None, None, None)
+        self._shown = shown
+        if (percent, power_plugged) != previous[:2]:
+            self.canvas.coords(self._fill, 5, 5, 5 + (percent / 100) * (self.width - 5), self.height + 5)
+            self.canvas.itemconfig(self._text, text=f"{percent}% (plugged in)" if power_plugged else f"{percent}%")
+        if trend != previous[2]:
+            self._draw_sparkline(trend)
+
+    def _draw_sparkline(self, trend):
+        if len(trend) < 2:
+            self.canvas.itemconfig(self._sparkline, state="hidden")
+            return
+        step = (self.width - 5) / (len(trend) - 1)
+        bottom = self.sparkline_top + self.sparkline_height
+        points = []
+        for index, percent in enumerate(trend):
+            points += (5 + index * step, bottom - (percent / 100) * self.sparkline_height)
+        self.canvas.coords(self._sparkline, *points)
+        self.canvas.itemconfig(self._sparkline, state="normal")
+
+    def apply_theme(self):
+        """ Matches the outline & text colours to the canvas background (after a dark mode toggle) """
+        color = "white" if self.canvas["bg"] == "black" else "black"
+        self.canvas.itemconfig(self._outline, outline=color)
+        self.canvas.itemconfig(self._text, fill=color)
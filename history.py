@@ -0,0 +1,156 @@
+# /history.py
+
+import math
+import mmap
+import os
+import struct
+from array import array
+from collections import namedtuple
+
+from logger import LOG_DIR
+
+# Append-only battery history file
+HISTORY_PATH = os.path.join(LOG_DIR, "battery_history.bin")
+# Number of samples kept in memory
+RING_CAPACITY = 4096
+# On-disk record: uint32 unix time, uint16 tenths of a percent with the plugged flag in the top bit,
+# int16 rate in hundredths of a percent per hour (8 bytes, ~21 MB per month of 1 Hz samples)
+RECORD = struct.Struct("<IHh")
+RECORD_SIZE = RECORD.size
+PLUGGED_FLAG = 0x8000
+NO_RATE = -32768
+
+# A decoded history sample, rate is in % per second (None if unknown)
+Sample = namedtuple("Sample", ["timestamp", "percent", "power_plugged", "rate"])
+
+def encode(timestamp, percent, power_plugged, rate=None):
+    """ Packs a sample into a fixed-width record """
+    level = round(percent * 10) | (PLUGGED_FLAG if power_plugged else 0)
+    if rate is None:
+        packed_rate = NO_RATE
+    else:
+        packed_rate = max(NO_RATE + 1, min(32767, round(rate * 3600 * 100)))
+    return RECORD.pack(int(timestamp), level, packed_rate)
+
+def decode(buffer, offset=0):
+    """ Unpacks the record at the given offset """
+    timestamp, level, packed_rate = RECORD.unpack_from(buffer, offset)
+    rate = None if packed_rate == NO_RATE else packed_rate / 100 / 3600
+    return Sample(timestamp, (level & ~PLUGGED_FLAG) / 10, bool(level & PLUGGED_FLAG), rate)
+
+class RingBuffer:
+    """ Fixed-size in-memory sample history backed by typed arrays """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.percents = array('f', bytes(4 * capacity))
+        self.plugged = array('b', bytes(capacity))
+        self.rates = array('f', bytes(4 * capacity))
+        self.count = 0 # Total samples ever appended, the next slot is count % capacity
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, percent, power_plugged, rate=None):
+        """ Stores a sample, overwriting the oldest one when full """
+        slot = self.count % self.capacity
+        self.timestamps[slot] = timestamp
+        self.percents[slot] = percent
+        self.plugged[slot] = 1 if power_plugged else 0
+        self.rates[slot] = math.nan if rate is None else rate
+        self.count += 1
+
+    def latest(self, count=None):
+        """ Returns up to count of the most recent samples, oldest first """
+        size = len(self)
+        count = size if count is None else min(count, size)
+        samples = []
+        for index in range(self.count - count, self.count):
+            slot = index % self.capacity
+            rate = self.rates[slot]
+            samples.append(Sample(self.timestamps[slot], self.percents[slot], bool(self.plugged[slot]), None if math.isnan(rate) else rate))
+        return samples
+
+class HistoryLog:
+    """ Append-only file of fixed-width samples, read back through mmap """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self._file = None
+
+    def append(self, timestamp, percent, power_plugged, rate=None):
+        """ Appends one sample to the file with a single write """
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        self._file.write(encode(timestamp, percent, power_plugged, rate))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _map(self):
+        """ Returns a read-only map of the complete records in the file, or None if there are none """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        size -= size % RECORD_SIZE # Ignore a record that is still being written
+        if not size:
+            return None
+        with open(self.path, 'rb') as file:
+            return mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // RECORD_SIZE
+        except OSError:
+            return 0
+
+    def query(self, start=None, end=None):
+        """ Returns the samples with start <= timestamp < end, found by binary search on the mapped file """
+        mapped = self._map()
+        if mapped is None:
+            return []
+        with mapped:
+            count = len(mapped) // RECORD_SIZE
+            first = 0 if start is None else _bisect_timestamp(mapped, count, start)
+            last = count if end is None else _bisect_timestamp(mapped, count, end)
+            return [decode(mapped, index * RECORD_SIZE) for index in range(first, last)]
+
+    def latest(self, count):
+        """ Returns up to count of the most recent samples, oldest first """
+        mapped = self._map()
+        if mapped is None:
+            return []
+        with mapped:
+            total = len(mapped) // RECORD_SIZE
+            return [decode(mapped, index * RECORD_SIZE) for index in range(max(0, total - count), total)]
+
+def _bisect_timestamp(mapped, count, timestamp):
+    """ Returns the index of the first record with a timestamp >= the given one """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if struct.unpack_from("<I", mapped, middle * RECORD_SIZE)[0] < timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+class BatteryHistory:
+    """ Records every battery sample into the in-memory ring & the on-disk log """
+
+    def __init__(self, path=HISTORY_PATH, capacity=RING_CAPACITY):
+        self.ring = RingBuffer(capacity)
+        self.log = HistoryLog(path) if path else None
+
+    def record(self, timestamp, percent, power_plugged, rate=None):
+        self.ring.append(timestamp, percent, power_plugged, rate)
+        if self.log is not None:
+            self.log.append(timestamp, percent, power_plugged, rate)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,189 @@
+# /journal.py
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from logger import LOG_DIR
+
+# Directory holding the journal segments (events-<start ms>-<pid>.jsonl) & their time indexes (.idx)
+JOURNAL_DIR = os.path.join(LOG_DIR, "journal")
+# A segment is closed once it grows past this size or gets older than this age (seconds)
+SEGMENT_MAX_BYTES = 1024 * 1024
+SEGMENT_MAX_AGE = 24 * 60 * 60
+# Oldest segments are deleted beyond this count
+MAX_SEGMENTS = 60
+# Seconds of event time between two entries of a segment's time index
+INDEX_INTERVAL = 60
+
+# Event kinds
+PLUG = "plug"
+UNPLUG = "unplug"
+THRESHOLD_CROSSED = "threshold_crossed"
+SAVER_TOGGLED = "saver_toggled"
+ERROR = "error"
+EVENT_KINDS = (PLUG, UNPLUG, THRESHOLD_CROSSED, SAVER_TOGGLED, ERROR)
+
+class JournalHandler(logging.Handler):
+    """ Writes journal records as JSON lines into size/age rotated segments with a sparse time index """
+
+    def __init__(self, directory=JOURNAL_DIR):
+        super().__init__()
+        self.directory = directory
+        self._file = None
+        self._index_file = None
+        self._segment_start = None
+        self._last_indexed = None
+
+    def _open_segment(self, timestamp):
+        """ Closes the current segment, starts a new one & prunes the oldest ones """
+        self.close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"events-{int(timestamp * 1000)}-{os.getpid()}"
+        self._file = open(os.path.join(self.directory, name + ".jsonl"), 'ab')
+        self._index_file = open(os.path.join(self.directory, name + ".idx"), 'a')
+        self._segment_start, self._last_indexed = timestamp, None
+        for old_name in list_segments(self.directory)[:-MAX_SEGMENTS]:
+            for extension in (".jsonl", ".idx"):
+                try:
+                    os.remove(os.path.join(self.directory, old_name + extension))
+                except OSError:
+                    pass
+
+    def close_segment(self):
+        for file in (self._file, self._index_file):
+            if file is not None:
+                file.close()
+        self._file = self._index_file = None
+
+    def emit(self, record):
+        try:
+            timestamp = record.created
+            if (self._file is None or self._file.tell() >= SEGMENT_MAX_BYTES
+                    or timestamp - self._segment_start >= SEGMENT_MAX_AGE):
+                self._open_segment(timestamp)
+            offset = self._file.tell()
+            if self._last_indexed is None or timestamp - self._last_indexed >= INDEX_INTERVAL:
+                self._index_file.write(f"{timestamp} {offset}\n")
+                self._index_file.flush()
+                self._last_indexed = timestamp
+            event = {"ts": timestamp, "kind": record.msg}
+            event.update(getattr(record, "event", {}))
+            self._file.write(json.dumps(event, separators=(",", ":")).encode() + b"\n")
+            self._file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.close_segment()
+        super().close()
+
+# Events are queued by the caller & written by a background listener thread, started on first use
+_journal_queue = queue.SimpleQueue()
+_journal_logger = logging.getLogger("battery_notifier.journal")
+_journal_logger.propagate = False
+_journal_logger.setLevel(logging.INFO)
+_journal_listener = None
+# Serialises starting & stopping the listener, the first events can be recorded from several threads at once
+_journal_lock = threading.Lock()
+# Functions called with (kind, fields, timestamp) for every recorded event, e.g. by the telemetry agent
+_subscribers = []
+
+def _start():
+    global _journal_listener
+    with _journal_lock:
+        if _journal_listener is not None:
+            return # Another thread started it meanwhile
+        _journal_logger.addHandler(QueueHandler(_journal_queue))
+        listener = QueueListener(_journal_queue, JournalHandler())
+        listener.start()
+        _journal_listener = listener
+    atexit.register(stop)
+
+def record(kind, **fields):
+    """ Queues a structured event of the given kind, never blocking on disk I/O """
+    if _journal_listener is None:
+        _start()
+    _journal_logger.info(kind, extra={"event": fields})
+    for subscriber in _subscribers:
+        subscriber(kind, fields, time.time())
+
+def subscribe(callback):
+    """ Calls callback(kind, fields, timestamp) on the recording thread for every further event, it must not block """
+    _subscribers.append(callback)
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+def stop():
+    """ Writes out every queued event & stops the writer thread """
+    global _journal_listener
+    with _journal_lock:
+        if _journal_listener is not None:
+            _journal_listener.stop()
+            for handler in _journal_listener.handlers:
+                handler.close()
+            _journal_logger.handlers.clear()
+            _journal_listener = None
+
+def list_segments(directory=JOURNAL_DIR):
+    """ Returns the segment names (without extension) oldest first """
+    try:
+        names = [name[:-len(".jsonl")] for name in os.listdir(directory) if name.endswith(".jsonl")]
+    except OSError:
+        return []
+    return sorted(names, key=lambda name: int(name.split("-")[1]))
+
+def _seek_offset(index_path, start):
+    """ Returns the segment offset of the last index entry at or before start """
+    timestamps, offsets = [], []
+    try:
+        with open(index_path, 'r') as index_file:
+            for line in index_file:
+                timestamp, offset = line.split()
+                timestamps.append(float(timestamp))
+                offsets.append(int(offset))
+    except (OSError, ValueError):
+        return 0
+    position = bisect.bisect_right(timestamps, start) - 1
+    return offsets[position] if position >= 0 else 0
+
+def query(start=None, end=None, kinds=None, directory=JOURNAL_DIR):
+    """ Returns the events with start <= ts < end (optionally of the given kinds), reading only the segments & offsets that can hold them """
+    start = float("-inf") if start is None else start
+    end = float("inf") if end is None else end
+    events = []
+    # Every process writes its own segments, so segments can overlap in time
+    for name in list_segments(directory):
+        segment_path = os.path.join(directory, name + ".jsonl")
+        try:
+            last_write = os.path.getmtime(segment_path)
+        except OSError:
+            continue
+        if int(name.split("-")[1]) / 1000 >= end or last_write < start:
+            continue
+        with open(segment_path, 'rb') as segment_file:
+            segment_file.seek(_seek_offset(os.path.join(directory, name + ".idx"), start))
+            for line in segment_file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue # Partially written line
+                if event["ts"] >= end:
+                    break
+                if event["ts"] >= start and (kinds is None or event["kind"] in kinds):
+                    events.append(event)
+    events.sort(key=lambda event: event["ts"])
+    return events
+
+if __name__ == "__main__":
+    """ Prints the journal events of the last day """
+    for event in query(time.time() - 24 * 60 * 60):
+        print(json.dumps(event))
@@ -1,49 +1,170 @@
 # /logger.py
 
+import atexit
 import logging
 import os
+import queue
 import re
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Define the log path and directory
 LOG_DIR = "./logs"
 LOG_PATH = os.path.join(LOG_DIR, "battery_monitoring.log")
+# Registry of the monitoring PIDs that were started & not yet stopped (one "pid caller" line each, newest last)
+PID_REGISTRY_PATH = os.path.join(LOG_DIR, "monitor.pids")
+# Number of PIDs kept in the registry
+PID_REGISTRY_SIZE = 10
+# Block size used when reading the log file backwards
+TAIL_BLOCK_SIZE = 64 * 1024
+# The log file is rotated once it grows past LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
 
 # Create the log directory if it doesn't exist
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
-# Configure logging
-logging.basicConfig(filename=LOG_PATH, level=logging.INFO, format='%(asctime)s - %(message)s')
+class SharedLogHandler(RotatingFileHandler):
+    """ Appends to the log file the GUI, CLI & monitoring processes share, only the process that owns rotation (the monitor) rotates it
+        The other processes open the file for each record instead of holding it, as Windows can't rename a file another process has open """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.rotating = False
+
+    def shouldRollover(self, record):
+        return self.rotating and super().shouldRollover(record)
+
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError:
+            pass # Another process is appending this very moment, the file is rotated with a later record
+
+    def emit(self, record):
+        super().emit(record)
+        if not self.rotating and self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+# Configure logging, records are queued by the caller & written to the shared log file by a background thread
+_log_queue = queue.SimpleQueue()
+_file_handler = SharedLogHandler(LOG_PATH)
+_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = QueueListener(_log_queue, _file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+def own_log_rotation():
+    """ Makes this process the one that rotates the log file & keeps it open, called by the monitoring process """
+    _file_handler.rotating = True
 
 def log_start_monitoring(pid, caller):
     """ Logs the start of the monitoring process with PID """
     logging.info(f"Start monitoring process initiated (caller = {caller}) with PID: {pid}")
+    register_pid(pid, caller)
 
 def log_stop_monitoring(pid, caller):
     """ Logs the stop of the monitoring process with PID """
     logging.info(f"Stop monitoring process initiated (caller = {caller}) with PID: {pid}")
+    unregister_pid(pid)
 
-def log_error(message, caller):
-    """ Logs an error message """
+def log_error(message, caller, kind=None):
+    """ Logs an error message & records it in the event journal
+        kind categorises the error in the metrics, by default the type of the exception being handled (or "error" outside an except block) """
     logging.error(f"Error (caller = {caller})): {message}")
+    if kind is None:
+        handled = sys.exc_info()[1]
+        kind = type(handled).__name__ if handled is not None else "error"
+    import journal
+    import metrics
+    metrics.ERRORS.inc(kind)
+    journal.record(journal.ERROR, caller=caller, error_kind=kind, message=str(message))
+
+def _read_pid_registry():
+    """ Returns the registered (pid, caller) entries oldest first, or None if there is no registry yet """
+    try:
+        with open(PID_REGISTRY_PATH, 'r') as registry_file:
+            entries = []
+            for line in registry_file:
+                pid, _, caller = line.strip().partition(" ")
+                if pid.isdigit():
+                    entries.append((int(pid), caller))
+            return entries
+    except FileNotFoundError:
+        return None
+
+def _write_pid_registry(entries):
+    """ Replaces the registry with the given (pid, caller) entries """
+    temp_path = PID_REGISTRY_PATH + ".tmp"
+    with open(temp_path, 'w') as registry_file:
+        registry_file.writelines(f"{pid} {caller}\n" for pid, caller in entries)
+    os.replace(temp_path, PID_REGISTRY_PATH)
+
+def register_pid(pid, caller):
+    """ Records a started monitoring PID in the registry """
+    try:
+        entries = [entry for entry in (_read_pid_registry() or []) if entry[0] != pid]
+        entries.append((pid, caller))
+        _write_pid_registry(entries[-PID_REGISTRY_SIZE:])
+    except Exception as e:
+        logging.error(f"Error (caller = logger.py)): Failed to register PID {pid}: {e}")
+
+def unregister_pid(pid):
+    """ Removes a stopped monitoring PID from the registry """
+    try:
+        entries = _read_pid_registry()
+        if entries and any(entry[0] == pid for entry in entries):
+            _write_pid_registry([entry for entry in entries if entry[0] != pid])
+    except Exception as e:
+        logging.error(f"Error (caller = logger.py)): Failed to unregister PID {pid}: {e}")
+
+def get_registered_pids():
+    """ Returns the registered monitoring PIDs newest first, or None if there is no registry yet """
+    entries = _read_pid_registry()
+    if entries is None:
+        return None
+    return [pid for pid, _ in reversed(entries)]
+
+def iter_log_lines_reversed(path=LOG_PATH, block_size=TAIL_BLOCK_SIZE):
+    """ Yields the non-empty lines of the log file from last to first, reading it backwards in blocks """
+    with open(path, 'rb') as log_file:
+        position = log_file.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            log_file.seek(position)
+            lines = (log_file.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0) # May be the tail of a line that starts in the previous block
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode(errors="replace")
+        if remainder.strip():
+            yield remainder.decode(errors="replace")
 
 def get_pids_from_log():
-    """ Retrieves the last two logged PIDs from the log file that correspond to 'start' actions """
+    """ Retrieves the last two PIDs that correspond to 'start' actions, from the PID registry or else the log file """
+    pids = get_registered_pids()
+    if pids is not None:
+        return pids[:2] if pids else None
     pids = []
     try:
-        with open(LOG_PATH, 'r') as log_file:
-            lines = log_file.readlines()
-            for line in reversed(lines):
-                if 'Start monitoring process initiated' in line:
-                    match = re.search(r'PID.*:\s*(\d+)', line)
-                    if match:
-                        try:
-                            pid = int(match.group(1))
-                            pids.append(pid)
-                        except ValueError:
-                            log_error(f"Invalid PID format in log line: {line.strip()}", "logger.py")
-                if len(pids) == 2:
-                    return pids
+        for line in iter_log_lines_reversed():
+            if 'Start monitoring process initiated' in line:
+                match = re.search(r'PID.*:\s*(\d+)', line)
+                if match:
+                    try:
+                        pid = int(match.group(1))
+                        pids.append(pid)
+                    except ValueError:
+                        log_error(f"Invalid PID format in log line: {line.strip()}", "logger.py")
+            if len(pids) == 2:
+                return pids
     except Exception as e:
         log_error(f"Failed to retrieve PIDs from log: {e}", "logger.py")
     return pids if pids else None
@@ -51,13 +172,9 @@ def get_pids_from_log():
 def get_last_record_from_log():
     """ Retrieves the last record from the log file """
     try:
-        with open(LOG_PATH, 'r') as log_file:
-            lines = log_file.readlines()
-            if lines:
-                last_record = lines[-1].strip()
-                return last_record
-            else:
-                return None
+        for line in iter_log_lines_reversed():
+            return line.strip()
+        return None
     except Exception as e:
-        log_error(f"Failed to retrieve last record from log: {e}")
-        return None
\ No newline at end of file
+        log_error(f"Failed to retrieve last record from log: {e}", "logger.py")
+        return None
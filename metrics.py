@@ -0,0 +1,196 @@
+# /metrics.py
+
+import bisect
+import os
+import threading
+
+from logger import LOG_DIR
+
+# Default histogram buckets (seconds), from sysfs reads to powercfg spawns
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Observations a histogram batches before sorting them into its buckets
+HISTOGRAM_BATCH = 64
+# Battery checks per timed check, the timings are sampled to keep the hot path cheap
+METRICS_SAMPLE_EVERY = 8
+# Metrics snapshot written in the text exposition format
+METRICS_SNAPSHOT_PATH = os.path.join(LOG_DIR, "metrics.prom")
+# Seconds between two snapshots
+METRICS_SNAPSHOT_INTERVAL = 60
+# Interface the optional HTTP endpoint listens on
+METRICS_HOST = "127.0.0.1"
+
+# Every metric in definition order, rendered by render()
+REGISTRY = []
+
+def _format_labels(names, values):
+    pairs = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """ Monotonic count per label combination, incremented without a lock (a lost update under contention is acceptable) """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    """ Distribution of observed values over fixed buckets, with their sum & count
+        Observations are only appended on the hot path & sorted into the buckets in batches, under a lock as an observation
+        appended to a batch that is being sorted would be lost """
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # The last slot counts values above every bucket
+        self._sum = 0.0
+        self._count = 0
+        self._unsorted = []
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value):
+        with self._lock:
+            unsorted = self._unsorted
+            unsorted.append(value)
+            if len(unsorted) >= HISTOGRAM_BATCH:
+                self._collect()
+
+    def _collect(self):
+        """ Moves the batched observations into the buckets (call with the lock held) """
+        unsorted, self._unsorted = self._unsorted, []
+        unsorted.sort()
+        below = 0
+        for index, bound in enumerate(self.buckets):
+            position = bisect.bisect_right(unsorted, bound, below)
+            self._counts[index] += position - below
+            below = position
+        self._counts[-1] += len(unsorted) - below
+        self._sum += sum(unsorted)
+        self._count += len(unsorted)
+
+    @property
+    def count(self):
+        with self._lock:
+            self._collect()
+            return self._count
+
+    @property
+    def sum(self):
+        with self._lock:
+            self._collect()
+            return self._sum
+
+    def render(self):
+        with self._lock:
+            self._collect()
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative + counts[-1]}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+# Monitor hot path
+TICK_SECONDS = Histogram("battery_notifier_tick_seconds", "Duration of one battery check (sampled)")
+SENSOR_READ_SECONDS = Histogram("battery_notifier_sensor_read_seconds", "Duration of the battery sensor read of one check (sampled)")
+CONFIG_LOAD_SECONDS = Histogram("battery_notifier_config_load_seconds", "Duration of the configuration load of one check (sampled)")
+# Side effects
+SUBPROCESS_SPAWNS = Counter("battery_notifier_subprocess_spawns_total", "Child processes started, by command", ("command",))
+NOTIFICATIONS = Counter("battery_notifier_notifications_total", "Notifications by outcome (sent, coalesced, dropped, failed)", ("outcome",))
+ERRORS = Counter("battery_notifier_errors_total", "Logged errors, by kind (the exception type, or \"error\")", ("kind",))
+TELEMETRY_BATCHES = Counter("battery_notifier_telemetry_batches_total", "Telemetry batches by outcome (sent, failed, rejected, dropped)", ("outcome",))
+
+def render():
+    """ Returns every metric in the Prometheus text exposition format """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def write_snapshot(path=METRICS_SNAPSHOT_PATH):
+    """ Replaces the snapshot file with the current metrics """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as snapshot_file:
+        snapshot_file.write(render())
+    os.replace(temporary_path, path)
+
+class MetricsExporter:
+    """ Writes periodic snapshots & optionally serves /metrics over HTTP on localhost, both from background threads """
+
+    def __init__(self, port=None, host=METRICS_HOST, snapshot_path=METRICS_SNAPSHOT_PATH, interval=METRICS_SNAPSHOT_INTERVAL):
+        self.port = port
+        self.host = host
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self._server = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.port:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass # Scrapes aren't worth a log line
+
+            self._server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+            self._server.daemon_threads = True
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True))
+        if self.snapshot_path:
+            self._threads.append(threading.Thread(target=self._snapshots, name="MetricsSnapshot", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _snapshots(self):
+        while not self._stop_event.wait(self.interval):
+            self._write()
+        self._write()
+
+    def _write(self):
+        try:
+            write_snapshot(self.snapshot_path)
+        except OSError:
+            pass # Never let a full disk stop the monitor
+
+    def stop(self):
+        """ Stops serving & writes a last snapshot """
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(5)
+        self._threads = []
@@ -1,25 +1,176 @@
 # /notification.py
 
 import os
-from plyer import notification
-import battery_utility
-
-def notify_user(percentage, lower_threshold, higher_threshold, power_plugged):
-    """ Notify when battery is fully charged or low based on thresholds """
-    if power_plugged and percentage >= higher_threshold:
-        message = f"Battery is charged to {percentage}%. Please unplug the charger."
-        notification_message(message)
-    elif not power_plugged and percentage <= lower_threshold:
-        message = f"Battery is at {percentage}%. Consider plugging in."
-        battery_utility.toggle_battery_saver()
-        notification_message(message)
-
-def notification_message(message, title="Battery Notification", timeout=5):
-    """ Send a desktop notification with the given message """
-    icon_path = os.path.abspath("images/icon.ico")
-    notification.notify(
-        title=title,
-        message=message,
-        timeout=timeout,
-        app_icon=icon_path
-    )
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from logger import log_error
+
+# Icon shown with every notification
+ICON_PATH = os.path.abspath("images/icon.ico")
+# Notification kinds sharing a coalescing group, so charger flapping collapses into its latest state
+KIND_GROUPS = {"plug": "power", "unplug": "power"}
+# Seconds a notification of a group is held back so that quick follow-ups can replace it
+COALESCE_WINDOWS = {"power": 3}
+# Minimum seconds between two delivered notifications of a group
+RATE_LIMITS = {"power": 10}
+# Maximum number of pending notifications, further ones are dropped
+MAX_PENDING = 16
+# Seconds after which a pending notification is stale & dropped instead of shown
+MAX_AGE = 60
+
+class PlyerBackend:
+    """ Shows desktop notifications through plyer """
+
+    def __init__(self):
+        from plyer import notification
+        self._notify = notification.notify
+
+    def notify(self, title, message, timeout):
+        self._notify(title=title, message=message, timeout=timeout, app_icon=ICON_PATH)
+
+class MemoryBackend:
+    """ Records notifications instead of showing them (optionally taking some time per call), for tests """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.sent = [] # (title, message) in delivery order
+
+    def notify(self, title, message, timeout):
+        if self.delay:
+            time.sleep(self.delay)
+        self.sent.append((title, message))
+
+class NotificationDispatcher:
+    """ Delivers notifications from a background thread, coalescing bursts & rate limiting per group """
+
+    def __init__(self, backend=None, coalesce_windows=COALESCE_WINDOWS, rate_limits=RATE_LIMITS, max_pending=MAX_PENDING, max_age=MAX_AGE):
+        self.backend = backend
+        self.coalesce_windows = coalesce_windows
+        self.rate_limits = rate_limits
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.stats = {"enqueued": 0, "sent": 0, "coalesced": 0, "dropped": 0}
+        self._pending = OrderedDict() # key -> pending notification dict, the key is the group or a unique object
+        self._last_sent = {} # group -> (time, message) of the last delivered notification
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def notify(self, message, kind=None, title="Battery Notification", timeout=5):
+        """ Queues a notification without waiting for it to be shown, returns False if it was dropped """
+        group = KIND_GROUPS.get(kind, kind)
+        now = time.monotonic()
+        with self._condition:
+            pending = self._pending.get(group) if group is not None else None
+            if pending is not None:
+                # Supersede the pending notification of the same group, keeping its place & due time
+                pending.update(message=message, title=title, timeout=timeout, created=now, coalesced=True)
+                self.stats["coalesced"] += 1
+                metrics.NOTIFICATIONS.inc("coalesced")
+            elif len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                metrics.NOTIFICATIONS.inc("dropped")
+                return False
+            else:
+                key = group if group is not None else object()
+                self._pending[key] = {
+                    "group": group, "message": message, "title": title, "timeout": timeout, "created": now,
+                    "due": now + self.coalesce_windows.get(group, 0), "coalesced": False,
+                }
+            self.stats["enqueued"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="NotificationDispatcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return True
+
+    def _ready_time(self, pending):
+        """ Returns when a pending notification may be delivered, given its due time & its group's rate limit """
+        last_sent = self._last_sent.get(pending["group"])
+        if last_sent is None:
+            return pending["due"]
+        return max(pending["due"], last_sent[0] + self.rate_limits.get(pending["group"], 0))
+
+    def _next(self):
+        """ Waits for & removes the next deliverable notification, returns None once stopped & drained """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                stale = [key for key, pending in self._pending.items() if now - pending["created"] > self.max_age]
+                for key in stale:
+                    del self._pending[key]
+                    self.stats["dropped"] += 1
+                    metrics.NOTIFICATIONS.inc("dropped")
+                if stale:
+                    self._condition.notify_all() # Wakes flush() if nothing is left
+                if not self._pending:
+                    if self._stopping:
+                        return None
+                    self._condition.wait()
+                    continue
+                key, pending = min(self._pending.items(), key=lambda item: self._ready_time(item[1]))
+                ready = self._ready_time(pending)
+                if ready <= now or self._stopping:
+                    del self._pending[key]
+                    self._condition.notify_all()
+                    return pending
+                self._condition.wait(ready - now)
+
+    def _run(self):
+        while True:
+            pending = self._next()
+            if pending is None:
+                return
+            group, message = pending["group"], pending["message"]
+            last_sent = self._last_sent.get(group)
+            if pending["coalesced"] and last_sent is not None and last_sent[1] == message:
+                # A burst ended in the state that was already announced
+                self.stats["dropped"] += 1
+                metrics.NOTIFICATIONS.inc("dropped")
+                continue
+            try:
+                if self.backend is None:
+                    self.backend = PlyerBackend()
+                self.backend.notify(pending["title"], message, pending["timeout"])
+                self.stats["sent"] += 1
+                metrics.NOTIFICATIONS.inc("sent")
+            except Exception as e:
+                metrics.NOTIFICATIONS.inc("failed")
+                log_error(f"Failed to show notification: {e}", "notification.py")
+            if group is not None:
+                self._last_sent[group] = (time.monotonic(), message)
+
+    def flush(self, timeout=None):
+        """ Waits until no notification is pending, returns False on timeout """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self):
+        """ Delivers what is still pending without further delays & stops the thread """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+_default_dispatcher = None
+
+def get_dispatcher():
+    """ Returns the shared notification dispatcher """
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        _default_dispatcher = NotificationDispatcher()
+    return _default_dispatcher
+
+def notification_message(message, title="Battery Notification", timeout=5, kind=None):
+    """ Queue a desktop notification with the given message (shown by the dispatcher thread) """
+    get_dispatcher().notify(message, kind=kind, title=title, timeout=timeout)
@@ -0,0 +1,100 @@
+# /power_plan.py
+
+import subprocess
+import sys
+import threading
+import time
+
+import metrics
+
+# Power scheme GUIDs
+BALANCED_GUID = "a1841308-3541-4fab-bc81-f71556f20b4a"
+POWER_SAVER_GUID = "381b4222-f694-41f0-9685-ff5bb260df2e"
+# Seconds the known active scheme is trusted, the GUI, CLI, daemon & the user (through Windows) can all switch plans
+POWER_PLAN_CACHE_SECONDS = 2
+
+def read_active_scheme():
+    """ Returns the GUID of the active power scheme from powrprof.dll, without spawning powercfg (Windows only) """
+    import ctypes
+    from ctypes import wintypes
+
+    class GUID(ctypes.Structure):
+        _fields_ = [("Data1", wintypes.DWORD), ("Data2", wintypes.WORD), ("Data3", wintypes.WORD), ("Data4", ctypes.c_ubyte * 8)]
+
+    scheme = ctypes.POINTER(GUID)()
+    error = ctypes.windll.powrprof.PowerGetActiveScheme(None, ctypes.byref(scheme))
+    if error:
+        raise OSError(error, "PowerGetActiveScheme failed")
+    try:
+        guid = scheme.contents
+        return f"{guid.Data1:08x}-{guid.Data2:04x}-{guid.Data3:04x}-{bytes(guid.Data4[:2]).hex()}-{bytes(guid.Data4[2:]).hex()}"
+    finally:
+        ctypes.windll.kernel32.LocalFree(scheme)
+
+class PowerPlanManager:
+    """ Tracks the active Windows power scheme in memory for a short while & runs powercfg without a shell """
+
+    def __init__(self, runner=subprocess.run, reader=None, clock=time.monotonic):
+        self.runner = runner # subprocess.run compatible, injectable so tests can count spawns
+        # Returns the active scheme without spawning a process, None to ask powercfg /getactivescheme
+        self.reader = reader if reader is not None or sys.platform != "win32" else read_active_scheme
+        self.clock = clock
+        self._active_scheme = None
+        self._scheme_time = None
+        self._lock = threading.RLock()
+
+    def _powercfg(self, *args):
+        """ Runs powercfg with the given arguments & returns the completed process """
+        metrics.SUBPROCESS_SPAWNS.inc(f"powercfg {args[0]}")
+        try:
+            return self.runner(["powercfg", *args], capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError:
+            self.invalidate()
+            raise
+
+    def _query(self):
+        if self.reader is not None:
+            try:
+                return self.reader()
+            except OSError:
+                pass # Fall back to powercfg
+        return self._powercfg("/getactivescheme").stdout.split(":")[1].strip().split()[0]
+
+    def active_scheme(self, refresh=False):
+        """ Returns the GUID of the active power scheme, asking again once the known one is older than POWER_PLAN_CACHE_SECONDS """
+        with self._lock:
+            now = self.clock()
+            if refresh or self._active_scheme is None or now - self._scheme_time > POWER_PLAN_CACHE_SECONDS:
+                self._active_scheme, self._scheme_time = self._query(), now
+            return self._active_scheme
+
+    def set_active(self, guid):
+        """ Activates the given power scheme, returns False if it was already active """
+        with self._lock:
+            if self.active_scheme() == guid:
+                return False
+            self._powercfg("/setactive", guid)
+            self._active_scheme, self._scheme_time = guid, self.clock()
+            return True
+
+    def invalidate(self):
+        """ Forgets the cached scheme, e.g. after it may have been changed outside this process """
+        with self._lock:
+            self._active_scheme = None
+
+    def is_saver_active(self):
+        """ Whether the Power Saver scheme is the active one """
+        return self.active_scheme() == POWER_SAVER_GUID
+
+    def generate_report(self, report_path):
+        """ Writes the powercfg battery report to the given path """
+        self._powercfg("/batteryreport", "/output", report_path)
+
+_default_manager = None
+
+def get_manager():
+    """ Returns the shared power plan manager """
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = PowerPlanManager()
+    return _default_manager
@@ -0,0 +1,76 @@
+# /predictor.py
+
+import math
+
+# Time constant (seconds) of the exponential weighting, older samples fade with exp(-age / RATE_TIME_CONSTANT)
+RATE_TIME_CONSTANT = 15 * 60
+# The rate is only trusted after this many samples spanning at least RATE_MIN_SPAN seconds
+RATE_MIN_SAMPLES = 3
+RATE_MIN_SPAN = 120
+
+class RateEstimator:
+    """ Exponentially weighted least-squares fit of percent over time, updated in O(1) per sample """
+
+    def __init__(self, time_constant=RATE_TIME_CONSTANT):
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        """ Forgets every sample, e.g. when the charger gets plugged in or out """
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self.weight = 0.0 # Sum of the decayed sample weights
+        self.mean_time = 0.0 # Weighted means & co-moments, relative to first_time
+        self.mean_percent = 0.0
+        self.time_moment = 0.0
+        self.cross_moment = 0.0
+
+    def update(self, timestamp, percent):
+        """ Adds a sample, decaying the weight of the earlier ones """
+        if self.first_time is None:
+            self.first_time = timestamp
+        elif timestamp <= self.last_time:
+            return
+        else:
+            decay = math.exp(-(timestamp - self.last_time) / self.time_constant)
+            self.weight *= decay
+            self.time_moment *= decay
+            self.cross_moment *= decay
+        t = timestamp - self.first_time
+        self.weight += 1.0
+        time_delta = t - self.mean_time
+        self.mean_time += time_delta / self.weight
+        self.mean_percent += (percent - self.mean_percent) / self.weight
+        self.time_moment += time_delta * (t - self.mean_time)
+        self.cross_moment += time_delta * (percent - self.mean_percent)
+        self.last_time = timestamp
+        self.count += 1
+
+    @property
+    def ready(self):
+        """ Whether enough samples were seen for the rate to be trusted """
+        return (self.count >= RATE_MIN_SAMPLES and self.time_moment > 0
+                and self.last_time - self.first_time >= RATE_MIN_SPAN)
+
+    @property
+    def rate(self):
+        """ Returns the fitted charge (+) or discharge (-) rate in % per second, or None if not ready """
+        if not self.ready:
+            return None
+        return self.cross_moment / self.time_moment
+
+    def estimate(self):
+        """ Returns the fitted percent at the latest sample, or None if not ready """
+        rate = self.rate
+        if rate is None:
+            return None
+        return self.mean_percent + rate * (self.last_time - self.first_time - self.mean_time)
+
+    def seconds_until(self, percent):
+        """ Returns the predicted seconds until the given percent is reached, or None if it isn't being approached """
+        rate, current = self.rate, self.estimate()
+        if not rate:
+            return None
+        seconds = (percent - current) / rate
+        return seconds if seconds >= 0 else None
@@ -1,22 +1,135 @@
 # /process.py
 
 import battery_utility
-import multiprocessing
-import time
-import psutil
+import com
 import os
+import sys
+import threading
 import logger
+import config_store
+import control
+import metrics
+import status_segment
+
+def control_handlers(monitor):
+    """ Returns the control channel commands served by the monitoring process """
+    def status():
+        config = config_store.load_config()
+        return dict(monitor.status(), pid=os.getpid(), battery_saver_on=config.get("battery_saver_on"),
+                    lower_threshold=config.get("lower_threshold"), higher_threshold=config.get("higher_threshold"))
+
+    def stop():
+        battery_utility.stop_monitor()
+        return "Monitoring stopped."
+
+    def reload():
+        config_store.invalidate()
+        return "Configuration reloaded."
+
+    def saver(state):
+        if state == "on":
+            return battery_utility.enter_battery_saver()
+        if state == "off":
+            return battery_utility.leave_battery_saver()
+        raise ValueError(f"Unknown battery saver state: {state}")
+
+    return {"status": status, "stop": stop, "reload": reload, "saver": saver, "metrics": metrics.render}
+
+def start_metrics():
+    """ Starts the periodic metrics snapshot, plus the HTTP endpoint when metrics_port is set in the config """
+    exporter = metrics.MetricsExporter(port=config_store.load_config().get("metrics_port"))
+    try:
+        exporter.start()
+    except OSError as e:
+        logger.log_error(f"Failed to serve metrics on port {exporter.port}: {e}", "process.py")
+        exporter = metrics.MetricsExporter()
+        exporter.start()
+    return exporter
+
+def start_telemetry():
+    """ Starts the fleet telemetry agent when "telemetry": {"url": ...} is set in the config, returns None otherwise """
+    settings = config_store.load_config().get("telemetry") or {}
+    if not settings.get("url"):
+        return None
+    import telemetry
+    agent = telemetry.TelemetryAgent(settings["url"], device=settings.get("device"), token=settings.get("token"),
+                                     interval=settings.get("interval", telemetry.TELEMETRY_INTERVAL))
+    agent.start()
+    return agent
+
+def flush_config():
+    """ Writes the config updates still waiting for their debounced write, the monitor may be stopping after a saver toggle """
+    try:
+        config_store.flush_config()
+    except Exception as e:
+        logger.log_error(f"Failed to save configuration: {e}", "process.py")
 
 def battery_process():
-    """ Start monitoring battery events """
-    battery_utility.monitor_battery_events()
+    """ Start monitoring battery events & serve the control channel """
+    monitor = battery_utility.BatteryMonitor()
+    server = control.ControlServer(control_handlers(monitor))
+    try:
+        server.start()
+    except RuntimeError as e:
+        logger.log_error(f"Not starting a second monitor: {e}", "process.py")
+        return
+    logger.own_log_rotation()
+    exporter = start_metrics()
+    agent = start_telemetry()
+    status = status_segment.StatusWriter()
+    try:
+        battery_utility.monitor_battery_events(monitor=monitor, status=status, telemetry=agent)
+    finally:
+        flush_config()
+        status.close()
+        if agent is not None:
+            agent.stop()
+        exporter.stop()
+        server.stop()
+
+def run_daemon():
+    """ Monitors the battery in this process, with a worker thread doing the checks & the calling thread supervising it """
+    monitor = battery_utility.BatteryMonitor()
+    server = control.ControlServer(control_handlers(monitor))
+    try:
+        server.start()
+    except RuntimeError as e:
+        logger.log_error(f"Not starting a second monitor: {e}", "process.py")
+        return
+    logger.own_log_rotation()
+    pid = os.getpid()
+    if pid not in (logger.get_pids_from_log() or []):
+        logger.log_start_monitoring(pid, "process.py (Daemon)")
+    exporter = start_metrics()
+    agent = start_telemetry()
+    status = status_segment.StatusWriter()
+    # The saver & dim actions use WMI, which needs COM initialised on the monitor thread
+    worker = threading.Thread(target=com.run_initialized, args=(battery_utility.monitor_battery_events,),
+                              kwargs={"monitor": monitor, "status": status, "telemetry": agent}, name="BatteryMonitor", daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(1)
+    except KeyboardInterrupt:
+        battery_utility.stop_monitor()
+        worker.join()
+    finally:
+        flush_config()
+        if not worker.is_alive(): # Otherwise it may still be publishing
+            status.close()
+        if agent is not None:
+            agent.stop()
+        exporter.stop()
+        server.stop()
+        logger.log_stop_monitoring(pid, "process.py (Daemon)")
 
 def start_process():
     """ Create & start a separate process for monitoring the battery """
     parent_pid = os.getpid()
-    logged_pids = logger.get_pids_from_log()
+    logged_pids = logger.get_pids_from_log() or []
     if logged_pids and parent_pid not in logged_pids:
         logger.log_start_monitoring(parent_pid, "process.py (Parent Process)")    
+    import multiprocessing
     multiprocessing.set_start_method('spawn', force=True)
     process = multiprocessing.Process(target=battery_process, name="BatteryMonitorProcess")
     process.daemon = True
@@ -39,6 +152,7 @@ def stop_process(process):
 
 def stop_process_by_pid(pid):
     """ Stops a process using its PID """
+    import psutil
     try:
         process = psutil.Process(pid)
         if process.is_running():
@@ -48,16 +162,22 @@ def stop_process_by_pid(pid):
         else:
             logger.log_error("No active monitoring process found.", "process.py")
     except psutil.NoSuchProcess:
+        logger.unregister_pid(pid)
         logger.log_error(f"No process with PID {pid} found.", "process.py")
     except Exception as e:
         logger.log_error(f"Failed to stop monitoring: {e}", "process.py")
 
 if __name__ == "__main__":
-    """ Entry point for starting the monitor process """
+    """ Entry point for starting the monitor process (--spawn runs it in a child process like older versions) """
+    if "--spawn" not in sys.argv[1:]:
+        run_daemon()
+        sys.exit()
     process = None
     try:
         process = start_process()
-        while True:
-            time.sleep(1)
+        while process.is_alive():
+            process.join(1)
+        logger.log_stop_monitoring(process.pid, "process.py")
+        logger.unregister_pid(os.getpid())
     except KeyboardInterrupt:
         stop_process(process)
@@ -0,0 +1,138 @@
+# /rules.py
+
+import bisect
+import math
+from collections import namedtuple
+
+# Actions a rule can take when it fires, run in the order the rule lists them
+ACTIONS = ("notify", "saver", "dim")
+# Message of rules that don't set one, {percent} is replaced by the battery level
+DEFAULT_MESSAGE = "Battery is at {percent}%."
+
+# low/high: inclusive level band (-inf/inf when open), plugged: True, False or None for either plug state,
+# hysteresis: points the level has to leave the band by before the rule fires again, brightness: level of the dim action
+Rule = namedtuple("Rule", ["name", "low", "high", "plugged", "actions", "message", "hysteresis", "brightness"])
+
+def parse_rule(entry):
+    """ Builds a Rule from its config entry, e.g. {"name": "low", "below": 20, "plugged": false, "actions": ["saver", "notify"]} """
+    if not isinstance(entry, dict) or not isinstance(entry.get("name"), str):
+        raise ValueError(f"A rule needs a name: {entry!r}")
+    name = entry["name"]
+    low, high = entry.get("above", -math.inf), entry.get("below", math.inf)
+    if not isinstance(low, (int, float)) or not isinstance(high, (int, float)) or (math.isinf(low) and math.isinf(high)):
+        raise ValueError(f"Rule {name} needs a numeric 'above' and/or 'below' level")
+    if low > high:
+        raise ValueError(f"Rule {name} can never match, 'above' is higher than 'below'")
+    plugged = entry.get("plugged")
+    if plugged not in (None, True, False):
+        raise ValueError(f"Rule {name}: 'plugged' must be true, false or left out")
+    actions = tuple(entry.get("actions", ("notify",)))
+    unknown = [action for action in actions if action not in ACTIONS]
+    if unknown:
+        raise ValueError(f"Rule {name} has unknown actions: {', '.join(map(str, unknown))} (known: {', '.join(ACTIONS)})")
+    message = entry.get("message", DEFAULT_MESSAGE)
+    try:
+        message.format(percent=0)
+    except (AttributeError, KeyError, IndexError, ValueError):
+        raise ValueError(f"Rule {name} has an invalid message, only {{percent}} can be used: {message!r}") from None
+    hysteresis = entry.get("hysteresis", 0)
+    if not isinstance(hysteresis, (int, float)) or hysteresis < 0:
+        raise ValueError(f"Rule {name}: 'hysteresis' must be a number of points >= 0")
+    return Rule(name, low, high, plugged, actions, message, hysteresis, entry.get("brightness"))
+
+def default_rules(lower_threshold, higher_threshold):
+    """ The rules of the two thresholds: unplug once charged to the higher one, saver & plug in at the lower one """
+    return [
+        Rule("higher", higher_threshold, math.inf, True, ("notify",), "Battery is charged to {percent}%. Please unplug the charger.", 0, None),
+        Rule("lower", -math.inf, lower_threshold, False, ("saver", "notify"), "Battery is at {percent}%. Consider plugging in.", 0, None),
+    ]
+
+def compile_rules(config, previous=None):
+    """ Compiles the config's "rules", or the rules of its thresholds when it has none, keeping the fired state of previous """
+    entries = config.get("rules")
+    if entries is None:
+        return RuleSet(default_rules(config["lower_threshold"], config["higher_threshold"]), previous)
+    if not isinstance(entries, list):
+        raise ValueError("'rules' must be a list")
+    return RuleSet([parse_rule(entry) for entry in entries], previous)
+
+class RuleSet:
+    """ Rules compiled per plug state into an interval table, so finding the rules matching a level is one bisect whatever their number
+        Each rule fires once when the level enters its band & is re-armed when the level leaves it (by more than its hysteresis) """
+
+    def __init__(self, rules, previous=None):
+        self.rules = tuple(rules)
+        self._by_name = {rule.name: rule for rule in self.rules}
+        if len(self._by_name) != len(self.rules):
+            raise ValueError("Rule names must be unique")
+        # plugged -> (sorted band bounds, matching rules per region), see _compile
+        self._tables = {plugged: self._compile(plugged) for plugged in (False, True)}
+        # plugged -> (sorted lows, sorted highs) of its rules, the levels a rising or falling battery enters a band at
+        self._edges = {}
+        for plugged in (False, True):
+            applicable = self._applicable(plugged)
+            self._edges[plugged] = (sorted({rule.low for rule in applicable if math.isfinite(rule.low)}),
+                                    sorted({rule.high for rule in applicable if math.isfinite(rule.high)}))
+        # Names of the fired rules, they stay fired across a recompile (e.g. a config reload) as long as they keep their name
+        self.fired = set()
+        if previous is not None:
+            self.fired = {name for name in previous.fired if name in self._by_name}
+        self._last = None # (percent, plugged, matching) of the last evaluation
+
+    def _applicable(self, plugged):
+        return [rule for rule in self.rules if rule.plugged is None or rule.plugged == plugged]
+
+    def _compile(self, plugged):
+        """ Splits the levels at every band bound into regions, alternating open intervals & the bounds themselves:
+            (-inf, b0), [b0], (b0, b1), [b1], ..., (bn, inf), & lists the rules matching each region """
+        applicable = self._applicable(plugged)
+        bounds = sorted({bound for rule in applicable for bound in (rule.low, rule.high) if math.isfinite(bound)})
+        regions = []
+        for position in range(2 * len(bounds) + 1):
+            if position % 2:
+                level = bounds[position // 2]
+            elif not bounds:
+                level = 0
+            elif position == 0:
+                level = bounds[0] - 1
+            elif position == 2 * len(bounds):
+                level = bounds[-1] + 1
+            else:
+                level = (bounds[position // 2 - 1] + bounds[position // 2]) / 2
+            regions.append(tuple(rule for rule in applicable if rule.low <= level <= rule.high))
+        return bounds, regions
+
+    def match(self, percent, plugged):
+        """ Returns the rules whose band & plug state match, in config order """
+        bounds, regions = self._tables[bool(plugged)]
+        position = bisect.bisect_left(bounds, percent)
+        if position < len(bounds) and bounds[position] == percent:
+            return regions[2 * position + 1]
+        return regions[2 * position]
+
+    def evaluate(self, percent, plugged):
+        """ Re-arms the fired rules the level has left & returns (matching rules, rules firing now) """
+        last = self._last
+        if last is not None and last[0] == percent and last[1] == plugged:
+            return last[2], [] # Nothing can have changed
+        rules = self._by_name
+        for name in [name for name in self.fired
+                     if not rules[name].low - rules[name].hysteresis <= percent <= rules[name].high + rules[name].hysteresis]:
+            self.fired.discard(name)
+        matching = self.match(percent, plugged)
+        firing = [rule for rule in matching if rule.name not in self.fired]
+        self.fired.update(rule.name for rule in firing)
+        self._last = (percent, plugged, matching)
+        return matching, firing
+
+    def is_fired(self, name):
+        return name in self.fired
+
+    def next_level(self, percent, plugged):
+        """ Returns the nearest level at which the battery enters another band, going up while plugged in & down otherwise (None if none is left) """
+        lows, highs = self._edges[bool(plugged)]
+        if plugged:
+            position = bisect.bisect_right(lows, percent)
+            return lows[position] if position < len(lows) else None
+        position = bisect.bisect_left(highs, percent)
+        return highs[position - 1] if position else None
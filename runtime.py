@@ -0,0 +1,43 @@
+# /runtime.py
+
+import os
+import stat
+import sys
+import tempfile
+
+# Flags refusing to follow a symlink planted at a runtime path (not available on Windows, where the directory is in the user profile)
+O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+def _runtime_dir():
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("LOCALAPPDATA") or tempfile.gettempdir(), "battery-notifier")
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "battery-notifier")
+    return os.path.join(tempfile.gettempdir(), f"battery-notifier-{os.getuid()}")
+
+# Per-user directory holding the daemon's control socket, secret & status segment, only accessible by the user
+RUNTIME_DIR = _runtime_dir()
+
+def ensure_runtime_dir(path=RUNTIME_DIR):
+    """ Creates the runtime directory (mode 0700) if needed & returns it
+        Raises PermissionError if the path is a symlink or belongs to another user, as another user may have planted it in /tmp """
+    try:
+        os.makedirs(path, 0o700)
+    except FileExistsError:
+        pass
+    if sys.platform != "win32":
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{path} is not a directory owned by the current user")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+def create_private_file(path):
+    """ Creates a new file readable only by the current user & returns its descriptor for writing, replacing an old one
+        O_EXCL & O_NOFOLLOW make the open fail rather than write through a file or symlink someone else put there """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | O_NOFOLLOW | getattr(os, "O_BINARY", 0), 0o600)
@@ -0,0 +1,163 @@
+# /sensors.py
+
+import os
+import sys
+import tempfile
+from collections import namedtuple
+
+# Kernel power supply class directory on Linux
+SYSFS_POWER_SUPPLY = "/sys/class/power_supply"
+# Battery attributes read on every sample (energy in µWh, power in µW)
+SYSFS_BATTERY_FIELDS = ("capacity", "status", "energy_now", "power_now", "energy_full")
+# Battery statuses reported while a charger is connected
+SYSFS_PLUGGED_STATUSES = ("Charging", "Full", "Not charging")
+
+class BatteryReading(namedtuple("BatteryReading", ["percent", "power_plugged", "energy_now", "power_now", "energy_full"])):
+    """ A single battery sample, fields a backend can't provide are None """
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """ Returns the charge (+) or discharge (-) rate in % per second, if the backend reports power """
+        if not self.power_now or not self.energy_full:
+            return None
+        rate = self.power_now / self.energy_full * 100 / 3600
+        return rate if self.power_plugged else -rate
+
+class PsutilSensor:
+    """ Reads the battery through psutil (works on every platform psutil supports) """
+
+    def __init__(self):
+        import psutil
+        self._sensors_battery = psutil.sensors_battery
+
+    def read(self):
+        """ Returns a BatteryReading, or None if there is no battery """
+        battery = self._sensors_battery()
+        if battery is None:
+            return None
+        return BatteryReading(battery.percent, battery.power_plugged, None, None, None)
+
+    def close(self):
+        pass
+
+class SysfsSensor:
+    """ Reads the battery straight from /sys/class/power_supply, keeping the attribute files open """
+
+    def __init__(self, root=SYSFS_POWER_SUPPLY):
+        self.root = root
+        self._fds = {}
+        self._online_fd = None
+        self._open()
+
+    def _open(self):
+        """ Finds the first battery & mains supply under root & opens the attributes that get sampled """
+        try:
+            supplies = sorted(os.listdir(self.root))
+        except OSError:
+            return
+        for name in supplies:
+            supply_path = os.path.join(self.root, name)
+            supply_type = _read_text(os.path.join(supply_path, "type"))
+            if supply_type == "Battery" and not self._fds:
+                for field in SYSFS_BATTERY_FIELDS:
+                    try:
+                        self._fds[field] = os.open(os.path.join(supply_path, field), os.O_RDONLY)
+                    except OSError:
+                        pass # Attribute not provided by this battery
+                if "capacity" not in self._fds:
+                    self.close()
+            elif supply_type in ("Mains", "USB") and self._online_fd is None:
+                try:
+                    self._online_fd = os.open(os.path.join(supply_path, "online"), os.O_RDONLY)
+                except OSError:
+                    pass
+
+    @property
+    def available(self):
+        """ Whether a battery was found under root """
+        return "capacity" in self._fds
+
+    def _pread(self, fd):
+        """ Re-reads an open attribute file from the start """
+        return os.pread(fd, 64, 0).decode().strip()
+
+    def _pread_int(self, field):
+        fd = self._fds.get(field)
+        if fd is None:
+            return None
+        try:
+            return int(self._pread(fd))
+        except (OSError, ValueError):
+            return None
+
+    def read(self):
+        """ Returns a BatteryReading, or None if there is no battery """
+        if not self.available:
+            return None
+        percent = self._pread_int("capacity")
+        if percent is None:
+            return None
+        if self._online_fd is not None:
+            power_plugged = self._pread(self._online_fd) == "1"
+        elif "status" in self._fds:
+            power_plugged = self._pread(self._fds["status"]) in SYSFS_PLUGGED_STATUSES
+        else:
+            power_plugged = None
+        return BatteryReading(percent, power_plugged, self._pread_int("energy_now"), self._pread_int("power_now"), self._pread_int("energy_full"))
+
+    def close(self):
+        """ Closes every open attribute file """
+        for fd in list(self._fds.values()) + [self._online_fd]:
+            if fd is not None:
+                os.close(fd)
+        self._fds, self._online_fd = {}, None
+
+class FakeSysfsSensor(SysfsSensor):
+    """ SysfsSensor over a scratch power_supply directory whose values can be set, for tests """
+
+    def __init__(self, root=None, **fields):
+        root = root or tempfile.mkdtemp(prefix="power_supply_")
+        self.set(root, capacity=fields.pop("capacity", 100), status=fields.pop("status", "Discharging"), **fields)
+        super().__init__(root)
+
+    def set(self, root=None, **fields):
+        """ Writes battery attributes (capacity, status, energy_now, ...) & the mains 'online' flag """
+        root = root or self.root
+        battery_path, mains_path = os.path.join(root, "BAT0"), os.path.join(root, "AC")
+        if not os.path.isdir(battery_path):
+            os.makedirs(battery_path)
+            os.makedirs(mains_path)
+            _write_text(os.path.join(battery_path, "type"), "Battery")
+            _write_text(os.path.join(mains_path, "type"), "Mains")
+            _write_text(os.path.join(mains_path, "online"), "0")
+        for field, value in fields.items():
+            if field == "online":
+                _write_text(os.path.join(mains_path, "online"), "1" if value else "0")
+            else:
+                _write_text(os.path.join(battery_path, field), value)
+
+def _read_text(path):
+    try:
+        with open(path, 'r') as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+def _write_text(path, value):
+    with open(path, 'w') as file:
+        file.write(f"{value}\n")
+
+_default_sensor = None
+
+def get_sensor():
+    """ Returns the shared sensor backend, sysfs on Linux when a battery is present & psutil otherwise """
+    global _default_sensor
+    if _default_sensor is None:
+        if sys.platform.startswith("linux"):
+            sensor = SysfsSensor()
+            if sensor.available:
+                _default_sensor = sensor
+                return sensor
+        _default_sensor = PsutilSensor()
+    return _default_sensor
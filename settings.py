@@ -2,66 +2,36 @@
 
 import os
 import sys
-import json
 import tkinter as tk
 from tkinter import messagebox
-from win32com.client import Dispatch
 import subprocess
-import psutil
 import ctypes
-import threading
 
-import process
-import battery_utility
-from logger import log_start_monitoring, log_stop_monitoring, log_error, get_pids_from_log, get_last_record_from_log
+import config_store
+import control
+import gauge
+import worker
+from logger import log_start_monitoring, log_stop_monitoring, log_error, get_pids_from_log
 
 # File paths for config file & process script file
-CONFIG_FILE_PATH = "./config.json"
+CONFIG_FILE_PATH = config_store.CONFIG_FILE_PATH
 
 def load_config():
-    """ Load & return user configuration """
-    DEFAULT_CONFIG = {
-        "lower_threshold": 20,
-        "higher_threshold": 80,
-        "startup": False,
-        "dark_mode": False,
-        "batter_saver_on": battery_utility.is_battery_saver_on(),
-        "current_brightness": battery_utility.get_brightness()
-    }
-    try:
-        if os.path.exists(CONFIG_FILE_PATH):
-            with open(CONFIG_FILE_PATH, 'r') as config_file:
-                content = config_file.read().strip()
-                if content:
-                    return json.loads(content)
-                else:
-                    raise ValueError("Config file is empty")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to load configuration file. Resetting to defaults...\nError: {e}")
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-
-def save_config(config):
-    """ Saves the user configuration to the config file """
-    try:
-        with open(CONFIG_FILE_PATH, 'w') as config_file:
-            json.dump(config, config_file, indent=4)
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to save configuration: {e}")
+    """ Load & return user configuration (cached until the config file changes) """
+    return config_store.load_config(CONFIG_FILE_PATH)
 
 def generate_battery_report():
-    """ Generates & stores the battery health report to desktop """
+    """ Generates & stores the battery health report to desktop, returns the message to show (runs on the worker pool) """
+    # Get the path to user's desktop
+    desktop_path = os.path.join(os.environ['USERPROFILE'], 'Desktop')
+    report_path = os.path.join(desktop_path, 'battery_report.html')
+    # Generate battery report & save it to the desktop
+    import power_plan
     try:
-        # Get the path to user's desktop
-        desktop_path = os.path.join(os.environ['USERPROFILE'], 'Desktop')
-        report_path = os.path.join(desktop_path, 'battery_report.html')
-        # Generate battery report & save it to the desktop
-        subprocess.run(f"powercfg /batteryreport /output \"{report_path}\"", shell=True, check=True)
-        messagebox.showinfo("Report Generated", f"Battery report has been saved to {report_path}")
-    except subprocess.CalledProcessError:
-        messagebox.showerror("Error", "Failed to generate battery report.")
-    except Exception as e:
-        messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+        power_plan.get_manager().generate_report(report_path)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError("Failed to generate battery report.") from e
+    return f"Battery report has been saved to {report_path}"
 
 def set_startup(is_startup):
     """ Manages the startup behavior """
@@ -72,6 +42,7 @@ def set_startup(is_startup):
         icon_path = os.path.abspath("images/icon.ico")
 
         if is_startup:
+            from win32com.client import Dispatch
             shell = Dispatch('WScript.Shell')
             shortcut = shell.CreateShortcut(shortcut_path)
             shortcut.TargetPath = sys.executable.replace("python.exe", "pythonw.exe")
@@ -83,7 +54,7 @@ def set_startup(is_startup):
             if os.path.exists(shortcut_path):
                 os.remove(shortcut_path)  # Remove startup shortcut
     except Exception as e:
-        messagebox.showerror("Error", f"Failed to manage startup settings: {e}")
+        raise RuntimeError(f"Failed to manage startup settings: {e}") from e
 
 def set_title_bar_color(hwnd, is_dark_mode):
     """ Sets the title bar color based on dark mode setting """
@@ -96,7 +67,7 @@ def set_title_bar_color(hwnd, is_dark_mode):
     except Exception as e:
         messagebox.showerror("Error", f"Failed to set title bar color: {e}")
 
-def toggle_dark_mode(window, dark_mode_var, checkbuttons):
+def toggle_dark_mode(window, dark_mode_var, checkbuttons, battery_gauge=None):
     """ Toggles Dark Mode Setting """
     is_dark_mode = dark_mode_var.get()  # Get the current dark mode setting
     hwnd = ctypes.windll.user32.GetParent(window.winfo_id())
@@ -128,93 +99,110 @@ def toggle_dark_mode(window, dark_mode_var, checkbuttons):
             for cb in checkbuttons:
                 cb.config(bg='white', fg='black', selectcolor='white')
         
-        # Update battery level display
-        battery = psutil.sensors_battery()
-        battery_level = battery.percent if battery else 0
-        battery_canvas = window.winfo_children()[0]
-        update_battery_level(battery_canvas, battery_level)
+        # Recolour the battery level display
+        if battery_gauge is not None:
+            battery_gauge.apply_theme()
     except Exception as e:
         messagebox.showerror("Error", f"Failed to toggle dark mode: {e}")
 
-def save_and_exit(lower_threshold_var, higher_threshold_var, startup_var, dark_mode_var, window):
+def save_settings(config):
+    """ Merges the window's settings & the current battery saver state into the saved config (runs on the worker pool)
+        The brightness saved by the battery saver is left alone, it's the one to restore & not the dimmed one """
+    import battery_utility
+    config = dict(config, battery_saver_on=battery_utility.is_battery_saver_on())
+    config_store.update_config(config, CONFIG_FILE_PATH, delay=0)
+    set_startup(config["startup"])
+    return "Your settings have been saved."
+
+def save_and_exit(lower_threshold_var, higher_threshold_var, startup_var, dark_mode_var, window, action_worker, buttons=()):
     """ Save the user's settings & exit the settings application (Not the monitoring process) """
-    try:
-        config = {
-            "lower_threshold": lower_threshold_var.get(),
-            "higher_threshold": higher_threshold_var.get(),
-            "startup": startup_var.get() == 1,
-            "dark_mode": dark_mode_var.get() == 1,
-            "battery_saver_on": battery_utility.is_battery_saver_on(),
-            "current_brightness": battery_utility.get_brightness(),
-        }
-        save_config(config)
-        set_startup(config["startup"])
-        messagebox.showinfo("Settings Saved", "Your settings have been saved.")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to save settings: {e}")
-    finally:
+    # Tk variables are read here, on the Tk thread, before the slow part moves to the worker pool
+    config = {
+        "lower_threshold": lower_threshold_var.get(),
+        "higher_threshold": higher_threshold_var.get(),
+        "startup": startup_var.get() == 1,
+        "dark_mode": dark_mode_var.get() == 1,
+    }
+    def saved(message):
+        messagebox.showinfo("Settings Saved", message)
         window.quit()
-
-def update_battery_level(canvas, battery_level):
-    """ Updates the battery level displayed on the canvas """
-    try:
-        if isinstance(canvas, tk.Canvas):
-            canvas.delete("battery")
-            width = 210
-            height = 30
-            fill_width = (battery_level / 100) * width    
-            bg_color = canvas["bg"]
-            outline_color = text_color = "white" if bg_color == "black" else "black"
-            fill_color = "green"
-            canvas.create_rectangle(5, 5, width, height + 5)
-            canvas.create_rectangle(5, 5, fill_width, height + 5, fill=fill_color, tags="battery")    
-            canvas.create_text(width / 2 + 5, height / 2 + 5, text=f"{battery_level}%", fill=text_color, tags="battery")
-        else:
-            raise TypeError("Provided widget is not a Canvas")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to update battery level: {e}")
+    def failed(error):
+        messagebox.showerror("Error", f"Failed to save settings: {error}")
+        window.quit()
+    action_worker.submit(save_settings, config, on_done=saved, on_error=failed, buttons=buttons, busy_text="Saving...")
 
 def start_monitoring():
-    """ Starts the monitoring process """
-    try:
-        last_record = get_last_record_from_log()
-        if last_record:
-            if "Start monitoring process initiated" in last_record:
-                messagebox.showinfo("Info", "Monitoring is already running.")
-                return
-        script_path = os.path.abspath("process.py")
-        process = subprocess.Popen([sys.executable, script_path], creationflags=subprocess.CREATE_NO_WINDOW)
-        log_start_monitoring(process.pid, "settings.py")
-        messagebox.showinfo("Info", "Monitoring started successfully.")
-    except Exception as e:
-        log_error(f"Failed to start monitoring: {e}", "settings.py")
-        messagebox.showerror("Error", f"Failed to start monitoring: {e}")
+    """ Starts the monitoring process, returns the message to show (runs on the worker pool) """
+    if control.is_running():
+        return "Monitoring is already running."
+    script_path = os.path.abspath("process.py")
+    process = subprocess.Popen([sys.executable, script_path], creationflags=subprocess.CREATE_NO_WINDOW)
+    log_start_monitoring(process.pid, "settings.py")
+    return "Monitoring started successfully."
 
 def stop_monitoring():
-    """ Stops the monitoring process """
+    """ Stops the monitoring process, returns the message to show or raises ProcessLookupError if none was found (runs on the worker pool) """
     try:
-        pids = get_pids_from_log()
-        if pids:
-            if len(pids) == 2:
-                pid1, pid2 = pids
-                process.stop_process_by_pid(pid1)
-                for proc in psutil.process_iter(['pid', 'name']):
-                    if proc.info['pid'] == pid2 and (proc.info['name'] == 'python.exe' or proc.info['name'] == "pythonw.exe"):
-                        proc.terminate()
-                        proc.wait()
-                        log_stop_monitoring(pid2, "settings.py")
-                        messagebox.showinfo("Info", "Monitoring stopped successfully.")
-                        break
-                else:
-                    messagebox.showwarning("Warning", "Monitoring process not found.")
-            else:
-                process.stop_process_by_pid(pids[0])
-                messagebox.showinfo("Info", "Monitoring stopped successfully.")
-        else:
-            messagebox.showwarning("Warning", "No monitoring process found.")
-    except Exception as e:
-        log_error(f"Failed to stop monitoring: {e}", "settings.py")
-        messagebox.showerror("Error", f"Failed to stop monitoring: {e}")
+        return control.send_command("stop")
+    except ConnectionError:
+        pass # Not reachable over the control channel, fall back to the logged PIDs
+    import process
+    pids = get_pids_from_log()
+    if not pids:
+        raise ProcessLookupError("No monitoring process found.")
+    if len(pids) == 2:
+        pid1, pid2 = pids
+        process.stop_process_by_pid(pid1)
+        import psutil
+        for proc in psutil.process_iter(['pid', 'name']):
+            if proc.info['pid'] == pid2 and (proc.info['name'] == 'python.exe' or proc.info['name'] == "pythonw.exe"):
+                proc.terminate()
+                proc.wait()
+                log_stop_monitoring(pid2, "settings.py")
+                return "Monitoring stopped successfully."
+        raise ProcessLookupError("Monitoring process not found.")
+    process.stop_process_by_pid(pids[0])
+    return "Monitoring stopped successfully."
+
+def toggle_battery_saver():
+    """ Toggles battery saver mode, returns the message to show (runs on the worker pool) """
+    import battery_utility
+    return battery_utility.leave_battery_saver() if battery_utility.is_battery_saver_on() else battery_utility.enter_battery_saver()
+
+def battery_wear(higher_threshold):
+    """ Summarises the wear analytics of the recorded battery history, only reading what was recorded since the last summary (runs on the worker pool) """
+    import analytics
+    summary = analytics.update_analytics(higher_threshold=higher_threshold).summary()
+    if not summary["samples"]:
+        return "Battery wear: no history recorded yet"
+    text = f"Battery wear: {summary['equivalent_full_cycles']:.1f} full cycles"
+    counts = summary["depth_of_discharge"]["counts"]
+    if any(counts):
+        bins = summary["depth_of_discharge"]["bins"]
+        typical = counts.index(max(counts))
+        text += f", discharges mostly {bins[typical]}-{bins[typical + 1]}%"
+    if summary["share_above_higher"] is not None:
+        text += f"\nAt or above {higher_threshold}%: {summary['share_above_higher']:.0%} of the time"
+    return text
+
+def show_battery_wear(action_worker, wear_label, higher_threshold):
+    """ Fills the wear label once the analytics are computed on the worker pool """
+    def failed(error):
+        log_error(f"Failed to compute battery wear: {error}", "settings.py")
+        wear_label.config(text="Battery wear: unavailable")
+    action_worker.submit(battery_wear, higher_threshold, on_done=lambda text: wear_label.config(text=text), on_error=failed)
+
+def run_action(action_worker, buttons, action, title, failure, busy_text):
+    """ Runs one of the actions above on the worker pool & reports its outcome in a message box on the Tk thread """
+    def done(message):
+        messagebox.showinfo(title, message)
+    def failed(error):
+        if isinstance(error, ProcessLookupError):
+            messagebox.showwarning("Warning", str(error))
+            return
+        log_error(f"{failure}: {error}", "settings.py")
+        messagebox.showerror("Error", str(error) if isinstance(error, RuntimeError) else f"{failure}: {error}")
+    action_worker.submit(action, on_done=done, on_error=failed, buttons=buttons, busy_text=busy_text)
 
 def center_window(window):
     """ Centers the window to the screen """
@@ -238,22 +226,25 @@ def create_settings_window():
 
         window = tk.Tk()
         window.title("Battery Notifier")
-        window.geometry("350x450")
+        window.geometry("350x520")
         window.resizable(False, False)
         center_window(window)
 
         padding_options = {'padx': 10, 'pady': 10}
 
-        # Create a canvas to display the battery level
-        battery_canvas = tk.Canvas(window, width=210, height=30, bg="lightgrey", borderwidth=2, relief="solid")
+        # Create a canvas to display the battery level & its recent history, kept up to date by the gauge
+        battery_canvas = tk.Canvas(window, width=210, height=60, bg="lightgrey", borderwidth=2, relief="solid")
         battery_canvas.grid(row=0, column=0, columnspan=2, rowspan=1)
 
         battery_canvas.grid_rowconfigure(0, weight=1)
         battery_canvas.grid_columnconfigure(0, weight=1)
 
-        battery = psutil.sensors_battery()
-        battery_level = battery.percent if battery else 0
-        update_battery_level(battery_canvas, battery_level)
+        # Whether the daemon is alive, from the heartbeat it publishes in the status segment
+        monitoring_label = tk.Label(window, text="Monitoring: ...", font=("Arial", 9))
+        monitoring_label.grid(row=0, column=2)
+
+        battery_gauge = gauge.BatteryGauge(battery_canvas, gauge.BatteryReader(), monitoring_label)
+        battery_gauge.start()
 
         # Create checkboxes for setting the script as a startup process and toggling dark mode
         startup_var = tk.IntVar(value=config.get('startup', 0))
@@ -261,7 +252,7 @@ def create_settings_window():
         startup_checkbutton.grid(row=1, column=0, columnspan=3, **padding_options)
 
         dark_mode_var = tk.IntVar(value=config.get('dark_mode', 0))
-        dark_mode_checkbutton = tk.Checkbutton(window, text="Dark Mode", variable=dark_mode_var, font=("Arial", 10), command=lambda: toggle_dark_mode(window, dark_mode_var, [startup_checkbutton, dark_mode_checkbutton]))
+        dark_mode_checkbutton = tk.Checkbutton(window, text="Dark Mode", variable=dark_mode_var, font=("Arial", 10), command=lambda: toggle_dark_mode(window, dark_mode_var, [startup_checkbutton, dark_mode_checkbutton], battery_gauge))
         dark_mode_checkbutton.grid(row=2, column=0, columnspan=3, **padding_options)
 
         # Create spinboxes for setting lower and higher battery thresholds
@@ -275,11 +266,29 @@ def create_settings_window():
         higher_threshold_spinbox = tk.Spinbox(window, from_=1, to=99, textvariable=higher_threshold_var, font=("Arial", 10))
         higher_threshold_spinbox.grid(row=4, column=1, **padding_options, sticky="ew")
 
-        tk.Button(window, text="Generate Battery Report", command=generate_battery_report, font=("Arial", 10)).grid(row=5, column=0, columnspan=3, **padding_options)
-        tk.Button(window, text="Start Monitoring", command=lambda: threading.Thread(target=start_monitoring).start(), font=("Arial", 10)).grid(row=6, column=0, **padding_options)
-        tk.Button(window, text="Stop Monitoring", command=lambda: threading.Thread(target=stop_monitoring).start(), font=("Arial", 10)).grid(row=6, column=1, **padding_options)
-        tk.Button(window, text="Toggle Battery Saver", command=battery_utility.toggle_battery_saver, font=("Arial", 10)).grid(row=7, column=0, columnspan=3, **padding_options)
-        tk.Button(window, text="Save and Exit", command=lambda: save_and_exit(lower_threshold_var, higher_threshold_var, startup_var, dark_mode_var, window), font=("Arial", 10)).grid(row=8, column=0, columnspan=3, **padding_options)
+        # Blocking actions run on the worker pool, their buttons stay disabled until the result is shown
+        action_worker = worker.ActionWorker(window)
+        report_button = tk.Button(window, text="Generate Battery Report", font=("Arial", 10))
+        report_button.config(command=lambda: run_action(action_worker, (report_button,), generate_battery_report, "Report Generated", "Failed to generate battery report", "Generating report..."))
+        report_button.grid(row=5, column=0, columnspan=3, **padding_options)
+        start_button = tk.Button(window, text="Start Monitoring", font=("Arial", 10))
+        stop_button = tk.Button(window, text="Stop Monitoring", font=("Arial", 10))
+        start_button.config(command=lambda: run_action(action_worker, (start_button, stop_button), start_monitoring, "Info", "Failed to start monitoring", "Starting..."))
+        stop_button.config(command=lambda: run_action(action_worker, (stop_button, start_button), stop_monitoring, "Info", "Failed to stop monitoring", "Stopping..."))
+        start_button.grid(row=6, column=0, **padding_options)
+        stop_button.grid(row=6, column=1, **padding_options)
+        saver_button = tk.Button(window, text="Toggle Battery Saver", font=("Arial", 10))
+        saver_button.config(command=lambda: run_action(action_worker, (saver_button,), toggle_battery_saver, "Battery Saver", "Failed to toggle Battery Saver", "Switching..."))
+        saver_button.grid(row=7, column=0, columnspan=3, **padding_options)
+        save_button = tk.Button(window, text="Save and Exit", font=("Arial", 10))
+        save_button.config(command=lambda: save_and_exit(lower_threshold_var, higher_threshold_var, startup_var, dark_mode_var, window, action_worker,
+                                                         (save_button, report_button, start_button, stop_button, saver_button)))
+        save_button.grid(row=8, column=0, columnspan=3, **padding_options)
+
+        # Wear analytics of the recorded history, computed in the background
+        wear_label = tk.Label(window, text="Battery wear: ...", font=("Arial", 9))
+        wear_label.grid(row=9, column=0, columnspan=3)
+        show_battery_wear(action_worker, wear_label, config['higher_threshold'])
 
         window.grid_columnconfigure(0, weight=1)
         window.grid_columnconfigure(1, weight=1)
@@ -288,9 +297,11 @@ def create_settings_window():
         window.update_idletasks()
         
         # Manage window title bar color based on dark mode setting
-        toggle_dark_mode(window, dark_mode_var, [startup_checkbutton, dark_mode_checkbutton])
+        toggle_dark_mode(window, dark_mode_var, [startup_checkbutton, dark_mode_checkbutton], battery_gauge)
 
         window.mainloop()
+        battery_gauge.stop()
+        action_worker.shutdown()
     except Exception as e:
         messagebox.showerror("Error", f"An unexpected error occurred: {e}")
 
@@ -0,0 +1,199 @@
+# /simulate.py
+
+import argparse
+import bisect
+import csv
+import json
+import random
+import time
+
+import battery_utility
+import history
+
+class VirtualClock:
+    """ Clock that only moves when advanced, so a replay runs as fast as the monitor logic allows """
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+class TraceSensor:
+    """ Sensor backend returning the trace sample current at the virtual time """
+
+    def __init__(self, trace, clock):
+        self.trace = trace
+        self.timestamps = [sample.timestamp for sample in trace]
+        self.clock = clock
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        position = bisect.bisect_right(self.timestamps, self.clock()) - 1
+        if position < 0:
+            return None
+        sample = self.trace[position]
+        return battery_utility.sensors.BatteryReading(sample.percent, sample.power_plugged, None, None, None)
+
+    def close(self):
+        pass
+
+class SimulatedMonitor(battery_utility.BatteryMonitor):
+    """ BatteryMonitor whose notifications, saver & dim actions & journal events are captured instead of performed """
+
+    def __init__(self, sensor, clock, config):
+        super().__init__(sensor=sensor, clock=clock, history=history.BatteryHistory(path=None))
+        self.config = config
+        self.actions = [] # {"time", "action", ...} in the order the monitor issued them
+
+    def load_config(self):
+        return self.config
+
+    def notify(self, message, kind):
+        self.actions.append({"time": self.clock(), "action": "notify", "kind": kind, "message": message})
+
+    def record_event(self, kind, **fields):
+        self.actions.append(dict(fields, time=self.clock(), action="journal", kind=kind))
+
+    def enter_saver(self):
+        self.actions.append({"time": self.clock(), "action": "enter_saver"})
+
+    def dim(self, level):
+        self.actions.append({"time": self.clock(), "action": "dim", "level": level})
+
+def load_trace(path):
+    """ Loads a trace from a CSV file (timestamp, percent, plugged columns) or a binary battery history file """
+    if path.endswith(".csv"):
+        with open(path, 'r', newline='') as trace_file:
+            return [history.Sample(float(row["timestamp"]), float(row["percent"]), row["plugged"].strip().lower() in ("1", "true", "yes"), None)
+                    for row in csv.DictReader(trace_file)]
+    return history.HistoryLog(path).query()
+
+def save_trace(trace, path):
+    """ Saves a trace as CSV """
+    with open(path, 'w', newline='') as trace_file:
+        writer = csv.writer(trace_file)
+        writer.writerow(["timestamp", "percent", "plugged"])
+        for sample in trace:
+            writer.writerow([sample.timestamp, sample.percent, int(sample.power_plugged)])
+
+def synthetic_trace(days, interval=10, seed=0, start=0.0):
+    """ Generates charge/discharge cycles sampled every interval seconds, with occasional charger flapping """
+    generator = random.Random(seed)
+    trace, timestamp, percent, plugged = [], start, 100.0, False
+    end = start + days * 24 * 60 * 60
+    rate, target, flaps = generator.uniform(0.2, 1.5) / 60, generator.uniform(5, 40), 0
+    while timestamp < end:
+        trace.append(history.Sample(timestamp, int(percent), plugged, None))
+        timestamp += interval
+        if flaps:
+            # A loose connector toggles the plug state for a few samples
+            plugged, flaps = not plugged, flaps - 1
+            continue
+        if plugged:
+            percent = min(100.0, percent + rate * interval)
+            if percent >= target:
+                plugged, rate, target = False, generator.uniform(0.2, 1.5) / 60, generator.uniform(5, 40)
+        else:
+            percent = max(0.0, percent - rate * interval)
+            if percent <= target:
+                plugged, rate, target = True, generator.uniform(0.8, 2.0) / 60, generator.uniform(70, 100)
+                if generator.random() < 0.2:
+                    flaps = generator.choice((2, 4, 6))
+    return trace
+
+def replay(trace, config):
+    """ Runs the monitor over the trace on a virtual clock & returns its captured actions & the number of checks """
+    clock = VirtualClock(trace[0].timestamp)
+    monitor = SimulatedMonitor(TraceSensor(trace, clock), clock, config)
+    end, checks = trace[-1].timestamp, 0
+    while clock.now <= end:
+        delay = monitor.check()
+        checks += 1
+        if delay is None:
+            break
+        clock.advance(delay)
+    return monitor.actions, checks
+
+def threshold_crossings(trace, config):
+    """ Returns the (time, threshold, duration) crossings the monitor should notify, the ground truth a replay is checked against """
+    crossings, armed, current = [], {"higher": True, "lower": True}, None
+    for sample in trace:
+        # Same re-arming rule as the monitor: the level has to come back across the threshold
+        if sample.percent < config["higher_threshold"]:
+            armed["higher"] = True
+        if sample.percent > config["lower_threshold"]:
+            armed["lower"] = True
+        if sample.power_plugged and sample.percent >= config["higher_threshold"]:
+            state = "higher"
+        elif not sample.power_plugged and sample.percent <= config["lower_threshold"]:
+            state = "lower"
+        else:
+            state = None
+        if current is not None and state != current[1]:
+            crossings.append((current[0], current[1], sample.timestamp - current[0]))
+            current = None
+        if state is not None and armed[state]:
+            current = (sample.timestamp, state)
+            armed[state] = False
+    if current is not None:
+        crossings.append((current[0], current[1], trace[-1].timestamp - current[0]))
+    return crossings
+
+def summarize(trace, actions, checks, config):
+    """ Returns counts, wakeups per hour & threshold detection latencies of a replay """
+    hours = max(trace[-1].timestamp - trace[0].timestamp, 1) / 3600
+    detections = [(action["time"], action["threshold"]) for action in actions if action["action"] == "journal" and action["kind"] == "threshold_crossed"]
+    latencies, missed, transient = [], 0, 0
+    for crossing_time, state, duration in threshold_crossings(trace, config):
+        detected = next((detected_time for detected_time, threshold in detections
+                         if threshold == state and crossing_time <= detected_time <= crossing_time + duration), None)
+        if detected is not None:
+            latencies.append(detected - crossing_time)
+        elif duration < battery_utility.MAX_POLL_INTERVAL:
+            transient += 1 # Over before the slowest poll could see it, e.g. unplugged right at the threshold
+        else:
+            missed += 1
+    counts = {}
+    for action in actions:
+        key = action["action"] if action["action"] != "notify" else f"notify:{action['kind']}"
+        counts[key] = counts.get(key, 0) + 1
+    return {
+        "samples": len(trace), "hours": hours, "checks": checks, "wakeups_per_hour": checks / hours,
+        "actions": counts, "crossings": len(latencies) + missed + transient, "missed_crossings": missed,
+        "transient_crossings": transient, "max_detection_latency_s": max(latencies, default=0),
+    }
+
+if __name__ == "__main__":
+    """ Entry point for replaying a recorded or synthetic trace through the monitor """
+    parser = argparse.ArgumentParser(description="Replay a battery trace through the monitor on a virtual clock")
+    parser.add_argument("trace", nargs="?", help="CSV trace (timestamp,percent,plugged) or battery history file")
+    parser.add_argument("--synthetic", type=float, metavar="DAYS", help="replay a generated trace of this many days instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lower", type=int, default=20, help="lower threshold (%%)")
+    parser.add_argument("--higher", type=int, default=80, help="higher threshold (%%)")
+    parser.add_argument("--actions", help="write every captured action as JSON to this file")
+    args = parser.parse_args()
+    if args.trace:
+        trace = load_trace(args.trace)
+    elif args.synthetic:
+        trace = synthetic_trace(args.synthetic, seed=args.seed)
+    else:
+        parser.error("give a trace file or --synthetic DAYS")
+    if not trace:
+        parser.error("the trace is empty")
+    config = {"lower_threshold": args.lower, "higher_threshold": args.higher}
+    start = time.perf_counter()
+    actions, checks = replay(trace, config)
+    elapsed = time.perf_counter() - start
+    summary = summarize(trace, actions, checks, config)
+    summary["replay_seconds"] = elapsed
+    summary["speedup"] = summary["hours"] * 3600 / elapsed
+    print(json.dumps(summary, indent=4))
+    if args.actions:
+        with open(args.actions, 'w') as actions_file:
+            json.dump(actions, actions_file, indent=4)
@@ -0,0 +1,134 @@
+# /status_segment.py
+
+import math
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+import runtime
+
+# Memory-mapped file the daemon publishes its latest state in, in the user's private runtime directory like the control channel
+STATUS_SEGMENT_PATH = os.path.join(runtime.RUNTIME_DIR, "status")
+STATUS_MAGIC = b"BNST"
+STATUS_VERSION = 1
+# Sequence counter (odd while the writer is mid-update), then the payload
+SEQUENCE = struct.Struct("<Q")
+PAYLOAD = struct.Struct("<4sHBbIdddffbbQ")
+STATUS_SIZE = SEQUENCE.size + PAYLOAD.size
+# Seconds past the announced next check after which the heartbeat counts as stale
+STATUS_GRACE = 10
+# Reads retried while the writer is mid-update before giving up, yielding the CPU after the first STATUS_READ_SPINS
+STATUS_READ_RETRIES = 100
+STATUS_READ_SPINS = 10
+# Last notification codes, the names of the default threshold rules (other rules are published as None)
+NOTIFICATIONS = (None, "higher", "lower")
+
+# state: "running" or "stopped"; percent/rate/power_plugged/saver_on are None when unknown
+StatusSnapshot = namedtuple("StatusSnapshot", ["state", "pid", "heartbeat", "next_check", "sample_time", "percent", "rate",
+                                               "power_plugged", "saver_on", "last_notification", "checks", "sequence"])
+
+def _flag(value):
+    return -1 if value is None else int(bool(value))
+
+def _unflag(value):
+    return None if value < 0 else bool(value)
+
+class StatusWriter:
+    """ Publishes the monitor's state into the status segment with a sequence lock, so readers never see a torn update """
+
+    def __init__(self, path=STATUS_SEGMENT_PATH):
+        self.path = path
+        if path == STATUS_SEGMENT_PATH:
+            runtime.ensure_runtime_dir()
+        # Reused across daemon runs (readers keep their mapping), but never through a symlink
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT | runtime.O_NOFOLLOW, 0o600)
+        try:
+            os.ftruncate(descriptor, STATUS_SIZE)
+            self._map = mmap.mmap(descriptor, STATUS_SIZE)
+        finally:
+            os.close(descriptor)
+        self._sequence = SEQUENCE.unpack_from(self._map, 0)[0] & ~1 # Carry on from an earlier daemon so readers notice the change
+
+    def publish(self, state="running", percent=None, power_plugged=None, rate=None, saver_on=None, last_notification=None,
+                sample_time=None, next_check=None, checks=0, now=None):
+        """ Writes one consistent state, the heartbeat is the time of the call """
+        now = time.time() if now is None else now
+        payload = PAYLOAD.pack(
+            STATUS_MAGIC, STATUS_VERSION, 1 if state == "running" else 0, _flag(power_plugged), os.getpid(), now,
+            next_check or now, sample_time or 0.0, math.nan if percent is None else percent, math.nan if rate is None else rate,
+            _flag(saver_on), NOTIFICATIONS.index(last_notification) if last_notification in NOTIFICATIONS else 0, checks,
+        )
+        SEQUENCE.pack_into(self._map, 0, self._sequence + 1) # Odd: update in progress
+        self._map[SEQUENCE.size:STATUS_SIZE] = payload
+        self._sequence += 2
+        SEQUENCE.pack_into(self._map, 0, self._sequence)
+
+    def publish_monitor(self, monitor, delay, saver_on=None, now=None):
+        """ Publishes the state of a BatteryMonitor after a check, with the next check due in delay seconds """
+        now = time.time() if now is None else now
+        status = monitor.status()
+        self.publish(percent=status["percent"], power_plugged=status["power_plugged"], rate=status["rate"], saver_on=saver_on,
+                     last_notification=status["last_notification"], sample_time=status["last_check"],
+                     next_check=now + (delay or 0), checks=status["checks"], now=now)
+
+    def close(self):
+        """ Marks the daemon as stopped (a crash leaves the heartbeat to go stale instead) & unmaps the segment """
+        if self._map is not None:
+            self.publish(state="stopped")
+            self._map.close()
+            self._map = None
+
+class StatusReader:
+    """ Reads snapshots of the status segment, mapping the file once & then only copying memory """
+
+    def __init__(self, path=STATUS_SEGMENT_PATH):
+        self.path = path
+        self._map = None
+
+    def _attach(self):
+        try:
+            with os.fdopen(os.open(self.path, os.O_RDONLY | runtime.O_NOFOLLOW | getattr(os, "O_BINARY", 0)), 'rb') as segment_file:
+                if os.fstat(segment_file.fileno()).st_size < STATUS_SIZE:
+                    return False
+                self._map = mmap.mmap(segment_file.fileno(), STATUS_SIZE, access=mmap.ACCESS_READ)
+        except OSError:
+            return False
+        return True
+
+    def read(self):
+        """ Returns the latest consistent StatusSnapshot, or None if no daemon ever published or a write never completed """
+        if self._map is None and not self._attach():
+            return None
+        for attempt in range(STATUS_READ_RETRIES):
+            if attempt >= STATUS_READ_SPINS:
+                time.sleep(0) # Let a preempted writer finish its update
+            before = SEQUENCE.unpack_from(self._map, 0)[0]
+            if before & 1:
+                continue # Writer mid-update
+            payload = self._map[SEQUENCE.size:STATUS_SIZE]
+            if SEQUENCE.unpack_from(self._map, 0)[0] != before:
+                continue # Overwritten while copying
+            (magic, version, running, power_plugged, pid, heartbeat, next_check, sample_time, percent, rate, saver_on,
+             notification, checks) = PAYLOAD.unpack(payload)
+            if magic != STATUS_MAGIC or version != STATUS_VERSION:
+                return None
+            return StatusSnapshot(
+                "running" if running else "stopped", pid, heartbeat, next_check, sample_time or None,
+                None if math.isnan(percent) else percent, None if math.isnan(rate) else rate, _unflag(power_plugged),
+                _unflag(saver_on), NOTIFICATIONS[notification] if notification < len(NOTIFICATIONS) else None, checks, before,
+            )
+        return None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+def is_alive(snapshot, now=None):
+    """ Whether the snapshot comes from a running daemon whose heartbeat isn't overdue """
+    if snapshot is None or snapshot.state != "running":
+        return False
+    now = time.time() if now is None else now
+    return now <= snapshot.next_check + STATUS_GRACE
@@ -0,0 +1,202 @@
+# /telemetry.py
+
+import gzip
+import json
+import os
+import platform
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import journal
+import metrics
+from logger import LOG_DIR, log_error
+
+# Batches waiting for delivery, one gzip file each, sent oldest first (also after a restart)
+TELEMETRY_SPOOL_DIR = os.path.join(LOG_DIR, "telemetry_spool")
+# Spooled batches kept while the collector is unreachable, the oldest are dropped beyond this (~a week at one batch a minute)
+TELEMETRY_SPOOL_BATCHES = 10000
+# Seconds between two batches, & the number of buffered samples that triggers one early
+TELEMETRY_INTERVAL = 60
+TELEMETRY_BATCH_SAMPLES = 500
+# Samples & events buffered in memory between two batches, the oldest are dropped beyond this
+TELEMETRY_BUFFER_RECORDS = 10000
+# Delay before retrying a failed delivery (seconds), doubled after every further failure up to the maximum, with jitter
+TELEMETRY_RETRY_BASE = 5
+TELEMETRY_RETRY_MAX = 10 * 60
+# Seconds a delivery may take
+TELEMETRY_TIMEOUT = 10
+# Events that are shipped right away instead of with the next periodic batch
+URGENT_EVENTS = (journal.THRESHOLD_CROSSED, journal.SAVER_TOGGLED, journal.PLUG, journal.UNPLUG)
+
+class RejectedBatch(Exception):
+    """ The collector refused a batch for good (malformed, unauthorised), retrying it can't help """
+
+def encode_batch(batch):
+    """ Serialises a batch into the gzip'd JSON body the collector accepts """
+    return gzip.compress(json.dumps(batch, separators=(",", ":")).encode(), compresslevel=6)
+
+def decode_batch(body):
+    return json.loads(gzip.decompress(body))
+
+class TelemetryAgent:
+    """ Buffers the monitor's samples & journal events & ships them to a fleet collector in compressed batches from a background thread
+        Every batch is spooled to disk before it is sent, so nothing is lost while the collector is unreachable or the daemon restarts """
+
+    def __init__(self, url, device=None, token=None, interval=TELEMETRY_INTERVAL, batch_samples=TELEMETRY_BATCH_SAMPLES,
+                 spool_dir=TELEMETRY_SPOOL_DIR, send=None):
+        self.url = url
+        self.device = device or platform.node() or "unknown"
+        self.token = token
+        self.interval = interval
+        self.batch_samples = batch_samples
+        self.spool_dir = spool_dir
+        self.send = send or self._post # function(body) raising on failure, RejectedBatch for batches to drop
+        self._samples = deque(maxlen=TELEMETRY_BUFFER_RECORDS) # [timestamp, percent, power_plugged, rate]
+        self._events = deque(maxlen=TELEMETRY_BUFFER_RECORDS)
+        self._state = None # Latest state of the device, sent with every batch
+        self._last_sample = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Batch ids are unique per agent run, so the collector can ignore a batch it already stored when a retry repeats it
+        self._run_id = uuid.uuid4().hex[:12]
+        self._sequence = 0
+        self.failures = 0 # Consecutive failed deliveries
+        self.next_attempt = 0.0 # time.monotonic() before which no delivery is tried
+
+    def start(self):
+        journal.subscribe(self.record_event)
+        self._thread = threading.Thread(target=self._run, name="TelemetryAgent", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=TELEMETRY_TIMEOUT):
+        """ Spools what is buffered & makes a last delivery attempt (unless backing off) """
+        journal.unsubscribe(self.record_event)
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record_monitor(self, monitor, config):
+        """ Buffers the state of a BatteryMonitor after a check, together with the config's thresholds & battery saver state """
+        status = monitor.status()
+        if status["percent"] is None or status["last_check"] == self._last_sample:
+            return
+        self._last_sample = status["last_check"]
+        self.record_sample(status["last_check"], status["percent"], status["power_plugged"], status["rate"], config.get("battery_saver_on"),
+                           config.get("lower_threshold"), config.get("higher_threshold"))
+
+    def record_sample(self, timestamp, percent, power_plugged, rate=None, saver_on=None, lower_threshold=None, higher_threshold=None):
+        with self._lock:
+            self._samples.append([timestamp, percent, power_plugged, rate])
+            self._state = {"ts": timestamp, "percent": percent, "power_plugged": power_plugged, "rate": rate, "saver_on": saver_on,
+                           "lower_threshold": lower_threshold, "higher_threshold": higher_threshold}
+            full = len(self._samples) >= self.batch_samples
+        if full:
+            self._wake.set()
+
+    def record_event(self, kind, fields, timestamp):
+        """ Journal subscriber, buffers every event & ships urgent ones right away """
+        with self._lock:
+            self._events.append(dict(fields, ts=timestamp, kind=kind))
+        if kind in URGENT_EVENTS:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """ Spools the buffered records as a batch & delivers the spooled batches, unless a failed delivery is being backed off """
+        try:
+            self._spool(self._take_batch())
+        except OSError as e:
+            log_error(f"Failed to spool telemetry: {e}", "telemetry.py")
+        if time.monotonic() >= self.next_attempt:
+            self._deliver()
+
+    def _take_batch(self):
+        with self._lock:
+            if not self._samples and not self._events:
+                return None
+            samples, events = list(self._samples), list(self._events)
+            self._samples.clear()
+            self._events.clear()
+            state = self._state
+        self._sequence += 1
+        return {"id": f"{self.device}/{self._run_id}/{self._sequence}", "device": self.device, "sent": time.time(), "state": state,
+                "samples": samples, "events": events}
+
+    def _spool(self, batch):
+        if batch is None:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Names sort by creation, the sequence orders batches of the same nanosecond
+        path = os.path.join(self.spool_dir, f"batch-{time.time_ns():020d}-{self._sequence:08d}.json.gz")
+        with open(path + ".tmp", 'wb') as batch_file:
+            batch_file.write(encode_batch(batch))
+        os.replace(path + ".tmp", path)
+        spooled = self._spooled()
+        for name in spooled[:max(0, len(spooled) - TELEMETRY_SPOOL_BATCHES)]:
+            try:
+                os.remove(os.path.join(self.spool_dir, name))
+                metrics.TELEMETRY_BATCHES.inc("dropped")
+            except OSError:
+                pass
+
+    def _spooled(self):
+        try:
+            return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json.gz"))
+        except OSError:
+            return []
+
+    def _deliver(self):
+        """ Sends the spooled batches oldest first, stopping at the first failure to back off """
+        for name in self._spooled():
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, 'rb') as batch_file:
+                    body = batch_file.read()
+                self.send(body)
+            except RejectedBatch as e:
+                log_error(f"Telemetry collector rejected {name}, dropping it: {e}", "telemetry.py")
+                metrics.TELEMETRY_BATCHES.inc("rejected")
+            except Exception as e:
+                self.failures += 1
+                delay = min(TELEMETRY_RETRY_MAX, TELEMETRY_RETRY_BASE * 2 ** (self.failures - 1))
+                self.next_attempt = time.monotonic() + random.uniform(delay / 2, delay) # Jitter spreads a fleet's retries out
+                metrics.TELEMETRY_BATCHES.inc("failed")
+                if self.failures == 1: # Only the start of an outage is worth a log line
+                    log_error(f"Failed to send telemetry to {self.url}, retrying with backoff: {e}", "telemetry.py")
+                return False
+            else:
+                self.failures = 0
+                metrics.TELEMETRY_BATCHES.inc("sent")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return True
+
+    def _post(self, body):
+        import urllib.error
+        import urllib.request
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=TELEMETRY_TIMEOUT) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise RejectedBatch(f"HTTP {e.code}") from e
+            raise
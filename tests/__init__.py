@@ -0,0 +1 @@
+# /tests/__init__.py
@@ -0,0 +1,15 @@
+# /tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules resolve logs/, config.json & the journal against the working directory (logger creates logs/ on import),
+# so the tests run from a scratch directory & never touch the checkout
+sys.path.insert(0, REPO_DIR)
+_workdir = tempfile.TemporaryDirectory(prefix="battery_notifier_tests_")
+os.chdir(_workdir.name)
+# The control channel & status segment live in the runtime directory, a scratch one keeps the tests off a running daemon's
+os.environ["XDG_RUNTIME_DIR"] = os.path.join(_workdir.name, "run")
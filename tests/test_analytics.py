@@ -0,0 +1,155 @@
+# /tests/test_analytics.py
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analytics
+import history
+
+START = 1_700_000_000 # 22:13 UTC
+
+def _records(samples):
+    """ RECORD_DTYPE array of (timestamp, percent, power_plugged) samples, as they are laid out in the history file """
+    return np.frombuffer(b"".join(history.encode(*sample) for sample in samples), analytics.RECORD_DTYPE)
+
+def _write_history(path, samples, mode='wb'):
+    with open(path, mode) as history_file:
+        history_file.write(b"".join(history.encode(*sample) for sample in samples))
+
+def _trace():
+    """ A few days of cycles sampled every 30 s, with monitor downtime, a clock set back, charger flapping & idle stretches """
+    noise = random.Random(23)
+    samples, timestamp, percent = [], START, 95.0
+    for day in range(3):
+        while percent > 25: # Discharge
+            samples.append((timestamp, round(percent, 1), False))
+            timestamp += 30
+            percent -= noise.uniform(0, 0.4)
+        for _ in range(6): # Charger flapping, no level change
+            samples.append((timestamp, round(percent, 1), len(samples) % 2 == 0))
+            timestamp += 5
+        if day == 1:
+            timestamp += 3 * 3600 # Monitor not running
+        while percent < 90: # Charge
+            samples.append((timestamp, round(percent, 1), True))
+            timestamp += 30
+            percent += noise.uniform(0.2, 0.8)
+        if day == 0:
+            timestamp -= 2 * 3600 # Clock set back
+    samples.append((timestamp, round(percent, 1), False))
+    return samples
+
+def _assert_same(first, second):
+    first, second = first.to_dict(), second.to_dict()
+    for key in ("hour_change", "hour_seconds"):
+        assert np.allclose(first.pop(key), second.pop(key)), key
+    assert first == second
+
+@pytest.mark.parametrize("chunk", [1, 2, 7, 128, 1000])
+def test_chunked_updates_match_a_full_pass(chunk):
+    records = _records(_trace())
+    full = analytics.WearAnalytics(utc_offset=0).update(records)
+    chunked = analytics.WearAnalytics(utc_offset=0)
+    for first in range(0, len(records), chunk):
+        chunked.update(records[first:first + chunk])
+    _assert_same(full, chunked)
+
+def test_gaps_and_a_clock_set_back_are_not_observed_time():
+    samples = [(START + second, 60, False) for second in range(0, 600, 60)] # 9 minutes
+    samples += [(START + 3600 + second, 58, False) for second in range(0, 300, 60)] # 4 minutes after an hour's downtime
+    samples += [(START + 1800 + second, 57, False) for second in range(0, 180, 60)] # 2 minutes after the clock was set back
+    summary = analytics.WearAnalytics(utc_offset=0).update(_records(samples)).summary()
+    assert summary["hours_observed"] * 3600 == pytest.approx(9 * 60 + 4 * 60 + 2 * 60)
+    # Level changes still count, whether or not the monitor saw them happen
+    assert summary["equivalent_full_cycles"] == pytest.approx(3 / 100)
+
+def test_time_above_the_higher_threshold():
+    samples = [(START + second, 79 + second // 600, second >= 600) for second in range(0, 1800, 60)] # 79 %, 80 % plugged, 81 %
+    summary = analytics.WearAnalytics(higher_threshold=80, utc_offset=0).update(_records(samples)).summary()
+    assert summary["hours_observed"] * 3600 == 1740
+    assert summary["hours_above_higher"] * 3600 == 1140
+    assert summary["hours_above_higher_plugged"] * 3600 == 1140
+
+def test_hourly_rates():
+    # 1 % per 6 minutes unplugged from 10:00 UTC, i.e. 10 % per hour
+    samples = [(START - START % 86400 + 10 * 3600 + minute * 60, 90 - minute / 6, False) for minute in range(0, 121)]
+    summary = analytics.WearAnalytics(utc_offset=0).update(_records(samples)).summary()
+    assert summary["discharge_rate_by_hour"][10] == pytest.approx(10)
+    assert summary["discharge_rate_by_hour"][11] == pytest.approx(10)
+    assert summary["discharge_rate_by_hour"][12] is None and summary["charge_rate_by_hour"][10] is None
+
+def test_a_discharge_spanning_chunks_is_counted_once():
+    samples = [(START + minute * 60, 100 - minute, False) for minute in range(0, 61)] # 100 % -> 40 %
+    samples += [(START + 3660 + minute * 60, 40 + minute, True) for minute in range(1, 10)]
+    records = _records(samples)
+    wear = analytics.WearAnalytics(utc_offset=0)
+    for first in range(0, len(records), 16):
+        wear.update(records[first:first + 16])
+        if first + 16 < 61:
+            assert wear.summary()["depth_of_discharge"]["counts"] == [0] * 10 # Still going on
+    assert wear.summary()["depth_of_discharge"]["counts"] == [0, 0, 0, 0, 0, 0, 1, 0, 0, 0] # One discharge of 60 points
+    assert wear.summary()["current_discharge_depth"] is None
+
+def test_charger_flapping_without_a_level_change_is_no_discharge():
+    samples = [(START + second, 70, second % 20 == 0) for second in range(0, 200, 10)]
+    assert sum(analytics.WearAnalytics(utc_offset=0).update(_records(samples)).dod_counts) == 0
+
+def test_update_analytics_only_reads_new_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_CHUNK_RECORDS", 100) # Several chunks per update
+    history_path, cache_path = str(tmp_path / "history.bin"), str(tmp_path / "analytics.json")
+    samples = _trace()
+    for first in range(0, len(samples), 333):
+        _write_history(history_path, samples[first:first + 333], 'ab')
+        incremental = analytics.update_analytics(history_path, cache_path=cache_path, utc_offset=0)
+    _assert_same(incremental, analytics.update_analytics(history_path, cache_path=None, utc_offset=0))
+    assert incremental.records == len(samples)
+
+    def no_new_records(records):
+        raise AssertionError("Nothing was appended")
+
+    monkeypatch.setattr(analytics.WearAnalytics, "update", no_new_records)
+    analytics.update_analytics(history_path, cache_path=cache_path, utc_offset=0)
+
+@pytest.fixture
+def cached(tmp_path):
+    """ History file with cached aggregates, & a function returning _load_cached's view of it """
+    history_path, cache_path = str(tmp_path / "history.bin"), str(tmp_path / "analytics.json")
+    _write_history(history_path, [(START + minute * 60, 90 - minute / 10, False) for minute in range(100)])
+    analytics.update_analytics(history_path, cache_path=cache_path, utc_offset=0)
+
+    def load(higher_threshold=80, utc_offset=0):
+        mapped = history.HistoryLog(history_path)._map()
+        try:
+            return analytics._load_cached(cache_path, mapped, higher_threshold, utc_offset)
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    load.history_path = history_path
+    return load
+
+def test_the_cache_is_used_for_the_same_history(cached):
+    assert cached().records == 100
+
+def test_the_cache_is_rebuilt_for_other_settings(cached):
+    assert cached(higher_threshold=90) is None
+    assert cached(utc_offset=3600) is None
+
+def test_the_cache_is_rebuilt_for_a_truncated_history(cached):
+    with open(cached.history_path, 'r+b') as history_file:
+        history_file.truncate(50 * history.RECORD_SIZE)
+    assert cached() is None
+
+def test_the_cache_is_rebuilt_for_a_replaced_history(cached):
+    # As many records as before, but not the ones the cache was computed from
+    _write_history(cached.history_path, [(START + 86400 + minute * 60, 50, True) for minute in range(100)])
+    assert cached() is None
+    rebuilt = analytics.update_analytics(cached.history_path, cache_path=None, utc_offset=0)
+    assert rebuilt.summary()["equivalent_full_cycles"] == 0
+
+def test_a_corrupt_cache_is_ignored(cached, tmp_path):
+    (tmp_path / "analytics.json").write_text('{"records": 1')
+    assert cached() is None
@@ -0,0 +1,117 @@
+# /tests/test_battery_report.py
+
+import hashlib
+import os
+import shutil
+
+import pytest
+
+import battery_report
+
+# Trimmed output of `powercfg /batteryreport` on a Dell laptop (report header, installed battery, usage & capacity tables)
+REPORT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "battery-report.html")
+
+@pytest.fixture
+def report_path(tmp_path):
+    """ Copy of the fixture report with an empty memory cache, so tests can touch it & count parses """
+    battery_report._memory_cache.clear()
+    path = tmp_path / "battery_report.html"
+    shutil.copyfile(REPORT_FIXTURE, path)
+    yield str(path)
+    battery_report._memory_cache.clear()
+
+@pytest.fixture
+def parses(monkeypatch):
+    """ Records the path of every report parsed by load_report """
+    parsed = []
+    parse_report = battery_report.parse_report
+
+    def counting(path, *args, **kwargs):
+        parsed.append(path)
+        return parse_report(path, *args, **kwargs)
+
+    monkeypatch.setattr(battery_report, "parse_report", counting)
+    return parsed
+
+def test_installed_battery_capacities_and_cycle_count():
+    report = battery_report.parse_report(REPORT_FIXTURE)
+    assert report["source"] == "powercfg"
+    assert report["batteries"] == [{
+        "name": "DELL 1VX1H", "manufacturer": "BYD", "serial_number": "2617", "chemistry": "LiP",
+        "design_capacity": 41998, "full_charge_capacity": 37564, "cycle_count": 212, "unit": "mWh",
+    }]
+    assert battery_report.health(report["batteries"][0]) == pytest.approx(89.44, abs=0.01)
+
+def test_capacity_history_rows():
+    history = battery_report.parse_report(REPORT_FIXTURE)["capacity_history"]
+    assert [row["period"] for row in history] == [
+        "2024-06-17 - 2024-06-24", "2024-06-24 - 2024-07-01", "2024-07-01 - 2024-07-08", "2024-07-08 - 2024-07-15"]
+    # The week without a reading ("-") has no full charge capacity
+    assert [row["full_charge_capacity"] for row in history] == [38912, 38277, None, 37564]
+    assert {row["design_capacity"] for row in history} == {41998}
+
+def test_other_tables_are_kept_by_section():
+    tables = battery_report.parse_report(REPORT_FIXTURE)["tables"]
+    assert tables["recent usage"]["headers"] == ["START TIME", "STATE", "SOURCE", "CAPACITY REMAINING"]
+    assert tables["recent usage"]["rows"][0] == ["2024-07-12 21:15:03", "Active", "Battery", "54 %", "20,408 mWh"]
+    assert [row[1] for row in tables["recent usage"]["rows"]] == ["Active", "Connected standby", "Active"]
+    assert len(tables["usage history"]["rows"]) == 2
+
+def test_parsing_does_not_depend_on_chunk_boundaries():
+    assert battery_report.parse_report(REPORT_FIXTURE, chunk_size=7) == battery_report.parse_report(REPORT_FIXTURE)
+
+def test_a_report_is_parsed_once_per_content(report_path, parses, tmp_path):
+    cache_dir = str(tmp_path / "report_cache")
+    report = battery_report.load_report(report_path, cache_dir=cache_dir)
+    with open(REPORT_FIXTURE, 'rb') as report_file:
+        digest = hashlib.sha256(report_file.read()).hexdigest()
+    assert os.listdir(cache_dir) == [digest + ".json"]
+    # Unchanged file: served from memory
+    assert battery_report.load_report(report_path, cache_dir=cache_dir) is report
+    # Regenerated report with the same content (or another process): served from the SHA-256 keyed file
+    battery_report._memory_cache.clear()
+    os.utime(report_path, ns=(0, 0))
+    assert battery_report.load_report(report_path, cache_dir=cache_dir) == report
+    assert parses == [report_path]
+
+def test_a_changed_report_is_parsed_again(report_path, parses, tmp_path):
+    cache_dir = str(tmp_path / "report_cache")
+    battery_report.load_report(report_path, cache_dir=cache_dir)
+    with open(report_path, 'r') as report_file:
+        content = report_file.read()
+    with open(report_path, 'w') as report_file:
+        report_file.write(content.replace("37,564 mWh", "37,102 mWh", 1))
+    report = battery_report.load_report(report_path, cache_dir=cache_dir)
+    assert report["batteries"][0]["full_charge_capacity"] == 37102
+    assert parses == [report_path, report_path]
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_a_corrupt_cache_file_is_replaced(report_path, parses, tmp_path):
+    cache_dir = tmp_path / "report_cache"
+    battery_report.load_report(report_path, cache_dir=str(cache_dir))
+    cache_path = cache_dir / os.listdir(cache_dir)[0]
+    cache_path.write_text('{"source": "powe')
+    battery_report._memory_cache.clear()
+    report = battery_report.load_report(report_path, cache_dir=str(cache_dir))
+    assert report["batteries"][0]["cycle_count"] == 212
+    assert len(parses) == 2
+
+def _write_supply(root, name, **files):
+    os.makedirs(root / name)
+    for file_name, value in files.items():
+        (root / name / file_name).write_text(f"{value}\n")
+
+def test_sysfs_health(tmp_path):
+    _write_supply(tmp_path, "AC", type="Mains", online=1)
+    _write_supply(tmp_path, "BAT0", type="Battery", model_name="5B10W13975", manufacturer="SMP", technology="Li-poly",
+                  energy_full_design=57000000, energy_full=51300000, cycle_count=148)
+    _write_supply(tmp_path, "BAT1", type="Battery", charge_full_design=4000000, charge_full=3600000, cycle_count=0)
+    batteries = battery_report.read_sysfs_health(str(tmp_path))["batteries"]
+    assert [battery["name"] for battery in batteries] == ["5B10W13975", "BAT1"]
+    assert batteries[0]["design_capacity"] == 57000 and batteries[0]["full_charge_capacity"] == 51300
+    assert batteries[0]["cycle_count"] == 148 and batteries[0]["unit"] == "mWh"
+    assert batteries[1]["unit"] == "mAh" and batteries[1]["cycle_count"] is None # 0 means unknown
+    assert battery_report.health(batteries[0]) == pytest.approx(90.0)
+
+def test_sysfs_health_without_power_supplies(tmp_path):
+    assert battery_report.read_sysfs_health(str(tmp_path / "missing"))["batteries"] == []
@@ -0,0 +1,46 @@
+# /tests/test_battery_utility.py
+
+import pytest
+
+import battery_utility
+import history
+import simulate
+
+from battery_utility import ASSUMED_RATE, MAX_POLL_INTERVAL, MIN_POLL_INTERVAL, next_poll_interval
+
+def test_half_the_predicted_time_to_the_target():
+    assert next_poll_interval(50, 40, -10 / 60) == pytest.approx(30) # 10 points at 10 %/min is 60 s
+    assert next_poll_interval(30, 25, -10 / 60) == pytest.approx(15)
+    assert next_poll_interval(75, 80, 20 / 60) == pytest.approx(7.5) # Charging works the same
+
+def test_clamped_to_the_poll_bounds():
+    assert next_poll_interval(90, 20, -10 / 60) == MAX_POLL_INTERVAL
+    assert next_poll_interval(21, 20, -60 / 60) == MIN_POLL_INTERVAL # Half a second away
+    assert next_poll_interval(20, 20, -10 / 60) == MIN_POLL_INTERVAL # Already there
+
+@pytest.mark.parametrize("rate", [None, 0, 0.0, 0.1 / 60, -0.1 / 60])
+def test_unknown_or_slow_rates_assume_the_default_rate(rate):
+    assert next_poll_interval(21.5, 20, rate) == pytest.approx(1.5 / ASSUMED_RATE / 2)
+
+def test_no_target_left_polls_at_the_maximum_interval():
+    assert next_poll_interval(50, None) == MAX_POLL_INTERVAL
+    assert next_poll_interval(50, None, -100) == MAX_POLL_INTERVAL
+
+@pytest.mark.parametrize("rate", [0.3, 1, 2, 5])
+def test_discharge_traces_wake_rarely_without_missing_the_threshold(rate):
+    # A steady discharge at rate %/min to 5 %, sampled every 10 s
+    trace = [history.Sample(float(second), round(max(5, 100 - rate * second / 60), 1), False, None)
+             for second in range(0, int(95 / rate * 60) + 600, 10)]
+    config = {"lower_threshold": 20, "higher_threshold": 80}
+    actions, checks = simulate.replay(trace, config)
+    summary = simulate.summarize(trace, actions, checks, config)
+    assert summary["crossings"] == 1 and summary["missed_crossings"] == 0
+    assert summary["max_detection_latency_s"] < 10 # Seen by the check of the sample that reached it
+    # 3600 / MAX_POLL_INTERVAL is the floor, a fixed 1 s poll would be 3600
+    assert 3600 / MAX_POLL_INTERVAL <= summary["wakeups_per_hour"] <= 150
+
+def test_plug_changes_are_seen_within_the_maximum_interval():
+    trace = [history.Sample(float(second), 50, second >= 3600, None) for second in range(0, 7200, 10)]
+    actions, _ = simulate.replay(trace, {"lower_threshold": 20, "higher_threshold": 80})
+    plugged = [action["time"] for action in actions if action["action"] == "notify" and action["kind"] == "plug"]
+    assert len(plugged) == 1 and 3600 <= plugged[0] < 3600 + battery_utility.MAX_POLL_INTERVAL
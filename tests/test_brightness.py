@@ -0,0 +1,66 @@
+# /tests/test_brightness.py
+
+import sys
+import threading
+import types
+
+import brightness
+
+def _in_thread(function):
+    """ Runs function on a new thread & returns its result """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+def test_controller_connects_once_per_thread():
+    backend = brightness.FakeBrightnessBackend(60)
+    controller = brightness.BrightnessController(backend)
+    assert controller.get(refresh=True) == 60
+    assert controller.get(refresh=True) == 60
+    assert backend.calls["connect"] == 1
+    assert _in_thread(lambda: controller.get(refresh=True)) == 60
+    assert backend.calls["connect"] == 2
+
+def test_controller_reconnects_after_a_failure():
+    backend = brightness.FakeBrightnessBackend(60)
+    controller = brightness.BrightnessController(backend)
+    controller.get()
+    backend.failures = 1
+    controller.set(30)
+    assert backend.level == 30
+    assert backend.calls["connect"] == 2
+
+def test_controller_skips_redundant_sets():
+    now = [0.0]
+    backend = brightness.FakeBrightnessBackend(60)
+    controller = brightness.BrightnessController(backend, clock=lambda: now[0])
+    controller.set(40)
+    controller.set(40)
+    assert backend.calls["set"] == 1
+    now[0] += brightness.BRIGHTNESS_CACHE_SECONDS + 1
+    controller.set(40)
+    assert backend.calls["set"] == 2
+
+def test_wmi_backend_uses_the_objects_of_the_calling_thread(monkeypatch):
+    created = [] # Thread that created each fake COM object
+
+    class FakeMonitorService:
+        def __init__(self, namespace):
+            self.thread = threading.get_ident()
+            created.append(self.thread)
+
+        def WmiMonitorBrightnessMethods(self):
+            return [self]
+
+        def WmiMonitorBrightness(self):
+            # A COM object used from another apartment is what the backend must avoid
+            assert threading.get_ident() == self.thread
+            return [types.SimpleNamespace(CurrentBrightness=70)]
+
+    monkeypatch.setitem(sys.modules, "wmi", types.SimpleNamespace(WMI=FakeMonitorService))
+    controller = brightness.BrightnessController(brightness.WmiBrightnessBackend())
+    assert controller.get(refresh=True) == 70
+    assert _in_thread(lambda: controller.get(refresh=True)) == 70
+    assert len(set(created)) == 2
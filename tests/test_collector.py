@@ -0,0 +1,133 @@
+# /tests/test_collector.py
+
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import collector
+
+@pytest.fixture
+def store():
+    store = collector.FleetStore(":memory:")
+    yield store
+    store.close()
+
+def _batch(batch_id, device="laptop-1", ts=1000.0, percent=50, power_plugged=False, events=(), lower_threshold=20):
+    return {
+        "id": batch_id, "device": device, "samples": [[ts - 60, percent + 1, power_plugged, -0.01], [ts, percent, power_plugged, -0.01]],
+        "events": list(events),
+        "state": {"ts": ts, "percent": percent, "power_plugged": power_plugged, "rate": -0.01, "saver_on": False,
+                  "lower_threshold": lower_threshold, "higher_threshold": 80},
+    }
+
+def test_a_retried_batch_is_stored_once(store):
+    assert store.write([_batch("a"), _batch("b", ts=1060.0)]) == [True, True]
+    assert store.write([_batch("b", ts=1060.0), _batch("c", ts=1120.0)]) == [False, True]
+    assert store.counts() == {"devices": 1, "batches": 3, "samples": 6, "events": 0}
+
+def test_a_late_batch_does_not_replace_a_newer_state(store):
+    store.write([_batch("new", ts=2000.0, percent=40)])
+    store.write([_batch("old", ts=1000.0, percent=70)]) # Retried after the newer one got through
+    assert [(device["last_seen"], device["percent"]) for device in store.devices()] == [(2000.0, 40)]
+    assert store.counts()["samples"] == 4
+
+def test_devices_below_their_threshold(store):
+    store.write([
+        _batch("1", device="low", ts=1000.0, percent=15),
+        _batch("2", device="charging", ts=1000.0, percent=10, power_plugged=True),
+        _batch("3", device="custom", ts=1000.0, percent=25, lower_threshold=30),
+        _batch("4", device="fine", ts=1000.0, percent=60),
+        _batch("5", device="stale", ts=100.0, percent=5),
+    ])
+    assert [device["device"] for device in store.below_threshold(now=1100.0)] == ["low", "custom"]
+
+def test_a_failing_batch_only_undoes_itself(store):
+    overflowing = _batch("bad", device="laptop-2")
+    overflowing["samples"][0][1] = 2 ** 70 # Valid JSON & a number, but beyond SQLite's integers
+    outcomes = store.write([_batch("a"), overflowing, _batch("b", ts=1060.0)])
+    assert outcomes[0] is True and outcomes[2] is True
+    assert isinstance(outcomes[1], OverflowError)
+    assert store.counts() == {"devices": 1, "batches": 2, "samples": 4, "events": 0}
+    # Not marked as stored, a fixed retry of the batch goes through
+    assert store.write([_batch("bad", device="laptop-2")]) == [True]
+
+def test_events_are_filtered_with_their_fields(store):
+    store.write([_batch("a", events=[{"ts": 990.0, "kind": "unplug", "percent": 51}, {"ts": 995.0, "kind": "threshold_crossed",
+                                                                                      "threshold": "low", "percent": 50}]),
+                 _batch("b", device="laptop-2", events=[{"ts": 998.0, "kind": "unplug", "percent": 80}])])
+    assert [(event["device"], event["percent"]) for event in store.events(kind="unplug")] == [("laptop-2", 80), ("laptop-1", 51)]
+    assert store.events(kind="threshold_crossed")[0]["threshold"] == "low"
+    assert [event["ts"] for event in store.events(device="laptop-1", since=992.0)] == [995.0]
+
+@pytest.mark.parametrize("batch", [
+    [],
+    {"device": "laptop-1"},
+    {"id": "a", "device": "laptop-1", "samples": [[1000.0, 50]]},
+    {"id": "a", "device": "laptop-1", "events": [{"kind": "unplug"}]},
+    {"id": "a", "device": "laptop-1", "state": [1000.0, 50]},
+    {"id": "a", "device": "laptop-1", "samples": [[1000.0, {"percent": 50}, False, None]]},
+    {"id": "a", "device": "laptop-1", "samples": [["1000", 50, False, None]]},
+    {"id": "a", "device": "laptop-1", "samples": [[1000.0, 50, "no", None]]},
+    {"id": "a", "device": "laptop-1", "samples": [[1000.0, 50, False, [0.1]]]},
+    {"id": "a", "device": "laptop-1", "events": [{"ts": None, "kind": "unplug"}]},
+    {"id": "a", "device": "laptop-1", "events": [{"ts": 1000.0, "kind": ["unplug"]}]},
+    {"id": "a", "device": "laptop-1", "state": {"ts": 1000.0, "percent": {"now": 50}}},
+    {"id": "a", "device": "laptop-1", "state": {"ts": "yesterday"}},
+])
+def test_malformed_batches_are_rejected(batch):
+    with pytest.raises(ValueError):
+        collector.validate_batch(batch)
+
+async def _request(port, method, path, body=b"", headers=()):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", f"Content-Length: {len(body)}", "Connection: close", *headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    response = await reader.read()
+    writer.close()
+    status_line, _, payload = response.partition(b"\r\n\r\n")
+    return status_line.split(b"\r\n")[0].decode(), json.loads(payload)
+
+def test_ingest_over_http(store):
+    async def scenario():
+        server = await collector.Collector(store, port=0, token="s3cret").start()
+        authorization = "Authorization: Bearer s3cret"
+        body = gzip.compress(json.dumps(_batch("a", percent=15)).encode())
+        try:
+            results = [
+                await _request(server.port, "POST", "/ingest", body, ("Content-Encoding: gzip", "Authorization: Bearer guess")),
+                await _request(server.port, "POST", "/ingest", body, ("Content-Encoding: gzip", authorization)),
+                await _request(server.port, "POST", "/ingest", body, ("Content-Encoding: gzip", authorization)),
+                await _request(server.port, "POST", "/ingest", b'{"id": 1}', (authorization,)),
+                await _request(server.port, "GET", "/devices/below-threshold", headers=(authorization,)),
+                await _request(server.port, "GET", "/nowhere", headers=(authorization,)),
+            ]
+        finally:
+            await server.stop()
+        return results, server.stats
+
+    (unauthorized, stored, retried, invalid, below, missing), stats = asyncio.run(scenario())
+    assert unauthorized[0] == "HTTP/1.1 401 Unauthorized"
+    assert stored == ("HTTP/1.1 200 OK", {"stored": "a"}) and retried == stored
+    assert invalid[0] == "HTTP/1.1 400 Bad Request"
+    assert below[1] == [] # Its report is from 1970, too old to count as the device's current state
+    assert missing[0] == "HTTP/1.1 404 Not Found"
+    assert (stats["batches"], stats["duplicates"], stats["rejected"]) == (1, 1, 1)
+
+def test_a_bad_batch_does_not_fail_the_uploads_committed_with_it(store):
+    async def scenario():
+        server = await collector.Collector(store, port=0).start()
+        invalid = dict(_batch("invalid", device="laptop-2"), state={"ts": 1000.0, "percent": {"now": 50}})
+        overflowing = _batch("overflowing", device="laptop-3")
+        overflowing["samples"][0][1] = 2 ** 70
+        try:
+            # Sent together so the writer commits them in one transaction
+            return await asyncio.gather(*(_request(server.port, "POST", "/ingest", json.dumps(batch).encode())
+                                          for batch in (_batch("a"), invalid, overflowing, _batch("b", device="laptop-4"))))
+        finally:
+            await server.stop()
+
+    responses = asyncio.run(scenario())
+    assert [status for status, _ in responses] == ["HTTP/1.1 200 OK", "HTTP/1.1 400 Bad Request", "HTTP/1.1 400 Bad Request", "HTTP/1.1 200 OK"]
+    assert [device["device"] for device in store.devices()] == ["laptop-1", "laptop-4"]
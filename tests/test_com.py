@@ -0,0 +1,47 @@
+# /tests/test_com.py
+
+import sys
+import threading
+import types
+
+import pytest
+
+import brightness
+import com
+
+@pytest.fixture
+def pythoncom(monkeypatch):
+    """ Pretends to run on Windows with a pythoncom that records which thread (un)initialised COM """
+    calls = []
+    monkeypatch.setattr(com.sys, "platform", "win32")
+    monkeypatch.setitem(sys.modules, "pythoncom", types.SimpleNamespace(
+        CoInitialize=lambda: calls.append(("init", threading.get_ident())),
+        CoUninitialize=lambda: calls.append(("uninit", threading.get_ident()))))
+    return calls
+
+def test_thread_target_runs_with_com_initialised(pythoncom):
+    seen = []
+    thread = threading.Thread(target=com.run_initialized, args=(lambda value: seen.append((value, list(pythoncom))), "checked"))
+    thread.start()
+    thread.join()
+    (value, during), = seen
+    assert value == "checked"
+    assert during == [("init", thread.ident)]
+    assert pythoncom == [("init", thread.ident), ("uninit", thread.ident)]
+
+def test_com_is_uninitialised_when_the_target_fails(pythoncom):
+    def failing():
+        raise RuntimeError("monitor crashed")
+
+    with pytest.raises(RuntimeError):
+        com.run_initialized(failing)
+    assert [call for call, _ in pythoncom] == ["init", "uninit"]
+
+def test_thread_brightness_connection_is_released_before_uninitialising(pythoncom, monkeypatch):
+    backend = brightness.FakeBrightnessBackend(60)
+    backend.reset = lambda: pythoncom.append(("reset", threading.get_ident()))
+    monkeypatch.setattr(brightness, "_default_controller", brightness.BrightnessController(backend))
+    thread = threading.Thread(target=com.run_initialized, args=(lambda: brightness.get_controller().get(),))
+    thread.start()
+    thread.join()
+    assert [call for call, _ in pythoncom] == ["init", "reset", "uninit"]
@@ -0,0 +1,125 @@
+# /tests/test_config_store.py
+
+import contextlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import config_store
+import dialogs
+
+DEFAULTS = {"lower_threshold": 20, "higher_threshold": 80, "startup": False, "dark_mode": False,
+            "battery_saver_on": False, "current_brightness": 50}
+
+# Checkout the writer processes import config_store from
+REPO_DIR = os.path.dirname(os.path.abspath(config_store.__file__))
+# Writer process of the stress test: each thread counts its own field up, alternating direct & debounced updates
+_WRITER_SCRIPT = """
+import sys, threading
+import config_store
+path, name, threads, updates = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+def write(field):
+    for count in range(1, updates + 1):
+        config_store.update_config({field: count}, path, delay=0 if count % 2 else 0.001)
+workers = [threading.Thread(target=write, args=(f"{name}_{index}",)) for index in range(threads)]
+for worker in workers:
+    worker.start()
+for worker in workers:
+    worker.join()
+config_store.flush_config()
+"""
+
+@pytest.fixture
+def errors(monkeypatch):
+    """ Messages of the error dialogs, recorded instead of shown """
+    shown = []
+    monkeypatch.setattr(dialogs, "show_error", lambda title, message: shown.append(message))
+    return shown
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch, errors):
+    """ Scratch config with static defaults, the real ones query powercfg & WMI """
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"lower_threshold": 20, "higher_threshold": 80}))
+    config_store.invalidate()
+    monkeypatch.setattr(config_store, "default_config", lambda: dict(DEFAULTS))
+    yield path
+    config_store.flush_config()
+    config_store.invalidate()
+
+def test_a_same_size_rewrite_within_the_mtime_resolution_is_seen(config_path):
+    assert config_store.load_config(str(config_path))["lower_threshold"] == 20
+    status = os.stat(config_path)
+    replacement = config_path.with_name("replacement.json")
+    replacement.write_text(json.dumps({"lower_threshold": 30, "higher_threshold": 80}))
+    os.utime(replacement, ns=(status.st_atime_ns, status.st_mtime_ns))
+    os.replace(replacement, config_path)
+    assert config_store.load_config(str(config_path))["lower_threshold"] == 30
+
+def test_an_invalid_config_is_reset_to_the_defaults(config_path, errors):
+    config_path.write_text("{\"lower_threshold\": 2")
+    assert config_store.load_config(str(config_path)) == DEFAULTS
+    assert json.loads(config_path.read_text()) == DEFAULTS
+    assert len(errors) == 1
+
+def test_defaults_are_returned_when_they_cannot_be_saved(config_path, monkeypatch):
+    def read_only(config, path):
+        raise PermissionError(f"Permission denied: {path}")
+
+    config_path.unlink()
+    monkeypatch.setattr(config_store, "_write_atomic", read_only)
+    config_store._cache["config"] = None # Nothing loaded yet in this process
+    assert config_store.load_config(str(config_path)) == DEFAULTS
+
+def test_updates_are_merged_into_the_latest_file(config_path):
+    config_store.update_config({"dark_mode": True}, str(config_path), delay=60)
+    config_path.write_text(json.dumps({"lower_threshold": 25, "higher_threshold": 80})) # Another process
+    assert config_store.load_config(str(config_path))["dark_mode"] is True
+    config_store.flush_config(str(config_path))
+    assert json.loads(config_path.read_text()) == {"lower_threshold": 25, "higher_threshold": 80, "dark_mode": True}
+
+def test_a_flush_without_a_readable_config_builds_the_defaults_outside_the_file_lock(config_path, monkeypatch):
+    held = []
+    config_lock = config_store.config_lock
+
+    @contextlib.contextmanager
+    def tracking_lock(path):
+        with config_lock(path):
+            held.append(True)
+            try:
+                yield
+            finally:
+                held.pop()
+
+    def defaults():
+        assert not held, "The defaults query powercfg & WMI, other processes' writers shouldn't wait for them"
+        return dict(DEFAULTS)
+
+    config_path.unlink()
+    monkeypatch.setattr(config_store, "config_lock", tracking_lock)
+    monkeypatch.setattr(config_store, "default_config", defaults)
+    config_store.update_config({"startup": True}, str(config_path), delay=0)
+    assert json.loads(config_path.read_text()) == dict(DEFAULTS, startup=True)
+
+def test_concurrent_writers_lose_no_updates_and_never_tear_the_file(config_path):
+    processes, threads, updates = 4, 2, 40
+    writers = [subprocess.Popen([sys.executable, "-c", _WRITER_SCRIPT, str(config_path), f"writer_{index}", str(threads), str(updates)],
+                                env=dict(os.environ, PYTHONPATH=REPO_DIR), cwd=str(config_path.parent), stderr=subprocess.PIPE)
+               for index in range(processes)]
+    reads = 0
+    while any(writer.poll() is None for writer in writers):
+        # Raw reads, a torn or half written file would fail to parse
+        with open(config_path, 'r') as config_file:
+            content = config_file.read()
+        json.loads(content)
+        reads += 1
+    for writer in writers:
+        assert writer.returncode == 0, writer.stderr.read().decode()
+        writer.stderr.close()
+    final = json.loads(config_path.read_text())
+    assert final == dict({f"writer_{index}_{thread}": updates for index in range(processes) for thread in range(threads)},
+                         lower_threshold=20, higher_threshold=80)
+    assert reads > 0
@@ -0,0 +1,150 @@
+# /tests/test_control.py
+
+import os
+import socket
+import stat
+import sys
+import threading
+
+import pytest
+
+import control
+import runtime
+
+posix_only = pytest.mark.skipif(sys.platform == "win32", reason="POSIX permissions")
+
+def test_runtime_dir_is_under_the_scratch_runtime_dir():
+    assert runtime.RUNTIME_DIR == os.path.join(os.environ["XDG_RUNTIME_DIR"], "battery-notifier")
+
+@posix_only
+def test_runtime_dir_is_private(tmp_path):
+    path = tmp_path / "runtime"
+    runtime.ensure_runtime_dir(str(path))
+    assert stat.S_IMODE(path.stat().st_mode) == 0o700
+    path.chmod(0o777)
+    runtime.ensure_runtime_dir(str(path))
+    assert stat.S_IMODE(path.stat().st_mode) == 0o700
+
+@posix_only
+def test_runtime_dir_planted_as_a_symlink_is_refused(tmp_path):
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", tmp_path / "runtime")
+    with pytest.raises(PermissionError):
+        runtime.ensure_runtime_dir(str(tmp_path / "runtime"))
+
+@posix_only
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to create a directory for another user")
+def test_runtime_dir_of_another_user_is_refused(tmp_path):
+    path = tmp_path / "runtime"
+    path.mkdir(mode=0o700)
+    os.chown(path, 65534, 65534)
+    with pytest.raises(PermissionError):
+        runtime.ensure_runtime_dir(str(path))
+
+@posix_only
+def test_key_is_never_written_through_a_planted_symlink(tmp_path, monkeypatch):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"precious")
+    key_path = tmp_path / "runtime" / "control.key"
+    runtime.ensure_runtime_dir(str(key_path.parent))
+    os.symlink(victim, key_path)
+    monkeypatch.setattr(control, "CONTROL_KEY_PATH", str(key_path))
+    key = control._create_key()
+    assert victim.read_bytes() == b"precious"
+    assert not key_path.is_symlink()
+    assert stat.S_IMODE(key_path.stat().st_mode) == 0o600
+    assert control._read_key() == key
+
+@posix_only
+def test_reading_the_key_refuses_a_symlink(tmp_path, monkeypatch):
+    (tmp_path / "other.key").write_bytes(b"not ours")
+    os.symlink(tmp_path / "other.key", tmp_path / "control.key")
+    monkeypatch.setattr(control, "CONTROL_KEY_PATH", str(tmp_path / "control.key"))
+    with pytest.raises(OSError):
+        control._read_key()
+
+def test_commands_round_trip_through_the_control_channel():
+    server = control.ControlServer({"echo": lambda value: value, "fail": lambda: 1 / 0})
+    server.start()
+    try:
+        assert control.is_running()
+        assert control.send_command("echo", {"percent": 42}) == {"percent": 42}
+        with pytest.raises(RuntimeError, match="division by zero"):
+            control.send_command("fail")
+        with pytest.raises(RuntimeError, match="Unknown command"):
+            control.send_command("nope")
+        with pytest.raises(RuntimeError, match="already running"):
+            control.ControlServer({}).start()
+    finally:
+        server.stop()
+    assert not control.is_running()
+
+def test_a_listener_with_another_key_is_not_our_daemon(tmp_path):
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+
+    address = str(tmp_path / "c.sock") if sys.platform != "win32" else r"\\.\pipe\battery-notifier-test-other-key"
+    listener = Listener(address, authkey=b"someone else's key")
+
+    def serve():
+        try:
+            listener.accept().close()
+        except (AuthenticationError, OSError, EOFError):
+            pass
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        assert not control.is_running(address)
+    finally:
+        thread.join(control.CONTROL_TIMEOUT)
+        listener.close()
+
+@posix_only
+def test_a_stale_socket_is_taken_over(tmp_path):
+    address = str(tmp_path / "c.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(address) # Left behind by a daemon that died, nothing accepts on it
+    stale.close()
+    server = control.ControlServer({}, address=address, lock_path=str(tmp_path / "c.lock"))
+    server.start()
+    try:
+        assert control.send_command("ping", address=address) == "pong"
+    finally:
+        server.stop()
+    assert not os.path.exists(address)
+
+def test_only_one_of_concurrent_servers_binds(tmp_path):
+    address = str(tmp_path / "c.sock") if sys.platform != "win32" else r"\\.\pipe\battery-notifier-test-concurrent"
+    servers = [control.ControlServer({}, address=address, lock_path=str(tmp_path / "c.lock")) for _ in range(4)]
+    barrier, outcomes = threading.Barrier(len(servers)), []
+
+    def start(server):
+        barrier.wait()
+        try:
+            server.start()
+            outcomes.append(server)
+        except RuntimeError as e:
+            outcomes.append(str(e))
+
+    threads = [threading.Thread(target=start, args=(server,)) for server in servers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    started = [outcome for outcome in outcomes if isinstance(outcome, control.ControlServer)]
+    try:
+        assert len(started) == 1
+        assert outcomes.count("Monitoring is already running.") == len(servers) - 1
+        assert control.send_command("ping", address=address) == "pong"
+    finally:
+        for server in started:
+            server.stop()
+
+def test_the_lock_is_released_on_stop(tmp_path):
+    address = str(tmp_path / "c.sock") if sys.platform != "win32" else r"\\.\pipe\battery-notifier-test-restart"
+    for _ in range(2):
+        server = control.ControlServer({}, address=address, lock_path=str(tmp_path / "c.lock"))
+        server.start()
+        server.stop()
+    assert not control.is_running(address)
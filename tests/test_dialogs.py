@@ -0,0 +1,15 @@
+# /tests/test_dialogs.py
+
+import types
+
+import dialogs
+
+def test_message_boxes_go_through_tkinter_on_first_use(monkeypatch):
+    shown = []
+    monkeypatch.setattr(dialogs, "_messagebox", lambda: types.SimpleNamespace(
+        showinfo=lambda *args: shown.append(("info", *args)), showwarning=lambda *args: shown.append(("warning", *args)),
+        showerror=lambda *args: shown.append(("error", *args))))
+    dialogs.show_info("Battery Saver", "Battery Saver mode activated successfully.")
+    dialogs.show_warning("Battery", "Battery is at 20%.")
+    dialogs.show_error("Error", "Failed to load configuration file.")
+    assert [kind for kind, _, _ in shown] == ["info", "warning", "error"]
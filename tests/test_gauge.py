@@ -0,0 +1,212 @@
+# /tests/test_gauge.py
+
+import pytest
+
+import gauge
+import history
+import sensors
+import status_segment
+
+NOW = 1_700_000_000.0
+
+class FakeCanvas:
+    """ Records every canvas call, items are plain ids """
+
+    def __init__(self, background="white"):
+        self.options = {"bg": background}
+        self.calls = []
+        self.items = {}
+        self.scheduled = {}
+
+    def __getitem__(self, option):
+        return self.options[option]
+
+    def _create(self, kind, *coords, **options):
+        item = len(self.items) + 1
+        self.items[item] = dict(options, kind=kind, coords=coords)
+        self.calls.append(("create", kind))
+        return item
+
+    def create_rectangle(self, *coords, **options):
+        return self._create("rectangle", *coords, **options)
+
+    def create_text(self, *coords, **options):
+        return self._create("text", *coords, **options)
+
+    def create_line(self, *coords, **options):
+        return self._create("line", *coords, **options)
+
+    def coords(self, item, *coords):
+        self.items[item]["coords"] = coords
+        self.calls.append(("coords", item))
+
+    def itemconfig(self, item, **options):
+        self.items[item].update(options)
+        self.calls.append(("itemconfig", item, tuple(sorted(options))))
+
+    def after(self, ms, callback):
+        after_id = f"after#{len(self.scheduled) + 1}"
+        self.scheduled[after_id] = callback
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.scheduled.pop(after_id)
+
+class FakeReader:
+    def __init__(self):
+        self.value = (0, None, (), False)
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def latest(self):
+        return self.value
+
+class FakeLabel:
+    def __init__(self):
+        self.texts = []
+
+    def config(self, text):
+        self.texts.append(text)
+
+class FakeSensor:
+    def __init__(self, percent=42, power_plugged=False):
+        self.reading = sensors.BatteryReading(percent, power_plugged, None, None, None)
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        if isinstance(self.reading, Exception):
+            raise self.reading
+        return self.reading
+
+@pytest.fixture
+def canvas():
+    return FakeCanvas()
+
+@pytest.fixture
+def drawn(canvas):
+    """ A gauge whose creation calls were cleared, so canvas.calls only holds the redraws """
+    battery_gauge = gauge.BatteryGauge(canvas, FakeReader())
+    canvas.calls.clear()
+    return battery_gauge
+
+def test_items_are_created_once(canvas):
+    battery_gauge = gauge.BatteryGauge(canvas, FakeReader())
+    assert [call for call in canvas.calls if call[0] == "create"] == [("create", "rectangle"), ("create", "rectangle"), ("create", "text"), ("create", "line")]
+    for percent in range(0, 101, 5):
+        battery_gauge.show(percent, percent % 2 == 0, tuple(range(percent)))
+    assert len(canvas.items) == 4 and sum(1 for call in canvas.calls if call[0] == "create") == 4
+
+def test_unchanged_readings_are_not_redrawn(canvas, drawn):
+    drawn.show(57.2, False, (60, 58))
+    assert canvas.items[drawn._text]["text"] == "57%" and canvas.items[drawn._sparkline]["state"] == "normal"
+    canvas.calls.clear()
+    drawn.show(57.2, False, (60, 58))
+    drawn.show(56.8, False, (60, 58)) # Still 57 % once rounded
+    assert canvas.calls == []
+
+def test_only_the_changed_part_is_redrawn(canvas, drawn):
+    drawn.show(57, False, (60, 58))
+    canvas.calls.clear()
+    drawn.show(57, True, (60, 58))
+    assert canvas.calls == [("coords", drawn._fill), ("itemconfig", drawn._text, ("text",))]
+    assert canvas.items[drawn._text]["text"] == "57% (plugged in)"
+    canvas.calls.clear()
+    drawn.show(57, True, (60, 58, 57))
+    assert canvas.calls == [("coords", drawn._sparkline), ("itemconfig", drawn._sparkline, ("state",))]
+    canvas.calls.clear()
+    drawn.show(57, True, (57,)) # Too short to draw
+    assert canvas.calls == [("itemconfig", drawn._sparkline, ("state",))] and canvas.items[drawn._sparkline]["state"] == "hidden"
+
+def test_the_fill_follows_the_level(canvas, drawn):
+    drawn.show(50, False)
+    assert canvas.items[drawn._fill]["coords"] == (5, 5, 5 + 0.5 * (drawn.width - 5), drawn.height + 5)
+
+def test_refresh_only_draws_new_readings(canvas):
+    reader, label = FakeReader(), FakeLabel()
+    battery_gauge = gauge.BatteryGauge(canvas, reader, status_label=label)
+    battery_gauge.start()
+    assert reader.running and len(canvas.scheduled) == 1
+    assert label.texts == ["Monitoring: off"] # Nothing read yet
+    canvas.calls.clear()
+    reader.value = (1, sensors.BatteryReading(80, True, None, None, None), (79, 80), True)
+    canvas.scheduled.popitem()[1]()
+    assert canvas.calls and label.texts == ["Monitoring: off", "Monitoring: on"]
+    canvas.calls.clear()
+    for _ in range(3):
+        canvas.scheduled.popitem()[1]() # Same version
+    reader.value = (2, sensors.BatteryReading(80, True, None, None, None), (79, 80), True) # New poll, same reading
+    canvas.scheduled.popitem()[1]()
+    assert canvas.calls == [] and label.texts == ["Monitoring: off", "Monitoring: on"]
+    reader.value = (3, None, (), False) # Daemon gone & no battery read
+    canvas.scheduled.popitem()[1]()
+    assert canvas.calls == [] and label.texts == ["Monitoring: off", "Monitoring: on", "Monitoring: off"]
+    battery_gauge.stop()
+    assert not canvas.scheduled and not reader.running
+
+@pytest.fixture
+def segment(tmp_path):
+    writer = status_segment.StatusWriter(str(tmp_path / "status"))
+    yield writer
+    writer.close()
+
+def _reader(tmp_path, sensor, clock=lambda: NOW):
+    return gauge.BatteryReader(sensor=sensor, history_log=history.HistoryLog(str(tmp_path / "history.bin")),
+                               status=status_segment.StatusReader(str(tmp_path / "status")), clock=clock)
+
+def test_the_daemon_status_is_used_while_it_is_alive(tmp_path, segment):
+    segment.publish(percent=77, power_plugged=True, next_check=NOW + 5, now=NOW)
+    sensor = FakeSensor()
+    reader = _reader(tmp_path, sensor)
+    reader.poll()
+    version, reading, trend, monitoring = reader.latest()
+    assert version == 1 and monitoring and (reading.percent, reading.power_plugged) == (77, True)
+    assert sensor.reads == 0 and trend == (77,)
+
+@pytest.mark.parametrize("stopped", [False, True])
+def test_the_sensor_is_read_when_the_daemon_is_not_alive(tmp_path, segment, stopped):
+    segment.publish(percent=77, power_plugged=True, next_check=NOW + 5, now=NOW)
+    if stopped:
+        segment.publish(state="stopped", now=NOW)
+        clock = lambda: NOW
+    else:
+        clock = lambda: NOW + 5 + status_segment.STATUS_GRACE + 1 # Heartbeat overdue
+    sensor = FakeSensor(42, False)
+    reader = _reader(tmp_path, sensor, clock)
+    reader.poll()
+    _, reading, _, monitoring = reader.latest()
+    assert not monitoring and sensor.reads == 1 and reading.percent == 42
+
+def test_the_sensor_is_read_without_a_status_segment(tmp_path):
+    sensor = FakeSensor(42, False)
+    reader = _reader(tmp_path, sensor)
+    reader.poll()
+    reader.poll()
+    version, reading, trend, monitoring = reader.latest()
+    assert version == 2 and not monitoring and reading.percent == 42 and trend == (42, 42) and sensor.reads == 2
+
+def test_a_failing_sensor_publishes_no_reading(tmp_path, monkeypatch):
+    errors = []
+    monkeypatch.setattr(gauge, "log_error", lambda message, caller: errors.append(message))
+    sensor = FakeSensor()
+    sensor.reading = OSError("no battery")
+    reader = _reader(tmp_path, sensor)
+    reader.poll()
+    assert reader.latest()[1:] == (None, (), False)
+    assert errors == ["Failed to read the battery for the gauge: no battery"]
+
+def test_the_sparkline_uses_the_daemon_history_while_it_is_recent(tmp_path):
+    log = history.HistoryLog(str(tmp_path / "history.bin"))
+    for minute in range(5):
+        log.append(NOW - 240 + minute * 60, 60 - minute, False)
+    reader = _reader(tmp_path, FakeSensor(55))
+    reader.poll()
+    assert reader.latest()[2] == (60, 59, 58, 57, 56)
+    reader.clock = lambda: NOW + gauge.SPARKLINE_STALE_SECONDS + 1
+    reader.poll()
+    assert reader.latest()[2] == (55, 55) # The gauge's own readings
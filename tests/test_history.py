@@ -0,0 +1,51 @@
+# /tests/test_history.py
+
+import pytest
+
+import history
+
+def test_records_round_trip():
+    sample = history.decode(history.encode(1_700_000_000.7, 57.3, True, -19 / 3600))
+    assert sample.timestamp == 1_700_000_000 and sample.percent == pytest.approx(57.3) and sample.power_plugged
+    assert sample.rate == pytest.approx(-19 / 3600)
+    assert history.decode(history.encode(1_700_000_000, 100, False)).rate is None
+    # Rates beyond the record's range are clamped, never mistaken for "no rate"
+    assert history.decode(history.encode(0, 50, False, -1)).rate == pytest.approx((history.NO_RATE + 1) / 100 / 3600)
+
+def test_the_ring_keeps_the_latest_samples():
+    ring = history.RingBuffer(capacity=4)
+    for second in range(6):
+        ring.append(second, 50 - second, second % 2 == 0, None if second == 5 else -0.01)
+    assert len(ring) == 4
+    assert [sample.timestamp for sample in ring.latest()] == [2, 3, 4, 5]
+    assert [sample.percent for sample in ring.latest(2)] == [46, 45]
+    assert ring.latest(1)[0].rate is None and not ring.latest(1)[0].power_plugged
+
+def test_log_queries_by_time(tmp_path):
+    log = history.HistoryLog(str(tmp_path / "history.bin"))
+    assert log.query() == [] and len(log) == 0
+    for second in range(0, 1000, 10):
+        log.append(1_700_000_000 + second, 80 - second / 100, False, -0.001)
+    assert len(log) == 100
+    window = log.query(1_700_000_000 + 250, 1_700_000_000 + 300)
+    assert [sample.timestamp - 1_700_000_000 for sample in window] == [250, 260, 270, 280, 290]
+    assert [sample.timestamp - 1_700_000_000 for sample in log.latest(2)] == [980, 990]
+    log.close()
+
+def test_a_partly_written_record_is_ignored(tmp_path):
+    path = tmp_path / "history.bin"
+    log = history.HistoryLog(str(path))
+    log.append(1_700_000_000, 80, True)
+    log.close()
+    with open(path, 'ab') as history_file:
+        history_file.write(history.encode(1_700_000_001, 79, True)[:5])
+    assert [sample.percent for sample in log.query()] == [80]
+    assert [sample.percent for sample in log.latest(5)] == [80]
+
+def test_battery_history_records_to_both(tmp_path):
+    battery_history = history.BatteryHistory(str(tmp_path / "history.bin"), capacity=8)
+    battery_history.record(1_700_000_000, 55, False, -0.002)
+    battery_history.close()
+    assert battery_history.ring.latest()[0].percent == 55
+    assert battery_history.log.query()[0].percent == 55
+    assert history.BatteryHistory(path=None).log is None
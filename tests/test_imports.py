@@ -0,0 +1,33 @@
+# /tests/test_imports.py
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+
+@pytest.mark.parametrize("module, forbidden", [
+    ("process", benchmark.DAEMON_IMPORT_FORBIDDEN),
+    ("settings", benchmark.GUI_IMPORT_FORBIDDEN),
+    ("cli", benchmark.CLI_IMPORT_FORBIDDEN),
+])
+def test_entry_points_stay_out_of_the_forbidden_packages(tmp_path, module, forbidden):
+    if module == "settings":
+        pytest.importorskip("tkinter")
+    stubs_dir = str(tmp_path / "import_stubs")
+    os.makedirs(stubs_dir)
+    benchmark._write_import_stubs(stubs_dir) # Empty psutil, wmi, ... where they aren't installed, as the benchmark does
+    output = subprocess.run([sys.executable, "-c", f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"],
+                            env=dict(os.environ, PYTHONPATH=os.pathsep.join([stubs_dir, benchmark.REPO_DIR])), cwd=str(tmp_path),
+                            capture_output=True, text=True, check=True).stdout
+    assert benchmark.forbidden_imports(json.loads(output), forbidden) == []
+
+def test_forbidden_imports_match_packages_and_their_submodules():
+    assert benchmark.forbidden_imports({"tkinter.messagebox", "json", "http.client"}, ("tkinter", "http.server")) == ["tkinter"]
+
+def test_results_over_budget_are_reported():
+    results = {"import_time": {"daemon": {"best_ms": 130, "within_budget": False}, "cli": {"within_budget": True}}, "rules": {"speedup": 4}}
+    assert benchmark.over_budget(results) == ["import_time/daemon"]
@@ -0,0 +1,76 @@
+# /tests/test_journal.py
+
+import logging
+import threading
+import time
+
+import journal
+
+def _write_events(directory, timestamps, kind=journal.PLUG):
+    """ Writes one event per timestamp through a JournalHandler, as the listener thread would """
+    handler = journal.JournalHandler(directory)
+    for number, timestamp in enumerate(timestamps):
+        record = logging.LogRecord("battery_notifier.journal", logging.INFO, __file__, 0, kind, None, None)
+        record.created = timestamp
+        record.event = {"number": number}
+        handler.emit(record)
+    handler.close()
+
+def test_index_has_an_entry_per_interval(tmp_path):
+    start = 1_700_000_000.0
+    _write_events(str(tmp_path), [start + second for second in range(0, 600, 10)])
+    name = journal.list_segments(str(tmp_path))[0]
+    with open(tmp_path / (name + ".idx")) as index_file:
+        entries = [line.split() for line in index_file]
+    assert [float(timestamp) - start for timestamp, _ in entries] == [float(second) for second in range(0, 600, journal.INDEX_INTERVAL)]
+
+def test_seek_offset_lands_on_the_last_entry_before_start(tmp_path):
+    start = 1_700_000_000.0
+    _write_events(str(tmp_path), [start + second for second in range(0, 600, 10)])
+    name = journal.list_segments(str(tmp_path))[0]
+    index_path, segment_path = tmp_path / (name + ".idx"), tmp_path / (name + ".jsonl")
+    assert journal._seek_offset(str(index_path), start - 1) == 0
+    offset = journal._seek_offset(str(index_path), start + 250)
+    with open(segment_path, 'rb') as segment_file:
+        segment_file.seek(offset)
+        first = segment_file.readline()
+    # Indexed every 60 s, so the read starts at the event of second 240
+    assert b'"number":24}' in first
+
+def test_query_returns_the_events_of_the_window(tmp_path):
+    start = 1_700_000_000.0
+    _write_events(str(tmp_path), [start + second for second in range(0, 600, 10)])
+    _write_events(str(tmp_path), [start + 305], kind=journal.UNPLUG)
+    events = journal.query(start + 250, start + 320, directory=str(tmp_path))
+    assert [event["ts"] - start for event in events] == [250, 260, 270, 280, 290, 300, 305, 310]
+    unplugs = journal.query(start + 250, start + 320, kinds=(journal.UNPLUG,), directory=str(tmp_path))
+    assert [event["kind"] for event in unplugs] == [journal.UNPLUG]
+
+def test_query_skips_a_partially_written_line(tmp_path):
+    start = 1_700_000_000.0
+    _write_events(str(tmp_path), [start, start + 1])
+    name = journal.list_segments(str(tmp_path))[0]
+    with open(tmp_path / (name + ".jsonl"), 'ab') as segment_file:
+        segment_file.write(b'{"ts": 17000')
+    assert len(journal.query(directory=str(tmp_path))) == 2
+
+def test_concurrent_first_records_start_one_listener(monkeypatch, tmp_path):
+    journal.stop()
+    started = []
+
+    class SlowListener(journal.QueueListener):
+        def start(self):
+            time.sleep(0.05) # Widens the window in which a second thread could start another listener
+            started.append(self)
+            super().start()
+
+    monkeypatch.setattr(journal, "QueueListener", SlowListener)
+    monkeypatch.chdir(tmp_path) # JOURNAL_DIR is relative
+    threads = [threading.Thread(target=journal.record, args=(journal.PLUG,), kwargs={"percent": 50}) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.stop()
+    assert len(started) == 1
+    assert len(journal.query()) == 8
@@ -0,0 +1,46 @@
+# /tests/test_logger.py
+
+import logging
+
+import logger
+
+def _record(message):
+    return logging.LogRecord("root", logging.INFO, __file__, 0, message, None, None)
+
+def test_only_the_rotating_process_keeps_the_log_open(tmp_path):
+    handler = logger.SharedLogHandler(str(tmp_path / "shared.log"))
+    handler.emit(_record("from the settings window"))
+    assert handler.stream is None
+    handler.rotating = True
+    handler.emit(_record("from the monitor"))
+    assert handler.stream is not None
+    handler.close()
+    assert (tmp_path / "shared.log").read_text().splitlines() == ["from the settings window", "from the monitor"]
+
+def test_only_the_rotating_process_rotates(tmp_path):
+    path = tmp_path / "shared.log"
+    gui = logger.SharedLogHandler(str(path), max_bytes=100, backup_count=2)
+    monitor = logger.SharedLogHandler(str(path), max_bytes=100, backup_count=2)
+    monitor.rotating = True
+    for number in range(10):
+        gui.emit(_record(f"gui record {number:02d}"))
+    assert not (tmp_path / "shared.log.1").exists()
+    for number in range(10):
+        monitor.emit(_record(f"monitor record {number:02d}"))
+    monitor.close()
+    assert (tmp_path / "shared.log.1").exists()
+    assert path.stat().st_size <= 100
+
+def test_a_failed_rollover_keeps_logging(tmp_path, monkeypatch):
+    path = tmp_path / "shared.log"
+    handler = logger.SharedLogHandler(str(path), max_bytes=10, backup_count=1)
+    handler.rotating = True
+
+    def rename_in_use(source, destination):
+        raise PermissionError("The file is being used by another process")
+
+    monkeypatch.setattr(handler, "rotate", rename_in_use)
+    for number in range(3):
+        handler.emit(_record(f"record {number}"))
+    handler.close()
+    assert path.read_text().splitlines() == ["record 0", "record 1", "record 2"]
@@ -0,0 +1,60 @@
+# /tests/test_metrics.py
+
+import threading
+
+import pytest
+
+import journal
+import logger
+import metrics
+
+@pytest.fixture
+def histogram():
+    histogram = metrics.Histogram("test_seconds", "Test durations", buckets=(0.1, 1))
+    yield histogram
+    metrics.REGISTRY.remove(histogram)
+
+def test_histogram_buckets(histogram):
+    for value in (0.05, 0.1, 0.5, 2, 3):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{le="1"} 3' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 5' in lines
+    assert histogram.count == 5 and histogram.sum == pytest.approx(5.65)
+
+def test_concurrent_observations_are_not_lost(histogram):
+    threads, observations = 8, 5000
+
+    def observe():
+        for _ in range(observations):
+            histogram.observe(0.01)
+
+    def render():
+        while any(worker.is_alive() for worker in workers):
+            histogram.render()
+
+    workers = [threading.Thread(target=observe) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    renderer = threading.Thread(target=render)
+    renderer.start()
+    for worker in workers:
+        worker.join()
+    renderer.join()
+    assert histogram.count == threads * observations
+
+def test_errors_are_counted_by_kind(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path) # The journal records the errors under logs/
+    timeouts, errors = metrics.ERRORS.value("TimeoutError"), metrics.ERRORS.value("error")
+    for caller in ("battery_utility.py", "telemetry.py"):
+        try:
+            raise TimeoutError("timed out")
+        except TimeoutError as e:
+            logger.log_error(f"Failed: {e}", caller)
+    logger.log_error("Unexpected reply", "control.py")
+    journal.stop()
+    assert metrics.ERRORS.value("TimeoutError") == timeouts + 2
+    assert metrics.ERRORS.value("error") == errors + 1
+    assert metrics.ERRORS.value("battery_utility.py") == 0
+    assert [event["error_kind"] for event in journal.query(kinds=(journal.ERROR,))] == ["TimeoutError", "TimeoutError", "error"]
@@ -0,0 +1,159 @@
+# /tests/test_notification.py
+
+import threading
+import time
+
+import pytest
+
+import battery_utility
+import config_store
+import dialogs
+import notification
+import sensors
+
+def _delivered(dispatcher, count, timeout=2):
+    """ Waits for count notifications to reach the backend (flush returns once they left the queue) """
+    deadline = time.monotonic() + timeout
+    while len(dispatcher.backend.sent) < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return [message for _, message in dispatcher.backend.sent]
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = notification.NotificationDispatcher(notification.MemoryBackend(), coalesce_windows={"power": 0.2},
+                                                     rate_limits={"power": 0.5})
+    yield dispatcher
+    dispatcher.stop()
+
+def test_enqueue_never_waits_for_the_backend():
+    dispatcher = notification.NotificationDispatcher(notification.MemoryBackend(delay=0.1))
+    start = time.perf_counter()
+    for number in range(5):
+        dispatcher.notify(f"message {number}")
+    assert time.perf_counter() - start < 0.05
+    dispatcher.stop()
+    assert len(dispatcher.backend.sent) == 5
+
+def test_charger_flapping_is_coalesced_into_its_latest_state(dispatcher):
+    for _ in range(3):
+        dispatcher.notify("Charging cable plugged in.", kind="plug")
+        dispatcher.notify("Charging cable unplugged.", kind="unplug")
+    assert dispatcher.flush(timeout=2)
+    assert _delivered(dispatcher, 1) == ["Charging cable unplugged."]
+    assert dispatcher.stats["coalesced"] == 5
+
+def test_a_group_is_rate_limited(dispatcher):
+    dispatcher.notify("Charging cable plugged in.", kind="plug")
+    _delivered(dispatcher, 1)
+    first = time.monotonic()
+    dispatcher.notify("Charging cable unplugged.", kind="unplug")
+    assert _delivered(dispatcher, 2) == ["Charging cable plugged in.", "Charging cable unplugged."]
+    # Held back until the rate limit since the first delivery had passed, not just the coalescing window
+    assert time.monotonic() - first >= 0.45
+
+def test_a_burst_ending_in_the_announced_state_is_dropped(dispatcher):
+    dispatcher.notify("Charging cable plugged in.", kind="plug")
+    _delivered(dispatcher, 1)
+    dispatcher.notify("Charging cable unplugged.", kind="unplug")
+    dispatcher.notify("Charging cable plugged in.", kind="plug")
+    assert dispatcher.flush(timeout=2)
+    dispatcher.stop()
+    assert len(dispatcher.backend.sent) == 1
+    assert dispatcher.stats["dropped"] == 1
+
+def test_kinds_only_supersede_their_own_pending_notification():
+    # Held back long enough for the follow-ups to find them pending, notifications without a window may already be sent
+    dispatcher = notification.NotificationDispatcher(notification.MemoryBackend(), coalesce_windows={"threshold": 0.2, "forecast": 0.2})
+    dispatcher.notify("Battery is at 20%.", kind="threshold")
+    dispatcher.notify("Battery is at 19%.", kind="threshold")
+    dispatcher.notify("Battery will hit 10% in ~5 min.", kind="forecast")
+    dispatcher.notify("Battery is charged to 80%.")
+    dispatcher.notify("Battery is charged to 81%.")
+    dispatcher.stop()
+    assert sorted(message for _, message in dispatcher.backend.sent) == [
+        "Battery is at 19%.", "Battery is charged to 80%.", "Battery is charged to 81%.", "Battery will hit 10% in ~5 min."]
+
+def test_notifications_beyond_the_queue_bound_are_dropped():
+    dispatcher = notification.NotificationDispatcher(notification.MemoryBackend(delay=0.05), max_pending=2)
+    accepted = [dispatcher.notify(f"message {number}") for number in range(6)]
+    dispatcher.stop()
+    assert accepted.count(False) >= 3
+    assert len(dispatcher.backend.sent) == accepted.count(True)
+
+def test_stale_notifications_are_dropped():
+    dispatcher = notification.NotificationDispatcher(notification.MemoryBackend(), coalesce_windows={"power": 0.3}, max_age=0.1)
+    dispatcher.notify("Charging cable plugged in.", kind="plug")
+    start = time.monotonic()
+    assert dispatcher.flush(timeout=2)
+    assert time.monotonic() - start < 1 # Dropping it wakes flush up
+    dispatcher.stop()
+    assert dispatcher.backend.sent == []
+    assert dispatcher.stats["dropped"] == 1
+
+class StaticSensor:
+    def __init__(self, percent, power_plugged):
+        self.reading = sensors.BatteryReading(percent, power_plugged, None, None, None)
+
+    def read(self):
+        return self.reading
+
+class NullHistory:
+    def record(self, *args):
+        pass
+
+class RecordingMonitor(battery_utility.BatteryMonitor):
+    """ Monitor with a fixed config that records its notifications instead of queueing them """
+
+    def __init__(self, sensor, config):
+        super().__init__(sensor, history=NullHistory())
+        self.config = config
+        self.notified = []
+
+    def load_config(self):
+        return self.config
+
+    def notify(self, message, kind):
+        self.notified.append((kind, message))
+
+    def record_event(self, kind, **fields):
+        pass
+
+def test_a_saver_rule_notifies_instead_of_showing_a_dialog(monkeypatch):
+    def no_dialogs():
+        raise AssertionError("The monitor thread must not open a message box")
+
+    monkeypatch.setattr(dialogs, "_messagebox", no_dialogs)
+    monkeypatch.setattr(battery_utility, "enter_battery_saver", lambda: "Battery Saver mode activated successfully.")
+    monitor = RecordingMonitor(StaticSensor(15, False), {"lower_threshold": 20, "higher_threshold": 80})
+    monitor.check()
+    assert ("saver", "Battery Saver mode activated successfully.") in monitor.notified
+
+def test_a_failing_saver_is_reported_without_a_dialog(monkeypatch):
+    def failing():
+        raise OSError("powercfg not found")
+
+    monkeypatch.setattr(dialogs, "_messagebox", lambda: pytest.fail("The monitor thread must not open a message box"))
+    monkeypatch.setattr(battery_utility, "enter_battery_saver", failing)
+    monitor = RecordingMonitor(StaticSensor(15, False), {"lower_threshold": 20, "higher_threshold": 80})
+    monitor.check()
+    assert ("saver", "Failed to activate Battery Saver.") in monitor.notified
+
+class RecordingStatus:
+    """ Status segment writer stand-in that records the published saver state & stops the loop after one check """
+
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+        self.saver_on = []
+
+    def publish_monitor(self, monitor, delay, saver_on=None):
+        self.saver_on.append(saver_on)
+        self.stop_event.set()
+
+@pytest.mark.parametrize("percent, saver_on", [(50, False), (15, True)])
+def test_the_monitor_loop_publishes_the_config_of_its_check(monkeypatch, percent, saver_on):
+    monkeypatch.setattr(config_store, "load_config", lambda *args: pytest.fail("The check already loaded the config"))
+    monkeypatch.setattr(battery_utility, "enter_battery_saver", lambda: "Battery Saver mode activated successfully.")
+    monitor = RecordingMonitor(StaticSensor(percent, False), {"lower_threshold": 20, "higher_threshold": 80, "battery_saver_on": False})
+    status = RecordingStatus(threading.Event())
+    battery_utility.monitor_battery_events(status.stop_event, monitor, status=status)
+    assert status.saver_on == [saver_on]
@@ -0,0 +1,102 @@
+# /tests/test_power_plan.py
+
+import json
+import subprocess
+import types
+
+import pytest
+
+import battery_utility
+import brightness
+import config_store
+import dialogs
+import power_plan
+from power_plan import BALANCED_GUID, POWER_SAVER_GUID
+
+class CountingPowercfg:
+    """ subprocess.run stand-in for powercfg that keeps the active scheme & records every spawn """
+
+    def __init__(self, scheme=BALANCED_GUID):
+        self.scheme = scheme
+        self.calls = []
+
+    def __call__(self, args, **kwargs):
+        self.calls.append(args[1])
+        if args[1] == "/getactivescheme":
+            return subprocess.CompletedProcess(args, 0, f"Power Scheme GUID: {self.scheme}  (Balanced)\n", "")
+        if args[1] == "/setactive":
+            self.scheme = args[2]
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def powercfg(monkeypatch, tmp_path):
+    """ Routes the battery saver actions to a counting powercfg, a fake display & a scratch config, without dialogs """
+    monkeypatch.chdir(tmp_path)
+    with open("config.json", 'w') as config_file:
+        json.dump({"lower_threshold": 20, "higher_threshold": 80, "battery_saver_on": False, "current_brightness": 80}, config_file)
+    config_store.invalidate()
+    runner = CountingPowercfg()
+    monkeypatch.setattr(power_plan, "_default_manager", power_plan.PowerPlanManager(runner, reader=lambda: runner.scheme))
+    monkeypatch.setattr(brightness, "_default_controller", brightness.BrightnessController(brightness.FakeBrightnessBackend(80)))
+    shown = []
+    monkeypatch.setattr(dialogs, "_messagebox", lambda: types.SimpleNamespace(
+        showinfo=lambda *args: shown.append(args), showerror=lambda *args: shown.append(args)))
+    yield runner
+    config_store.flush_config()
+
+def test_toggle_costs_one_spawn(powercfg):
+    battery_utility.toggle_battery_saver()
+    assert powercfg.calls == ["/setactive"]
+    assert powercfg.scheme == POWER_SAVER_GUID
+    battery_utility.toggle_battery_saver()
+    assert powercfg.calls == ["/setactive", "/setactive"]
+    assert powercfg.scheme == BALANCED_GUID
+
+def test_toggle_with_a_recent_scheme_costs_one_spawn_without_the_reader():
+    runner = CountingPowercfg()
+    manager = power_plan.PowerPlanManager(runner, reader=None, clock=Clock())
+    manager.reader = None # Also on Windows, where the constructor falls back to powrprof
+    manager.active_scheme()
+    runner.calls.clear()
+    manager.set_active(BALANCED_GUID if manager.is_saver_active() else POWER_SAVER_GUID)
+    assert runner.calls == ["/setactive"]
+
+def test_setting_the_active_scheme_again_spawns_nothing():
+    runner = CountingPowercfg()
+    manager = power_plan.PowerPlanManager(runner, reader=lambda: runner.scheme)
+    assert manager.set_active(BALANCED_GUID) is False
+    assert runner.calls == []
+
+def test_a_scheme_switched_elsewhere_is_seen_once_the_cache_expires():
+    runner, clock = CountingPowercfg(), Clock()
+    manager = power_plan.PowerPlanManager(runner, reader=lambda: runner.scheme, clock=clock)
+    manager.set_active(POWER_SAVER_GUID)
+    runner.scheme = BALANCED_GUID # The user switched back in Windows
+    assert manager.is_saver_active()
+    clock.now += power_plan.POWER_PLAN_CACHE_SECONDS + 1
+    assert not manager.is_saver_active()
+    assert manager.set_active(POWER_SAVER_GUID) is True
+    assert runner.scheme == POWER_SAVER_GUID
+
+def test_a_failed_powercfg_call_forgets_the_scheme():
+    runner = CountingPowercfg()
+    manager = power_plan.PowerPlanManager(runner, clock=Clock())
+    manager.reader = None
+    manager.active_scheme()
+
+    def failing(args, **kwargs):
+        raise subprocess.CalledProcessError(1, args)
+
+    manager.runner = failing
+    with pytest.raises(subprocess.CalledProcessError):
+        manager.set_active(POWER_SAVER_GUID)
+    manager.runner = runner
+    assert manager.active_scheme() == BALANCED_GUID
+    assert runner.calls == ["/getactivescheme", "/getactivescheme"]
@@ -0,0 +1,65 @@
+# /tests/test_predictor.py
+
+import math
+import random
+
+import pytest
+
+import predictor
+
+def _feed(estimator, samples):
+    for timestamp, percent in samples:
+        estimator.update(timestamp, percent)
+
+def test_not_ready_before_enough_samples_over_enough_time():
+    estimator = predictor.RateEstimator()
+    _feed(estimator, [(0, 80), (30, 79.9)])
+    assert estimator.rate is None
+    estimator.update(60, 79.8)
+    assert estimator.rate is None # 3 samples, but only a minute apart
+    estimator.update(predictor.RATE_MIN_SPAN, 79.6)
+    assert estimator.rate == pytest.approx(-0.2 / 60, rel=0.05)
+
+def test_converges_to_a_noisy_discharge_rate():
+    noise = random.Random(4)
+    rate = -0.5 / 60 # 0.5 % per minute
+    estimator = predictor.RateEstimator()
+    # Whole percent readings every 30 s, the way most batteries report
+    _feed(estimator, [(second, round(90 + rate * second + noise.uniform(-0.3, 0.3))) for second in range(0, 3600, 30)])
+    assert estimator.rate == pytest.approx(rate, rel=0.05)
+    assert estimator.estimate() == pytest.approx(90 + rate * 3570, abs=0.5)
+    assert estimator.seconds_until(20) == pytest.approx((20 - (90 + rate * 3570)) / rate, rel=0.05)
+
+def _weighted_fit(samples, time_constant):
+    """ Reference batch fit: least squares with every sample weighted by exp(-age / time_constant) """
+    last = samples[-1][0]
+    weights = [math.exp(-(last - timestamp) / time_constant) for timestamp, _ in samples]
+    total = sum(weights)
+    mean_time = sum(weight * timestamp for weight, (timestamp, _) in zip(weights, samples)) / total
+    mean_percent = sum(weight * percent for weight, (_, percent) in zip(weights, samples)) / total
+    covariance = sum(weight * (timestamp - mean_time) * (percent - mean_percent) for weight, (timestamp, percent) in zip(weights, samples))
+    variance = sum(weight * (timestamp - mean_time) ** 2 for weight, (timestamp, _) in zip(weights, samples))
+    return covariance / variance
+
+def test_follows_a_change_of_rate():
+    estimator = predictor.RateEstimator()
+    samples = [(second, 90 - second / 600) for second in range(0, 3600, 30)] # Idle, 0.1 % per minute
+    samples += [(second, 84 - (second - 3600) / 60) for second in range(3600, 3600 + 3 * predictor.RATE_TIME_CONSTANT, 30)] # Busy, 1 % per minute
+    _feed(estimator, samples)
+    # The O(1) updates give the batch fit, in which the idle hour has faded to most of the way to the new rate
+    assert estimator.rate == pytest.approx(_weighted_fit(samples, predictor.RATE_TIME_CONSTANT))
+    assert -1 / 60 < estimator.rate < -0.8 / 60
+
+def test_a_level_behind_the_trend_is_never_reached():
+    estimator = predictor.RateEstimator()
+    _feed(estimator, [(second, 50 - second / 60) for second in range(0, 600, 30)])
+    assert estimator.seconds_until(80) is None
+    assert estimator.seconds_until(30) == pytest.approx((30 - estimator.estimate()) / estimator.rate)
+
+def test_reset_and_out_of_order_samples():
+    estimator = predictor.RateEstimator()
+    _feed(estimator, [(second, 50 - second / 60) for second in range(0, 600, 30)])
+    estimator.update(100, 99) # Older than the last sample, ignored
+    assert estimator.rate == pytest.approx(-1 / 60)
+    estimator.reset()
+    assert estimator.rate is None and estimator.count == 0
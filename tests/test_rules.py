@@ -0,0 +1,102 @@
+# /tests/test_rules.py
+
+import math
+
+import pytest
+
+import rules
+
+def _fired_names(rule_set, percent, plugged):
+    return [rule.name for rule in rule_set.evaluate(percent, plugged)[1]]
+
+def test_a_rule_fires_once_while_the_level_stays_in_its_band():
+    rule_set = rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80})
+    assert _fired_names(rule_set, 21, False) == []
+    assert _fired_names(rule_set, 20, False) == ["lower"]
+    assert _fired_names(rule_set, 19, False) == []
+    assert _fired_names(rule_set, 15, False) == []
+    assert rule_set.is_fired("lower")
+
+def test_a_rule_is_re_armed_once_the_level_leaves_its_band():
+    rule_set = rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80})
+    rule_set.evaluate(20, False)
+    rule_set.evaluate(21, False)
+    assert not rule_set.is_fired("lower")
+    assert _fired_names(rule_set, 20, False) == ["lower"]
+
+def test_hysteresis_keeps_a_rule_armed_near_its_edge():
+    rule_set = rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80, "rules": [
+        {"name": "low", "below": 20, "plugged": False, "hysteresis": 2}]})
+    assert _fired_names(rule_set, 20, False) == ["low"]
+    assert _fired_names(rule_set, 22, False) == [] # Still within the hysteresis
+    assert _fired_names(rule_set, 20, False) == []
+    assert _fired_names(rule_set, 23, False) == []
+    assert _fired_names(rule_set, 20, False) == ["low"]
+
+@pytest.mark.parametrize("percent, plugged, names", [
+    (9.9, False, ["critical", "low"]),
+    (10, False, ["critical", "low", "band"]),
+    (10.1, False, ["low", "band"]),
+    (20, False, ["low", "band"]),
+    (20.5, False, []),
+    (10, True, ["band"]),
+    (80, True, ["full"]),
+    (79.9, True, []),
+    (80, False, []),
+])
+def test_bands_include_their_edges(percent, plugged, names):
+    rule_set = rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80, "rules": [
+        {"name": "critical", "below": 10, "plugged": False},
+        {"name": "low", "below": 20, "plugged": False},
+        {"name": "band", "above": 10, "below": 20},
+        {"name": "full", "above": 80, "plugged": True},
+    ]})
+    assert [rule.name for rule in rule_set.match(percent, plugged)] == names
+
+def test_next_level_is_the_nearest_band_ahead():
+    rule_set = rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80, "rules": [
+        {"name": "critical", "below": 10, "plugged": False},
+        {"name": "low", "below": 20, "plugged": False},
+        {"name": "full", "above": 80, "plugged": True},
+        {"name": "almost", "above": 90, "plugged": True},
+    ]})
+    assert rule_set.next_level(50, False) == 20
+    assert rule_set.next_level(20, False) == 10 # Already in the band starting at 20
+    assert rule_set.next_level(15, False) == 10
+    assert rule_set.next_level(5, False) is None
+    assert rule_set.next_level(50, True) == 80
+    assert rule_set.next_level(80, True) == 90
+    assert rule_set.next_level(95, True) is None
+
+def test_a_recompile_keeps_the_fired_state_of_remaining_rules():
+    config = {"lower_threshold": 20, "higher_threshold": 80}
+    rule_set = rules.compile_rules(config)
+    rule_set.evaluate(15, False)
+    recompiled = rules.compile_rules(dict(config, lower_threshold=25), rule_set)
+    assert _fired_names(recompiled, 15, False) == [] # Not announced again after a config reload
+    renamed = rules.compile_rules(dict(config, rules=[{"name": "low", "below": 25, "plugged": False}]), recompiled)
+    assert _fired_names(renamed, 15, False) == ["low"]
+
+def test_default_rules_follow_the_thresholds():
+    higher, lower = rules.default_rules(20, 80)
+    assert (lower.low, lower.high, lower.plugged, lower.actions) == (-math.inf, 20, False, ("saver", "notify"))
+    assert (higher.low, higher.high, higher.plugged) == (80, math.inf, True)
+    assert lower.message.format(percent=19) == "Battery is at 19%. Consider plugging in."
+
+@pytest.mark.parametrize("entry", [
+    {"below": 20},
+    {"name": "low"},
+    {"name": "low", "above": 30, "below": 20},
+    {"name": "low", "below": 20, "plugged": "yes"},
+    {"name": "low", "below": 20, "actions": ["shutdown"]},
+    {"name": "low", "below": 20, "message": "At {level}%"},
+    {"name": "low", "below": 20, "hysteresis": -1},
+])
+def test_invalid_rules_are_rejected(entry):
+    with pytest.raises(ValueError):
+        rules.parse_rule(entry)
+
+def test_rule_names_must_be_unique():
+    with pytest.raises(ValueError):
+        rules.compile_rules({"lower_threshold": 20, "higher_threshold": 80, "rules": [
+            {"name": "low", "below": 20}, {"name": "low", "below": 10}]})
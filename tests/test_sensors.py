@@ -0,0 +1,73 @@
+# /tests/test_sensors.py
+
+import os
+import sys
+import types
+
+import pytest
+
+import sensors
+
+@pytest.fixture
+def sensor(tmp_path):
+    sensor = sensors.FakeSysfsSensor(str(tmp_path), capacity=57, status="Discharging", energy_now=28500000, power_now=9500000,
+                                     energy_full=50000000)
+    yield sensor
+    sensor.close()
+
+def test_reads_the_battery_attributes(sensor):
+    reading = sensor.read()
+    assert (reading.percent, reading.power_plugged) == (57, False)
+    assert (reading.energy_now, reading.power_now, reading.energy_full) == (28500000, 9500000, 50000000)
+    # 9.5 W out of 50 Wh is 19 % per hour
+    assert reading.rate == pytest.approx(-19 / 3600)
+
+def test_sees_updates_through_the_open_files(sensor):
+    sensor.set(capacity=58, online=True, status="Charging")
+    reading = sensor.read()
+    assert (reading.percent, reading.power_plugged) == (58, True)
+    assert reading.rate == pytest.approx(19 / 3600)
+
+def test_the_mains_supply_decides_the_plug_state(sensor):
+    sensor.set(status="Not charging", online=False) # Charge limit reached, then the charger got pulled
+    assert sensor.read().power_plugged is False
+
+def test_the_battery_status_is_used_without_a_mains_supply(tmp_path):
+    sensors.FakeSysfsSensor(str(tmp_path)).close()
+    os.remove(tmp_path / "AC" / "online")
+    for status, plugged in (("Discharging", False), ("Charging", True), ("Full", True), ("Not charging", True)):
+        sensors._write_text(str(tmp_path / "BAT0" / "status"), status)
+        sensor = sensors.SysfsSensor(str(tmp_path))
+        assert sensor.read().power_plugged is plugged
+        sensor.close()
+
+def test_optional_attributes_are_none(tmp_path):
+    sensor = sensors.FakeSysfsSensor(str(tmp_path), capacity=40)
+    reading = sensor.read()
+    assert (reading.energy_now, reading.power_now, reading.rate) == (None, None, None)
+    sensor.set(capacity="")
+    assert sensor.read() is None # Mid-update or unreadable
+    sensor.close()
+
+def test_no_battery(tmp_path):
+    os.makedirs(tmp_path / "AC")
+    sensors._write_text(str(tmp_path / "AC" / "type"), "Mains")
+    sensor = sensors.SysfsSensor(str(tmp_path))
+    assert not sensor.available and sensor.read() is None
+    assert not sensors.SysfsSensor(str(tmp_path / "missing")).available
+
+def test_psutil_sensor(monkeypatch):
+    battery = types.SimpleNamespace(percent=42, power_plugged=True, secsleft=-2)
+    monkeypatch.setitem(sys.modules, "psutil", types.SimpleNamespace(sensors_battery=lambda: battery))
+    sensor = sensors.PsutilSensor()
+    assert sensor.read() == sensors.BatteryReading(42, True, None, None, None)
+    battery = None
+    assert sensor.read() is None
+
+def test_get_sensor_falls_back_to_psutil_without_a_sysfs_battery(monkeypatch, tmp_path):
+    sysfs_sensor = sensors.SysfsSensor
+    monkeypatch.setattr(sensors, "_default_sensor", None)
+    monkeypatch.setattr(sensors, "SysfsSensor", lambda: sysfs_sensor(str(tmp_path))) # An empty power_supply directory
+    monkeypatch.setitem(sys.modules, "psutil", types.SimpleNamespace(sensors_battery=lambda: None))
+    assert isinstance(sensors.get_sensor(), sensors.PsutilSensor)
+    assert sensors.get_sensor() is sensors.get_sensor()
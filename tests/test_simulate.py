@@ -0,0 +1,58 @@
+# /tests/test_simulate.py
+
+import pytest
+
+import history
+import simulate
+
+CONFIG = {"lower_threshold": 20, "higher_threshold": 80}
+
+def _flapping_trace():
+    """ Charge 70 -> 85 %, the charger flapping at 85 % for a minute per state, then a discharge 85 -> 15 %, sampled every 10 s """
+    samples, timestamp = [], 1000.0
+    def run(seconds, percent, plugged):
+        nonlocal timestamp
+        start = timestamp
+        while timestamp < start + seconds:
+            samples.append(history.Sample(timestamp, percent(timestamp - start), plugged, None))
+            timestamp += 10
+    run(15 * 60, lambda elapsed: 70 + int(elapsed // 60), True)
+    for plugged in (False, True, False, True):
+        run(60, lambda elapsed: 85, plugged)
+    run(71 * 60, lambda elapsed: 85 - int(elapsed // 60), False)
+    return samples
+
+def test_replay_with_charger_flapping():
+    trace = _flapping_trace()
+    actions, checks = simulate.replay(trace, CONFIG)
+    summary = simulate.summarize(trace, actions, checks, CONFIG)
+    assert summary["missed_crossings"] == 0 and summary["crossings"] == 2
+    # Every plug change is reported, but the flapping at 85 % doesn't repeat the higher threshold's notification
+    assert summary["actions"] == {
+        "journal": 8, "notify:plug": 3, "notify:unplug": 3, "notify:forecast": 2, "notify:threshold": 2, "enter_saver": 1,
+    }
+    fired = [(action["time"], action["threshold"]) for action in actions if action["action"] == "journal" and action["kind"] == "threshold_crossed"]
+    assert fired == [(1600.0, "higher"), (6040.0, "lower")] # The checks due when each threshold was reached
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_replay_of_synthetic_days(seed):
+    trace = simulate.synthetic_trace(2, seed=seed)
+    actions, checks = simulate.replay(trace, CONFIG)
+    summary = simulate.summarize(trace, actions, checks, CONFIG)
+    crossings = simulate.threshold_crossings(trace, CONFIG)
+    assert summary["missed_crossings"] == 0 and summary["transient_crossings"] == 0
+    assert summary["actions"]["notify:threshold"] == len(crossings)
+    assert summary["actions"]["enter_saver"] == sum(1 for _, threshold, _ in crossings if threshold == "lower")
+    # Flaps shorter than a poll go unseen, so at most one notification per plug change (& the one at start)
+    changes = sum(1 for before, after in zip(trace, trace[1:]) if before.power_plugged != after.power_plugged)
+    assert summary["actions"]["notify:plug"] + summary["actions"]["notify:unplug"] <= changes + 1
+    assert summary["max_detection_latency_s"] <= 10
+
+def test_synthetic_traces_are_reproducible():
+    assert simulate.synthetic_trace(1, seed=4) == simulate.synthetic_trace(1, seed=4)
+    assert simulate.synthetic_trace(1, seed=4) != simulate.synthetic_trace(1, seed=5)
+
+def test_csv_trace_round_trip(tmp_path):
+    trace = _flapping_trace()
+    simulate.save_trace(trace, str(tmp_path / "trace.csv"))
+    assert simulate.load_trace(str(tmp_path / "trace.csv")) == trace
@@ -0,0 +1,45 @@
+# /tests/test_status_segment.py
+
+import os
+import stat
+import sys
+
+import pytest
+
+import runtime
+import status_segment
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "status")
+    writer = status_segment.StatusWriter(path)
+    writer.publish(percent=42.5, power_plugged=False, rate=-0.3, saver_on=True, last_notification="lower", sample_time=100.0,
+                   next_check=130.0, checks=7, now=120.0)
+    reader = status_segment.StatusReader(path)
+    snapshot = reader.read()
+    assert (snapshot.state, snapshot.percent, snapshot.power_plugged, snapshot.saver_on) == ("running", 42.5, False, True)
+    assert (snapshot.last_notification, snapshot.checks, snapshot.pid) == ("lower", 7, os.getpid())
+    assert status_segment.is_alive(snapshot, now=130.0 + status_segment.STATUS_GRACE)
+    assert not status_segment.is_alive(snapshot, now=131.0 + status_segment.STATUS_GRACE)
+    writer.close()
+    assert reader.read().state == "stopped"
+    reader.close()
+
+def test_default_segment_is_in_the_private_runtime_dir():
+    writer = status_segment.StatusWriter()
+    try:
+        assert os.path.dirname(status_segment.STATUS_SEGMENT_PATH) == runtime.RUNTIME_DIR
+        if sys.platform != "win32":
+            assert stat.S_IMODE(os.stat(runtime.RUNTIME_DIR).st_mode) == 0o700
+            assert stat.S_IMODE(os.stat(status_segment.STATUS_SEGMENT_PATH).st_mode) == 0o600
+    finally:
+        writer.close()
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX symlinks")
+def test_segment_planted_as_a_symlink_is_refused(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"precious")
+    os.symlink(victim, tmp_path / "status")
+    with pytest.raises(OSError):
+        status_segment.StatusWriter(str(tmp_path / "status"))
+    assert victim.read_bytes() == b"precious"
+    assert status_segment.StatusReader(str(tmp_path / "status")).read() is None
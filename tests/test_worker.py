@@ -0,0 +1,150 @@
+# /tests/test_worker.py
+
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+import worker
+
+class FakeRoot:
+    """ Records after() callbacks & runs them on the calling thread, as Tk's event loop would """
+
+    def __init__(self):
+        self.scheduled = {} # after id -> callback
+        self.cancelled = []
+        self._ids = 0
+
+    def after(self, ms, callback):
+        self._ids += 1
+        self.scheduled[f"after#{self._ids}"] = callback
+        return f"after#{self._ids}"
+
+    def after_cancel(self, after_id):
+        self.cancelled.append(after_id)
+        self.scheduled.pop(after_id, None)
+
+    def run_once(self):
+        for after_id in list(self.scheduled):
+            self.scheduled.pop(after_id)()
+
+    def run_until_idle(self, timeout=2):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            self.run_once()
+            time.sleep(0.005)
+        assert not self.scheduled, "Still polling"
+
+class FakeButton:
+    def __init__(self, text):
+        self.options = {"text": text, "state": "normal"}
+
+    def config(self, **options):
+        self.options.update(options)
+
+    def cget(self, option):
+        return self.options[option]
+
+@pytest.fixture
+def root():
+    return FakeRoot()
+
+@pytest.fixture
+def action_worker(root):
+    action_worker = worker.ActionWorker(root, max_workers=1)
+    yield action_worker
+    action_worker.shutdown(wait=True)
+
+@pytest.fixture
+def errors(monkeypatch):
+    errors = []
+    monkeypatch.setattr(worker, "log_error", lambda message, caller: errors.append(message))
+    return errors
+
+def test_results_come_back_on_the_tk_thread(root, action_worker):
+    release, results = threading.Event(), []
+    buttons = [FakeButton("Generate report"), FakeButton("Close")]
+
+    def action(value):
+        release.wait(2)
+        return threading.current_thread(), value * 2
+
+    action_worker.submit(action, 21, on_done=lambda result: results.append((threading.current_thread(), result)),
+                         buttons=buttons, busy_text="Generating...")
+    assert [button.options for button in buttons] == [{"text": "Generating...", "state": "disabled"}, {"text": "Close", "state": "disabled"}]
+    root.run_once()
+    assert action_worker.busy and results == [] and buttons[0].cget("state") == "disabled" # Still running, polled again
+    release.set()
+    root.run_until_idle()
+    [(called_on, (ran_on, value))] = results
+    assert called_on is threading.main_thread() and ran_on is not threading.main_thread() and value == 42
+    assert [button.options for button in buttons] == [{"text": "Generate report", "state": "normal"}, {"text": "Close", "state": "normal"}]
+    assert not action_worker.busy
+
+def test_errors_come_back_on_the_tk_thread(root, action_worker, errors):
+    failures, button = [], FakeButton("Saver")
+
+    def action():
+        raise OSError("powercfg failed")
+
+    action_worker.submit(action, on_error=lambda error: failures.append((threading.current_thread(), error)), buttons=[button])
+    root.run_until_idle()
+    [(called_on, error)] = failures
+    assert called_on is threading.main_thread() and isinstance(error, OSError)
+    assert button.options == {"text": "Saver", "state": "normal"} and errors == []
+
+def test_unhandled_errors_are_logged(root, action_worker, errors):
+    action_worker.submit(lambda: 1 / 0)
+    action_worker.submit(lambda: 1, on_done=lambda result: 1 / 0, buttons=[FakeButton("Apply")])
+    root.run_until_idle()
+    assert errors == ["Background action failed: division by zero",
+                      "Failed to handle the result of a background action: division by zero"]
+
+def test_one_poll_is_scheduled_for_all_actions(root, action_worker):
+    release, done = threading.Event(), []
+    for value in range(3):
+        action_worker.submit(release.wait, 2, on_done=done.append)
+    assert len(root.scheduled) == 1
+    release.set()
+    root.run_until_idle()
+    assert done == [True] * 3
+
+def test_shutdown_cancels_the_poll_and_queued_actions(root, errors):
+    action_worker = worker.ActionWorker(root, max_workers=1)
+    release, started, done = threading.Event(), threading.Event(), []
+
+    def running():
+        started.set()
+        release.wait(2)
+
+    action_worker.submit(running, on_done=done.append)
+    queued = action_worker.submit(done.append, "queued", on_done=done.append)
+    assert started.wait(2)
+    [after_id] = root.scheduled
+    action_worker.shutdown()
+    assert root.cancelled == [after_id] and not root.scheduled
+    assert queued.cancelled()
+    release.set()
+    action_worker.shutdown(wait=True)
+    assert done == [] and errors == [] # Nothing is handed back to a window that is going away
+
+def test_an_action_finishing_during_a_poll_is_not_lost(root, action_worker, monkeypatch):
+    class FinishingFuture(concurrent.futures.Future):
+        """ Not done when first asked, done from then on """
+
+        def __init__(self):
+            super().__init__()
+            self.asked = 0
+
+        def done(self):
+            self.asked += 1
+            if self.asked == 2:
+                self.set_result("report.html")
+            return super().done()
+
+    future, done, button = FinishingFuture(), [], FakeButton("Generate report")
+    monkeypatch.setattr(action_worker._executor, "submit", lambda action, *args: future)
+    action_worker.submit(print, on_done=done.append, buttons=[button])
+    root.run_until_idle()
+    assert done == ["report.html"] and button.cget("state") == "normal"
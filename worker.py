@@ -0,0 +1,72 @@
+# /worker.py
+
+import concurrent.futures
+
+import com
+from logger import log_error
+
+# Milliseconds between checks of the running actions on the Tk thread
+WORKER_POLL_MS = 50
+# Threads running blocking GUI actions (powercfg, WMI, shell shortcuts, ...)
+WORKER_THREADS = 2
+
+class ActionWorker:
+    """ Runs blocking actions on a thread pool & hands their results back to the Tk thread through after() """
+
+    def __init__(self, root, max_workers=WORKER_THREADS, poll_ms=WORKER_POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="ActionWorker", initializer=com.initialize)
+        self._pending = [] # (future, on_done, on_error, buttons, button labels)
+        self._after_id = None
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    def submit(self, action, *args, on_done=None, on_error=None, buttons=(), busy_text=None):
+        """ Runs action(*args) on the pool with the buttons disabled (the first one relabelled with busy_text) until it finishes,
+            on_done(result) or on_error(exception) are then called on the Tk thread """
+        labels = [button.cget("text") for button in buttons]
+        for button in buttons:
+            button.config(state="disabled")
+        if buttons and busy_text:
+            buttons[0].config(text=busy_text)
+        future = self._executor.submit(action, *args)
+        self._pending.append((future, on_done, on_error, buttons, labels))
+        if self._after_id is None:
+            self._after_id = self.root.after(self.poll_ms, self._poll)
+        return future
+
+    def _poll(self):
+        self._after_id = None
+        # One done() per action, one finishing between two checks would be neither finished nor pending
+        finished, pending = [], []
+        for entry in self._pending:
+            (finished if entry[0].done() else pending).append(entry)
+        self._pending = pending
+        if self._pending:
+            self._after_id = self.root.after(self.poll_ms, self._poll)
+        for future, on_done, on_error, buttons, labels in finished:
+            for button, label in zip(buttons, labels):
+                button.config(state="normal", text=label)
+            if future.cancelled():
+                continue
+            error = future.exception()
+            try:
+                if error is None:
+                    if on_done is not None:
+                        on_done(future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    log_error(f"Background action failed: {error}", "worker.py")
+            except Exception as e:
+                log_error(f"Failed to handle the result of a background action: {e}", "worker.py")
+
+    def shutdown(self, wait=False):
+        """ Stops polling & drops the actions that haven't started yet """
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._executor.shutdown(wait=wait, cancel_futures=True)